@@ -1,40 +1,118 @@
+import json
+import threading
+import time
+from concurrent.futures import as_completed
+from datetime import datetime
+
 import streamlit as st
 
 # ========= 防止缓存/确认版本 =========
 st.write("BUILD: 2026-01-31-2052")
 
 # ========= 模块导入（避免 iPad 断行/不可见字符导致 SyntaxError） =========
+# 这些模块都很轻；openai SDK 在 openai_client 里第一次调用 LLM 时才导入
 import services.wrongbook as wrongbook
+import services.wrongbook_io as wrongbook_io
 import services.tutor_logic as tutor_logic
 import services.openai_client as openai_client
 import services.auth as auth
+import services.question_pool as question_pool
+import services.question_sets as question_sets
+import services.review as review
+import services.analytics as analytics
+import services.db as db
+import services.java_sandbox as java_sandbox
+import services.chat_context as chat_context
+import services.session_store as session_store
+import services.telemetry as telemetry
+from services.config import setting
+from services.tokens import count_message_tokens
 
 # ========= 页面初始化 =========
 st.set_page_config(page_title="AP CSA Tutor + 错题本", layout="wide")
-wrongbook.init_db()
+
+
+@st.cache_resource
+def init_storage():
+    """建表/迁移每个进程只跑一次，不用每次 rerun 都连库 CREATE TABLE"""
+    wrongbook.init_db()
+    question_pool.init_pool()
+    session_store.init_store()
+    question_sets.init_sets()
+    java_sandbox.init_cache()
+    # 沙箱打开时先把 JVM 工作进程起好，第一道输出题不用等启动
+    threading.Thread(target=java_sandbox.warm_up, name="java-warm-up", daemon=True).start()
+
+
+init_storage()
+question_pool.ensure_worker()  # 只是检查线程还活着，开销可忽略
 
 # ---------------- Auth Gate (Sidebar) ----------------
 if "is_user_authed" not in st.session_state:
     st.session_state.is_user_authed = False
 if "is_admin" not in st.session_state:
     st.session_state.is_admin = False
+if "user_id" not in st.session_state:
+    st.session_state.user_id = ""
+
+def client_id() -> str:
+    """
+    登录限流按客户端算。默认（TRUSTED_PROXY_HOPS=0）只用连接地址：前面没有代理时 X-Forwarded-For 整个是客户端自己填的。
+    部署在反向代理后面才设成代理的层数 N，只信 X-Forwarded-For 右数第 N 个（代理追加的，左边的客户端能随便填）。
+    """
+    try:
+        hops = setting("TRUSTED_PROXY_HOPS", 0)
+        forwarded = [a.strip() for a in st.context.headers.get("X-Forwarded-For", "").split(",") if a.strip()]
+        client = forwarded[-hops] if 0 < hops <= len(forwarded) else ""
+        return client or st.context.ip_address or "local"
+    except RuntimeError:
+        return "local"  # 没有 Streamlit 运行时（压测里多个 AppTest 同时跑）
+
+
+def show_issued_key():
+    """第一次登录发的个人口令，这次登录期间一直显示在侧栏"""
+    if st.session_state.get("issued_key"):
+        st.warning(f"你的个人口令：**{st.session_state.issued_key}**。以后登录要填，请记下来（退出后就不再显示）。")
+
 
 with st.sidebar:
     st.header("🔐 登录")
 
     # User login (weekly password)
     if not st.session_state.is_user_authed:
+        user_name = st.text_input("你的名字/学号（错题本按这个保存）")
         user_pw = st.text_input("本周访问密码", type="password")
+        user_key = st.text_input("个人口令（第一次登录不用填，登录后会发给你）", type="password")
         if st.button("登录（用户）"):
-            if auth.check_user_password(user_pw):
-                st.session_state.is_user_authed = True
-                st.success("登录成功")
-            else:
+            name = user_name.strip()
+            wait = max(auth.lockout_remaining("user:" + client_id()), auth.lockout_remaining("key:" + name))
+            if wait > 0:
+                st.error(f"尝试次数太多，请 {wait:.0f} 秒后再试")
+            elif not name:
+                st.error("先填名字/学号")
+            elif not auth.check_user_password(user_pw, client_id()):
                 st.error("密码不对（每周一 00:00 会更新）")
+            else:
+                # 周密码全班共用：名字第一次登录时发个人口令，之后要口令对上才能看到这个名字存的聊天和错题
+                issued = session_store.issue_student_key(name)
+                if issued or auth.check_student_key(lambda: session_store.check_student_key(name, user_key), name):
+                    st.session_state.is_user_authed = True
+                    st.session_state.user_id = name
+                    st.session_state.issued_key = issued
+                    st.success("登录成功")
+                    show_issued_key()
+                else:
+                    st.error("个人口令不对（第一次登录时发的；忘了找老师重置）")
     else:
-        st.success("用户已登录")
+        st.success(f"用户已登录：{st.session_state.user_id}")
+        show_issued_key()
         if st.button("退出用户登录"):
             st.session_state.is_user_authed = False
+            st.session_state.user_id = ""
+            # 聊天/做题状态都在库里，下次登录再恢复；这里清掉，免得同一浏览器换人登录看到
+            for k in list(st.session_state):
+                if k not in ("is_user_authed", "is_admin", "user_id"):
+                    del st.session_state[k]
 
     st.divider()
 
@@ -43,7 +121,10 @@ with st.sidebar:
     if not st.session_state.is_admin:
         admin_pw = st.text_input("管理员密码", type="password")
         if st.button("登录（管理员）"):
-            if auth.check_admin_password(admin_pw):
+            wait = auth.lockout_remaining("admin:" + client_id())
+            if wait > 0:
+                st.error(f"尝试次数太多，请 {wait:.0f} 秒后再试")
+            elif auth.check_admin_password(admin_pw, client_id()):
                 st.session_state.is_admin = True
                 st.success("管理员登录成功")
             else:
@@ -57,42 +138,150 @@ with st.sidebar:
     if st.session_state.is_admin:
         st.divider()
         st.subheader("本周密码（管理员可见）")
-        st.code(auth.weekly_password(), language="text")
+        st.code(auth.current_password(), language="text")
         try:
             st.caption(
                 "下次自动切换时间："
-                + auth.next_rotation_time().strftime("%Y-%m-%d %H:%M %Z")
+                + auth.current_rotation_time().strftime("%Y-%m-%d %H:%M %Z")
             )
         except Exception:
             # 如果时区对象在不同环境下格式化出错，不影响主要功能
             pass
 
+        with st.expander("重置学生个人口令（忘了口令时用）"):
+            reset_name = st.text_input("学生名字/学号", key="reset_key_name")
+            if st.button("重置口令") and reset_name.strip():
+                if session_store.reset_student_key(reset_name.strip()):
+                    st.success("已重置，这个名字下次登录会重新发口令")
+                else:
+                    st.info("这个名字还没有口令")
+
+        with st.expander("LLM 连接统计（含首 token 延迟）"):
+            st.json(openai_client.client_stats())
+
+        with st.expander("LLM 排队 / 限流（队列深度、等待时间、429）"):
+            st.json(openai_client.scheduler_stats())
+
+        with st.expander("LLM 缓存命中统计"):
+            st.json(openai_client.cache_stats())
+
+        with st.expander("SQLite 批量写入（排队 / 等锁 / 提交耗时）"):
+            st.json(db.writer_stats())
+
+        with st.expander("题库库存 / 补货速度"):
+            st.json(question_pool.pool_stats())
+            st.dataframe(
+                [
+                    {"unit": u, "topic": t or "（任意）", "difficulty": d, "depth": n}
+                    for u, t, d, n in question_pool.pool_depth()
+                ],
+                hide_index=True,
+            )
+
 # Block entire app if user not authed
 if not st.session_state.is_user_authed:
     st.info("请在左侧输入“本周访问密码”后使用。")
     st.stop()
 
+# ---------------- 会话持久化 ----------------
+NO_QUESTION = "点击“生成新题”开始。"
+GREETING = {"role": "assistant", "content": "把题目或你卡住的点发我（可贴代码）。"}
+# 做题页要跨刷新/重连保留的状态（都能 JSON 序列化）
+PRACTICE_KEYS = ("current_q", "current_key", "pending_explain", "last_result")
+
+
+def refresh_chat_has_more():
+    """库里存的条数比页面上已有的多才显示“加载更早”；聊天记录每次增减之后都重算"""
+    shown = sum("id" in m for m in st.session_state.chat_older + st.session_state.chat)
+    st.session_state.chat_has_more = session_store.count_chat(st.session_state.user_id) > shown
+
+
+def save_practice():
+    session_store.save_state(
+        st.session_state.user_id, **{k: st.session_state.get(k) for k in PRACTICE_KEYS}
+    )
+
+
+def set_question(item):
+    """换题：题面、服务端答案、选项解析都在这里算一次，之后 rerun 直接读 session_state"""
+    st.session_state.current_q = item["question"]
+    st.session_state.current_key = item.get("answer_key")
+    st.session_state.current_parsed = tutor_logic.parse_question(item["question"])
+    st.session_state.pop("pending_explain", None)
+    st.session_state.pop("last_result", None)
+    save_practice()
+
+
+telemetry.set_user(st.session_state.user_id)  # LLM 账本按学生记
+
+if st.session_state.get("restored_for") != st.session_state.user_id:
+    # 新会话（刷新、断线重连后重新登录）：从库里恢复聊天和做题进度
+    saved = session_store.load_state(st.session_state.user_id)
+    chat = session_store.load_chat(st.session_state.user_id)
+    st.session_state.chat = chat or [GREETING]
+    st.session_state.chat_older = []
+    refresh_chat_has_more()
+    st.session_state.chat_ctx = chat_context.restore_state(chat, saved.get("chat_ctx", {}))
+    for k in PRACTICE_KEYS:
+        if saved.get(k) is not None:
+            st.session_state[k] = saved[k]
+    if "current_q" in st.session_state:
+        st.session_state.current_parsed = tutor_logic.parse_question(st.session_state.current_q)
+    st.session_state.restored_for = st.session_state.user_id
+
+# ---------------- 页面数据缓存 ----------------
+# 每点一下控件整页都会 rerun。错题本相关的读按 wrongbook.version(学生) 缓存：
+# 只有写入提交后版本号才变，什么都没变的 rerun 一条 SQL 都不打。
+wb_version = wrongbook.version(st.session_state.user_id)
+
+
+@st.cache_data(max_entries=1024, show_spinner=False)
+def cached_review(user_id, day, version):
+    """(今天到期几题, 最早到期的一题)；过了零点 day 变了也重新取"""
+    return review.due_count(user_id), review.due_entries(user_id, limit=1)
+
+
+@st.cache_data(max_entries=1024, show_spinner=False)
+def cached_entry(entry_id, user_id, version):
+    return wrongbook.get_entry(entry_id, user_id=user_id)
+
+
+@st.cache_data(max_entries=256, show_spinner=False)
+def cached_search(user_id, text, version):
+    return wrongbook.search(user_id, text, limit=WB_PAGE_SIZE)
+
+
 # ---------------- Main UI ----------------
 st.title("AP CSA(Java) 练习 + 讲解 + 自动错题本")
 
-tab1, tab2, tab3 = st.tabs(["💬 讲解聊天", "📝 做题模式", "📚 错题本"])
+due_today, due = cached_review(st.session_state.user_id, datetime.utcnow().date().isoformat(), wb_version)
+tab_names = ["💬 讲解聊天", "📝 做题模式", "📚 错题本", f"🔁 今日复习（{due_today}）"]
+if st.session_state.is_admin:
+    tab_names += ["📈 LLM 账本", "🧾 批量出题", "📊 全班错因"]
+tab1, tab2, tab3, tab4, *admin_tabs = st.tabs(tab_names)
 
 # --------- Tab 1: Chat ----------
 with tab1:
     st.caption("你问概念/代码题，我用AP CSA风格解释。")
 
-    if "chat" not in st.session_state:
-        st.session_state.chat = [
-            {"role": "assistant", "content": "把题目或你卡住的点发我（可贴代码）。"}
-        ]
+    # 默认只显示最近一页，更早的按需从库里取
+    if st.session_state.chat_has_more and st.button("⬆️ 加载更早的消息"):
+        shown = st.session_state.chat_older + st.session_state.chat
+        oldest = next(m["id"] for m in shown if "id" in m)
+        older = session_store.load_chat(st.session_state.user_id, before_id=oldest)
+        st.session_state.chat_older = older + st.session_state.chat_older
+        refresh_chat_has_more()
 
-    for m in st.session_state.chat:
+    for m in st.session_state.chat_older + st.session_state.chat:
         with st.chat_message("assistant" if m["role"] == "assistant" else "user"):
             st.write(m["content"])
 
     prompt = st.chat_input("输入你的疑问/题目（可贴代码）")
     if prompt:
-        st.session_state.chat.append({"role": "user", "content": prompt})
+        uid = st.session_state.user_id
+        st.session_state.chat.append(
+            {"id": session_store.append_chat(uid, "user", prompt), "role": "user", "content": prompt}
+        )
         with st.chat_message("user"):
             st.write(prompt)
 
@@ -100,16 +289,91 @@ with tab1:
             "你是AP CSA(Java)家教。回答要：短句、分点、先结论后原因、给1个小例子。"
             "如果是代码题，指出常见坑。"
         )
-        reply = openai_client.generate_text(
-            [{"role": "system", "content": system}] + st.session_state.chat[-6:],
-            temperature=0.4,
-        )
-
-        st.session_state.chat.append({"role": "assistant", "content": reply})
+        # 按 token 预算带上最近几轮原文，更早的折叠成摘要
+        messages, ctx = chat_context.build_messages(system, st.session_state.chat, st.session_state.chat_ctx)
+        start = time.perf_counter()
         with st.chat_message("assistant"):
-            st.write(reply)
+            reply = st.write_stream(openai_client.stream_text(messages, temperature=0.4, caller="chat"))
+        st.session_state.chat.append(
+            {"id": session_store.append_chat(uid, "assistant", reply), "role": "assistant", "content": reply}
+        )
+        refresh_chat_has_more()
+        if ctx["resummarized"]:
+            session_store.save_state(
+                uid, chat_ctx=chat_context.dump_state(st.session_state.chat, st.session_state.chat_ctx)
+            )
+        last6 = count_message_tokens([messages[0]] + st.session_state.chat[-7:-1])
+        st.caption(
+            f"本轮 prompt ≈ {ctx['prompt_tokens']} tokens（旧的“最近6条”≈ {last6}），"
+            f"带原文 {ctx['turns_sent']} 条，摘要覆盖 {ctx['turns_summarized']} 条"
+            f"{'（本轮更新了摘要）' if ctx['resummarized'] else ''}，耗时 {time.perf_counter() - start:.1f}s"
+        )
 
 # --------- Tab 2: Practice ----------
+def stream_grading(q, user_answer, unit, answer_key=None, verdict=None):
+    """流式判题并逐字段显示；verdict 是本地已判好的结果，显示时以它为准"""
+    # 先占位，流式判题每解析出一个字段就填一个，正确答案不用等练习题生成完
+    slots = {
+        "is_correct": st.empty(),
+        "correct_answer": st.empty(),
+        "explanation": st.empty(),
+        "mistake_type": st.empty(),
+    }
+    slots["is_correct"].caption("判题中…")
+    result = {}
+    for field, value in tutor_logic.grade_stream(q, user_answer, unit_hint=unit, answer_key=answer_key):
+        if field == "result":
+            result = value
+        elif verdict and field in ("is_correct", "correct_answer"):
+            continue
+        elif field == "is_correct":
+            slots["is_correct"].write(f"是否正确：{value}")
+        elif field == "correct_answer":
+            slots["correct_answer"].markdown(f"**正确答案**\n\n{value}")
+        elif field == "explanation":
+            slots["explanation"].markdown(f"**解析/你错在哪**\n\n{value}")
+        elif field == "mistake_type":
+            slots["mistake_type"].markdown(f"**错因类型**\n\n{value}")
+    if verdict:
+        result["is_correct"] = verdict["is_correct"]
+        result["correct_answer"] = verdict["correct_answer"]
+
+    # 模型没按 JSON 输出时，字段可能没流出来，用最终结果补齐
+    slots["is_correct"].write(f"是否正确：{result.get('is_correct')}")
+    slots["correct_answer"].markdown(f"**正确答案**\n\n{result.get('correct_answer', '')}")
+    slots["explanation"].markdown(f"**解析/你错在哪**\n\n{result.get('explanation', '')}")
+    slots["mistake_type"].markdown(f"**错因类型**\n\n{result.get('mistake_type', '')}")
+    return result
+
+
+def show_drills(q, result, entry_id):
+    user_id = st.session_state.user_id  # 回调在后台线程里跑，那里读不到 session_state
+    st.markdown(f"### 同错因针对练习（{tutor_logic.DRILL_COUNT}题）")
+    futures = tutor_logic.start_drills(
+        q,
+        result,
+        on_complete=lambda drills: wrongbook.set_next_drill(
+            entry_id, json.dumps(drills, ensure_ascii=False), user_id=user_id
+        ),
+    )
+    drill_slots = [st.empty() for _ in futures]
+    for slot in drill_slots:
+        slot.caption("生成中…")
+    # 哪道先生成完就先显示哪道
+    index = {f: i for i, f in enumerate(futures)}
+    drills = [None] * len(futures)
+    for f in as_completed(futures):
+        i = index[f]
+        if f.exception() is not None:
+            drill_slots[i].caption(f"第 {i + 1} 题生成失败")
+            continue
+        d = drills[i] = f.result()
+        with drill_slots[i].container():
+            st.markdown(f"**{i + 1}. {d.get('q','')}**")
+            st.write("答案：", d.get("a", ""))
+    return [d for d in drills if d]
+
+
 with tab2:
     colA, colB = st.columns([1, 1])
 
@@ -117,75 +381,193 @@ with tab2:
         unit = st.selectbox("选择单元(Unit)", tutor_logic.UNITS, index=0)
         topic = st.text_input("topic（可选，比如：for循环/构造器/ArrayList）", "")
         if st.button("生成新题"):
-            st.session_state.current_q = tutor_logic.generate_new_question(
-                unit, topic, difficulty="easy"
-            )
+            # 先从预生成题库取（毫秒级），桶空了才现场出题；做过的题不会再发给同一个学生
+            set_question(question_pool.next_question(
+                unit, topic, difficulty="easy", viewer=st.session_state.user_id
+            ))
 
     with colB:
         st.subheader("题目")
-        q = st.session_state.get("current_q", "点击“生成新题”开始。")
+        q = st.session_state.get("current_q", NO_QUESTION)
 
         # 防止模型误输出答案（兜底）
         leak_words = ["标准答案", "答案：", "答案:", "解析", "正确答案"]
         if isinstance(q, str) and any(w in q for w in leak_words):
             st.warning("检测到题目里包含答案/解析，已隐藏。请点击“生成新题”重新出题。")
-            st.session_state.current_q = "点击“生成新题”开始。"
+            set_question({"question": NO_QUESTION})
             q = st.session_state.current_q
 
         st.write(q)
 
     st.divider()
     st.subheader("提交你的答案（写思路或写最终答案都行）")
-    user_answer = st.text_area("你的答案", height=120)
-
-    if st.button("判题 + 生成同错因练习 + 加入错题本"):
-        if not q or (isinstance(q, str) and q.startswith("点击")):
-            st.warning("先生成题目。")
-        else:
-            result = tutor_logic.grade_and_extract_mistake(q, user_answer, unit_hint=unit)
-
+    opts = st.session_state.get("current_parsed", {}).get("options", {})
+    answer_key = st.session_state.get("current_key")
+    if len(opts) >= 2:
+        # 选择题用 radio，答案统一成一个大写字母
+        labels = [f"{k}. {opts[k]}" for k in ["A", "B", "C", "D"] if k in opts]
+        user_answer = st.radio("选择你的选项", labels).split(".", 1)[0].strip().upper()
+    else:
+        user_answer = st.text_area("你的答案", height=120)
+
+    graded = st.button("判题 + 生成同错因练习 + 加入错题本")
+    result_box = st.container()  # 判题结果都显示在这里（“解释”按钮在它下面）
+    if graded and (not q or (isinstance(q, str) and q.startswith("点击"))):
+        st.warning("先生成题目。")
+        graded = False
+    elif graded:
+        with result_box:
             st.markdown("### 判题结果")
-            st.write("是否正确：", result.get("is_correct"))
-
-            st.markdown("**正确答案**")
-            st.write(result.get("correct_answer", ""))
-
-            st.markdown("**解析/你错在哪**")
-            st.write(result.get("explanation", ""))
-
-            st.markdown("**错因类型**")
-            st.write(result.get("mistake_type", ""))
-
-            drills = result.get("drills", [])
-            if drills:
-                st.markdown("### 同错因针对练习（3题）")
-                for i, d in enumerate(drills, 1):
-                    st.markdown(f"**{i}. {d.get('q','')}**")
-                    st.write("答案：", d.get("a", ""))
+            st.session_state.pop("pending_explain", None)
+            # 有标准答案的选择题本地比对，立刻出结果；解析等学生点了再调 LLM
+            local = tutor_logic.grade_mcq_locally(opts, answer_key, user_answer)
+            if local is not None:
+                result = local
+                st.write(f"是否正确：{result['is_correct']}")
+                st.markdown(f"**正确答案**\n\n{result['correct_answer']}")
+            else:
+                result = stream_grading(q, user_answer, unit)
 
-            wrongbook.add_entry(
-                unit=result.get("unit", unit),
-                topic=result.get("topic", topic),
+            # 判题结果一出来就先入错题本；练习题生成完再由后台线程补写 next_drill
+            entry_id = wrongbook.add_entry(
+                unit=result.get("unit") or unit,
+                topic=result.get("topic") or topic,
                 question=q,
                 user_answer=user_answer,
                 correct_answer=result.get("correct_answer", ""),
                 explanation=result.get("explanation", ""),
                 mistake_type=result.get("mistake_type", ""),
-                next_drill=str(drills[:1]),
+                next_drill="",
+                user_id=st.session_state.user_id,
             )
             st.success("已加入错题本。去「错题本」查看。")
 
+            # 结果先存一份，生成练习题途中断线也不用重新判题
+            st.session_state.last_result = {"user_answer": user_answer, "result": result, "drills": []}
+            if local is not None and not local["is_correct"]:
+                st.session_state.pending_explain = {
+                    "entry_id": entry_id, "question": q, "user_answer": user_answer,
+                    "answer_key": answer_key, "unit": unit, "verdict": local,
+                }
+            save_practice()
+            if local is None:
+                st.session_state.last_result["drills"] = show_drills(q, result, entry_id)
+                save_practice()
+
+    pending = st.session_state.get("pending_explain")
+    explain = pending is not None and st.button("🤖 解释我错在哪 + 生成同错因练习")
+    if explain:
+        st.session_state.pop("pending_explain", None)
+        with result_box:
+            st.markdown("### 判题结果")
+            result = stream_grading(
+                pending["question"], pending["user_answer"], pending["unit"],
+                answer_key=pending["answer_key"], verdict=pending["verdict"],
+            )
+            wrongbook.set_explanation(
+                pending["entry_id"], result.get("explanation", ""), result.get("mistake_type", ""),
+                unit=result.get("unit", ""), topic=result.get("topic", ""), user_id=st.session_state.user_id,
+            )
+            st.session_state.last_result = {"user_answer": pending["user_answer"], "result": result, "drills": []}
+            save_practice()
+            st.session_state.last_result["drills"] = show_drills(pending["question"], result, pending["entry_id"])
+            save_practice()
+    elif not graded and st.session_state.get("last_result"):
+        # 平时 rerun、刷新/重连后：直接显示存下来的判题结果和练习题，不再调 LLM
+        last = st.session_state.last_result
+        result = last["result"]
+        with result_box:
+            st.markdown(f"### 判题结果（你的答案：{last['user_answer']}）")
+            st.write(f"是否正确：{result.get('is_correct')}")
+            st.markdown(f"**正确答案**\n\n{result.get('correct_answer', '')}")
+            if result.get("explanation"):
+                st.markdown(f"**解析/你错在哪**\n\n{result['explanation']}")
+            if result.get("mistake_type"):
+                st.markdown(f"**错因类型**\n\n{result['mistake_type']}")
+            if last["drills"]:
+                st.markdown(f"### 同错因针对练习（{len(last['drills'])}题）")
+                for i, d in enumerate(last["drills"]):
+                    st.markdown(f"**{i + 1}. {d.get('q','')}**")
+                    st.write("答案：", d.get("a", ""))
+
 # --------- Tab 3: Wrongbook ----------
+WB_PAGE_SIZE = 20
+
+
+@st.cache_data(max_entries=256, show_spinner=False)
+def mistake_dashboard(user_id, version):
+    return analytics.dashboard(user_id)
+
+
+def show_mistake_dashboard(user_id):
+    data = mistake_dashboard(user_id, wrongbook.version(user_id))
+    if not data["total"]:
+        st.info("还没有错题数据。")
+        return
+    st.caption(f"共 {data['total']} 条")
+    cols = st.columns(len(analytics.DIMS))
+    for col, (dim, title) in zip(cols, (("unit", "按 Unit"), ("topic", "按 Topic"), ("mistake_type", "按错因"))):
+        with col:
+            st.markdown(f"**{title}**（前 10）")
+            rows = data[dim]
+            st.bar_chart({dim: [k for k, _ in rows], "次数": [n for _, n in rows]}, x=dim, y="次数", horizontal=True)
+    if data["trend"]:
+        st.markdown("**最近 30 天每天新增**")
+        t = data["trend"]
+        st.bar_chart({"day": [r[0] for r in t], "unit": [r[1] for r in t], "次数": [r[2] for r in t]},
+                     x="day", y="次数", color="unit")
+
+
+# 做题页这次 rerun 可能刚写过错题本（判题入库、补解析、补练习题），版本号已经变了：
+# 错题本和复习页按写入后的版本读，不然这一轮显示的还是写入前缓存的数据
+wb_version = wrongbook.version(st.session_state.user_id)
+due_today, due = cached_review(st.session_state.user_id, datetime.utcnow().date().isoformat(), wb_version)
+
 with tab3:
+    with st.expander("📊 我的错因分布"):
+        show_mistake_dashboard(st.session_state.user_id)
+
     st.subheader("最近错题")
-    rows = wrongbook.list_entries(limit=200)
-    if not rows:
+    search_text = st.text_input("🔍 搜索错题（题目/解析/错因/topic，比如：ArrayList remove）", "")
+    f1, f2, f3 = st.columns(3)
+    f_unit = f1.selectbox("按 Unit 筛选", ["全部"] + tutor_logic.UNITS)
+    f_topic = f2.text_input("按 Topic 筛选（精确）", "")
+    f_mistake = f3.text_input("按错因类型筛选（同义说法也算）", "")
+    filters = {
+        "unit": None if f_unit == "全部" else f_unit,
+        "topic": f_topic.strip() or None,
+        "mistake_type": f_mistake.strip() or None,
+    }
+
+    if search_text.strip():
+        # 全文搜索：按相关度排序，命中词高亮
+        hits = cached_search(st.session_state.user_id, search_text, wb_version)
+        for h in hits:
+            st.markdown(f"- **#{h[0]}** {h[2]} | {h[4]}：{h[5]}")
+        view = {"filters": None, "rows": [h[:5] for h in hits], "cursor": None}
+    else:
+        # 只拉摘要列、一页一页地加载；筛选条件变了或错题本有改动（版本号变了）就从第一页重来
+        view = st.session_state.get("wb_view")
+        if view is None or view["filters"] != filters or view.get("version") != wb_version:
+            rows, cursor = wrongbook.list_page(st.session_state.user_id, limit=WB_PAGE_SIZE, **filters)
+            view = st.session_state.wb_view = {
+                "filters": filters, "rows": rows, "cursor": cursor, "version": wb_version,
+            }
+
+    if not view["rows"]:
         st.info("还没有记录。去「做题模式」做一道题试试。")
     else:
-        options = [f"#{r[0]} | {r[2]} | {r[3]} | {r[7]}" for r in rows]
-        pick = st.selectbox("选择一条错题记录", options, index=0)
-        entry_id = int(pick.split("|")[0].strip().replace("#", ""))
-        full = wrongbook.get_entry(entry_id)
+        labels = {r[0]: f"#{r[0]} | {r[2]} | {r[3]} | {r[4]}" for r in view["rows"]}
+        entry_id = st.selectbox("选择一条错题记录", list(labels), format_func=labels.get)
+        if view["cursor"] is not None and st.button(f"加载更多（已显示 {len(view['rows'])} 条）"):
+            rows, cursor = wrongbook.list_page(
+                st.session_state.user_id, cursor=view["cursor"], limit=WB_PAGE_SIZE, **filters
+            )
+            view["rows"] += rows
+            view["cursor"] = cursor
+            st.rerun()
+
+        full = cached_entry(entry_id, st.session_state.user_id, wb_version)
         if full:
             st.markdown("### 详情")
             st.write("创建时间：", full[1])
@@ -200,3 +582,126 @@ with tab3:
             st.markdown("**解析**")
             st.write(full[7])
             st.write("错因类型：", full[8])
+
+        with st.expander("⬇️ 导出我的错题本"):
+            # 展开器收起时正文也会跑，所以点了按钮才生成；生成好的只留最近一份，错题本有变化就作废
+            e1, e2 = st.columns([1, 2])
+            fmt = e1.selectbox("格式", wrongbook_io.formats(), label_visibility="collapsed")
+            export_key = (st.session_state.user_id, fmt, wb_version)
+            if e2.button("生成导出"):
+                st.session_state.wb_export = {
+                    "key": export_key, "data": wrongbook_io.export_bytes(fmt, user_id=st.session_state.user_id),
+                }
+            export = st.session_state.get("wb_export")
+            if export and export["key"] == export_key:
+                e2.download_button(
+                    f"下载 {fmt.upper()}", export["data"],
+                    f"wrongbook_{st.session_state.user_id}.{fmt}", wrongbook_io.MIME[fmt],
+                )
+
+# --------- Tab 4: Spaced review ----------
+with tab4:
+    st.caption("按遗忘曲线安排复习：记得越牢，下次隔得越久；忘了就明天再来。")
+    if not due:
+        st.info("今天没有要复习的错题 🎉")
+    else:
+        item = due[0]
+        st.markdown(f"**还剩 {due_today} 题** ｜ {item['unit']} ｜ {item['topic']} ｜ 错因：{item['mistake_type']}")
+        st.write(item["question"])
+        # 判题时存下的同错因练习，直接拿来复习，不再调 LLM
+        for i, d in enumerate(item["drills"]):
+            st.markdown(f"**练习 {i + 1}. {d.get('q', '')}**")
+        with st.expander("想好了再看答案"):
+            st.markdown(f"**正确答案**\n\n{item['correct_answer']}")
+            if item["explanation"]:
+                st.markdown(f"**解析**\n\n{item['explanation']}")
+            for i, d in enumerate(item["drills"]):
+                st.write(f"练习 {i + 1} 答案：", d.get("a", ""))
+        st.caption(f"上次间隔 {item['interval_days']} 天，已连续记住 {item['reps']} 次")
+        for col, (label, quality) in zip(st.columns(len(review.GRADES)), review.GRADES):
+            if col.button(label, key=f"review_{quality}"):
+                review.record_review(item["id"], st.session_state.user_id, quality)
+                st.rerun()
+
+# --------- Admin tabs ----------
+if admin_tabs:
+    with admin_tabs[0]:
+        days = st.selectbox("统计范围", [1, 7, 30], index=1, format_func=lambda d: f"最近 {d} 天")
+        st.caption(f"账本写入：{telemetry.ledger_stats()}")
+        if java_sandbox.enabled():
+            st.caption(f"Java 沙箱（输出题本地核对答案）：{java_sandbox.stats()}")
+
+        st.markdown("**各调用方耗时**（p50/p95 只算真正发出去的请求，不含缓存命中/合并）")
+        st.dataframe(telemetry.latency_by_caller(days), hide_index=True)
+
+        spend = telemetry.daily_spend(max(days, 14))
+        st.markdown("**每日花费（美元，按 LLM_PRICE_* 单价估算）**")
+        if spend:
+            st.bar_chart({"day": [r[0] for r in spend], "cost_usd": [r[4] for r in spend]}, x="day", y="cost_usd")
+        st.dataframe(
+            [{"day": d, "calls": n, "prompt_tokens": p, "completion_tokens": c, "cost_usd": round(x, 4)}
+             for d, n, p, c, x in spend],
+            hide_index=True,
+        )
+
+        st.markdown("**按调用方**")
+        st.dataframe(
+            [{"caller": k, "calls": n, "prompt_tokens": p, "completion_tokens": c, "cost_usd": round(x, 4)}
+             for k, n, p, c, x in telemetry.spend_by_caller(days)],
+            hide_index=True,
+        )
+
+        st.markdown("**按学生**（花费最多的在前）")
+        st.dataframe(
+            [{"student": u or "（后台）", "calls": n, "prompt_tokens": p, "completion_tokens": c,
+              "cost_usd": round(x, 4)}
+             for u, n, p, c, x in telemetry.tokens_by_user(days)],
+            hide_index=True,
+        )
+
+    with admin_tabs[1]:
+        st.caption("给整个班出一套题：每次调用出好几道，分块并发，校验 + 去重后存成题组，可导出。")
+        with st.form("batch_questions"):
+            b1, b2, b3 = st.columns([2, 2, 1])
+            b_unit = b1.selectbox("单元(Unit)", tutor_logic.UNITS)
+            b_topic = b2.text_input("知识点（可空）")
+            b_diff = b3.selectbox("难度", ["easy", "medium", "hard"])
+            b4, b5 = st.columns([1, 3])
+            b_total = b4.number_input("题数", min_value=1, max_value=200, value=30)
+            b_title = b5.text_input("题组名称（可空）")
+            b_pool = st.checkbox("同时放进练习题库")
+            go = st.form_submit_button("🧾 生成题组")
+        if go:
+            bar = st.progress(0.0, text="出题中…")
+            set_id, stats = question_sets.generate_set(
+                b_unit, b_topic, b_diff, int(b_total), title=b_title, to_pool=b_pool,
+                on_progress=lambda done, total: bar.progress(done / total, text=f"已收集 {done}/{total}"),
+            )
+            bar.empty()
+            st.session_state.batch_set_id = set_id
+            (st.success if stats["questions"] >= b_total else st.warning)(
+                f"题组 #{set_id}：{stats['questions']}/{int(b_total)} 道，用时 {stats['seconds']}s，"
+                f"{stats['questions_per_min']} 道/分钟，约 {stats['est_tokens_per_question']} token/道"
+            )
+            st.caption(f"统计：{stats}")
+
+        sets = question_sets.list_sets()
+        if sets:
+            labels = {r[0]: f"#{r[0]} {r[2]}（{r[5]}，{r[6]} 道，{r[1][:16]}）" for r in sets}
+            ids = list(labels)
+            picked = st.selectbox(
+                "题组", ids, format_func=labels.get,
+                index=ids.index(st.session_state.batch_set_id) if st.session_state.get("batch_set_id") in ids else 0,
+            )
+            d1, d2 = st.columns(2)
+            d1.download_button("⬇️ 导出 CSV", question_sets.export_csv(picked), f"question_set_{picked}.csv", "text/csv")
+            d2.download_button(
+                "⬇️ 导出 JSON", question_sets.export_json(picked), f"question_set_{picked}.json", "application/json"
+            )
+            with st.expander("预览"):
+                for item in question_sets.get_items(picked):
+                    st.markdown(f"**{item['position']}.**（答案 {item['answer_key']}）")
+                    st.markdown(item["question"])
+
+    with admin_tabs[2]:
+        show_mistake_dashboard(None)
@@ -0,0 +1,116 @@
+"""
+错因看板：每次 rerun 现场 GROUP BY 整张错题本 vs 读预聚合表（analytics.dashboard）。
+错题本逐步灌到 --rows 行（默认 100 万），每个规模各测一次；另外报告触发器让每次插入多花多少。
+
+    python benchmarks/analytics_bench.py --rows 1000000 --students 200
+
+全文索引的触发器在这里先删掉（它和看板无关，而且灌 100 万行太慢）。
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import services.wrongbook as wrongbook  # noqa: E402
+
+UNITS = [f"Unit {i}" for i in range(1, 11)]
+TOPICS = [f"topic{i}" for i in range(50)]
+MISTAKES = list(enumerate(wrongbook.SEED, 1))  # (mistake_type_id, 规范错因名)
+
+ADHOC = [
+    "SELECT unit, COUNT(*) FROM wrongbook WHERE user_id=? GROUP BY unit ORDER BY 2 DESC LIMIT 10",
+    "SELECT topic, COUNT(*) FROM wrongbook WHERE user_id=? GROUP BY topic ORDER BY 2 DESC LIMIT 10",
+    "SELECT mistake_type, COUNT(*) FROM wrongbook WHERE user_id=? GROUP BY mistake_type ORDER BY 2 DESC LIMIT 10",
+    "SELECT substr(created_at, 1, 10), unit, COUNT(*) FROM wrongbook WHERE user_id=? AND created_at >= ? GROUP BY 1, 2",
+]
+ADHOC_CLASS = [q.replace("user_id=? AND ", "").replace(" WHERE user_id=?", "") for q in ADHOC]
+
+
+def rows(n, students, start):
+    now = datetime.utcnow()
+    for i in range(n):
+        created = (now - timedelta(minutes=random.randrange(60 * 24 * 120))).isoformat()
+        type_id, mistake = random.choice(MISTAKES)
+        unit, topic, user = random.choice(UNITS), random.choice(TOPICS), f"s{random.randrange(students)}"
+        yield (
+            created, unit, topic, f"q{start + i}", "A", "B", "", mistake, "", user, created, type_id,
+            wrongbook.content_hash(user, created, unit, topic, f"q{start + i}", "A", "B"),
+        )
+
+
+def timed(fn, repeat=5):
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best * 1000
+
+
+def insert_cost(c, students, n=20000):
+    """同样插 n 行，有/没有统计触发器各花多少（在一个回滚掉的事务里测）"""
+    out = []
+    for keep in (True, False):
+        c.execute("BEGIN")
+        if not keep:
+            for t in ("mistake_stats_ai", "mistake_stats_ad", "mistake_stats_au"):
+                c.execute(f"DROP TRIGGER {t}")
+        t0 = time.perf_counter()
+        wrongbook.insert_entries(c, wrongbook.INSERT_COLUMNS, rows(n, students, 0))
+        out.append((time.perf_counter() - t0) / n * 1e6)
+        c.rollback()
+    return out
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rows", type=int, default=1_000_000)
+    ap.add_argument("--students", type=int, default=200)
+    args = ap.parse_args()
+    random.seed(1)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        wrongbook.DB_PATH = Path(tmp) / "wrongbook.db"
+        import services.analytics as analytics
+
+        analytics.DB_PATH = wrongbook.DB_PATH
+        wrongbook.init_db()
+        c = wrongbook._conn()
+        for t in ("wrongbook_fts_ai", "wrongbook_fts_ad", "wrongbook_fts_au"):
+            c.execute(f"DROP TRIGGER {t}")
+        c.commit()
+
+        with_stats, without = insert_cost(c, args.students)
+        print(f"insert: {with_stats:.1f} us/row with stats triggers, {without:.1f} us/row without")
+
+        since = (datetime.utcnow() - timedelta(days=29)).strftime("%Y-%m-%d")
+        loaded = 0
+        size = 10_000
+        print(f"{'rows':>10} | {'ad-hoc student':>14} {'ad-hoc class':>13} | {'agg student':>11} {'agg class':>10}  (ms)")
+        while loaded < args.rows:
+            size = min(size, args.rows)
+            with c:
+                wrongbook.insert_entries(c, wrongbook.INSERT_COLUMNS, rows(size - loaded, args.students, loaded))
+            loaded = size
+            student = "s7"
+            adhoc_s = timed(lambda: [c.execute(q, (student, since)[: q.count("?")]).fetchall() for q in ADHOC])
+            adhoc_c = timed(lambda: [c.execute(q, (since,)[: q.count("?")]).fetchall() for q in ADHOC_CLASS], 2)
+            agg_s = timed(lambda: analytics.dashboard(student))
+            agg_c = timed(lambda: analytics.dashboard(None))
+            print(f"{loaded:>10,} | {adhoc_s:>14.2f} {adhoc_c:>13.2f} | {agg_s:>11.2f} {agg_c:>10.2f}")
+            size *= 10
+
+        # 预聚合表和逐行重算的结果一致
+        full = ADHOC_CLASS[2].replace("ORDER BY 2 DESC LIMIT 10", "")
+        assert dict(analytics.breakdown(None, "mistake_type", len(MISTAKES))) == dict(c.execute(full).fetchall())
+        print("aggregates match GROUP BY: ok")
+
+
+if __name__ == "__main__":
+    main()
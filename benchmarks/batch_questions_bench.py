@@ -0,0 +1,78 @@
+"""
+批量出题 vs 一道一道点“生成新题”：同样出 N 道题，比较
+  - 道/分钟
+  - 每道题花的 token（prompt + completion，取自假服务返回的 usage）
+  - LLM 请求数
+
+    python benchmarks/batch_questions_bench.py --questions 30 --latency 0.8 --token-delay 0.01
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fake_responses_server import serve  # noqa: E402
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--questions", type=int, default=30)
+    ap.add_argument("--per-call", type=int, default=5)
+    ap.add_argument("--concurrency", type=int, default=4)
+    ap.add_argument("--latency", type=float, default=0.8, help="假服务首 token 前等待（秒）")
+    ap.add_argument("--token-delay", type=float, default=0.01)
+    args = ap.parse_args()
+
+    srv = serve(0, args.latency, args.token_delay)
+    os.environ["OPENAI_BASE_URL"] = f"http://127.0.0.1:{srv.server_address[1]}/v1"
+    os.environ.setdefault("OPENAI_API_KEY", "fake")
+    os.environ["QUESTION_BATCH_PER_CALL"] = str(args.per_call)
+    os.environ["QUESTION_BATCH_CONCURRENCY"] = str(args.concurrency)
+
+    import services.telemetry as telemetry
+    import services.tutor_logic as tutor_logic
+
+    usage = {"calls": 0, "tokens": 0}
+    record = telemetry.record
+
+    def counting_record(model, caller, latency_s, prompt_tokens=0, completion_tokens=0, **kw):
+        usage["calls"] += 1
+        usage["tokens"] += prompt_tokens + completion_tokens
+        record(model, caller, latency_s, prompt_tokens, completion_tokens, **kw)
+
+    telemetry.record = counting_record
+    unit = tutor_logic.UNITS[3]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)  # wrongbook.db / llm_cache.db 建在临时目录
+        import services.question_sets as question_sets
+
+        question_sets.init_sets()
+
+        usage.update(calls=0, tokens=0)
+        t0 = time.perf_counter()
+        for _ in range(args.questions):
+            tutor_logic.generate_question(unit, "for循环", fresh=True)
+        serial_s = time.perf_counter() - t0
+        serial = dict(usage)
+
+        usage.update(calls=0, tokens=0)
+        _, stats = question_sets.generate_set(unit, "for循环", total=args.questions)
+        batch = dict(usage)
+        os.chdir(os.path.dirname(tmp))
+
+    n = args.questions
+    print(f"{n} questions, fake upstream latency {args.latency}s")
+    print(f"  one at a time: {n / serial_s * 60:8.1f} q/min  {serial['tokens'] / n:6.1f} tokens/q  "
+          f"{serial['calls']} calls  {serial_s:.2f}s")
+    print(f"  batch         : {stats['questions'] / stats['seconds'] * 60:8.1f} q/min  "
+          f"{batch['tokens'] / max(stats['questions'], 1):6.1f} tokens/q  {batch['calls']} calls  {stats['seconds']:.2f}s"
+          f"  ({stats['questions']} kept, {stats['duplicates']} duplicates, {stats['dropped']} dropped)")
+    srv.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,240 @@
+"""
+本地假 OpenAI Responses 接口，用来测流式输出/压测，不花钱也不用联网。
+
+用法：
+    python benchmarks/fake_responses_server.py --port 8765 --latency 0.3 --token-delay 0.02
+然后在 secrets 或环境变量里设置：
+    OPENAI_BASE_URL = "http://127.0.0.1:8765/v1"
+    OPENAI_API_KEY  = "fake"
+
+支持 POST /v1/responses（stream=true 时按 SSE 逐块返回 response.output_text.delta）。
+--error-rate / --max-rps 可以注入 429（带 Retry-After），用来测限流和退避。
+"""
+import argparse
+import itertools
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+GRADE_REPLY = {
+    "is_correct": False,
+    "correct_answer": "B. 循环会执行 4 次",
+    "explanation": "- i 从 0 开始\n- 条件是 i < 4\n- 所以是 0,1,2,3 共 4 次",
+    "mistake_type": "循环边界错误",
+    "unit": "Unit 4: Iteration",
+    "topic": "for循环",
+}
+
+DRILL_REPLY = {"q": "for (int i = 1; i <= 5; i++) 执行几次？", "a": "5 次"}
+
+QUESTION_REPLY = {
+    "question": (
+        "下面代码输出什么？\n```java\nint s = 0;\nfor (int i = 0; i < 4; i++) s += i;\n"
+        "System.out.println(s);\n```\nA. 4\nB. 6\nC. 10\nD. 3"
+    ),
+    "answer": "B",
+}
+
+_variant = itertools.count(5)
+
+
+def batch_reply(n: int) -> dict:
+    """批量出题：n 道互不相同的题（循环上界各不相同），答案都是 B"""
+    out = []
+    for k in itertools.islice(_variant, n):
+        s = k * (k - 1) // 2
+        out.append({
+            "question": (
+                f"下面代码输出什么？\n```java\nint s = 0;\nfor (int i = 0; i < {k}; i++) s += i;\n"
+                f"System.out.println(s);\n```\nA. {s - k + 1}\nB. {s}\nC. {s + k}\nD. {k}"
+            ),
+            "answer": "B",
+        })
+    return {"questions": out}
+
+
+CHAT_REPLY = "结论：`==` 比较引用，`equals` 比较内容。\n- 原因：String 是对象\n- 例子：`new String(\"a\") == \"a\"` 为 false"
+
+
+class FakeConfig:
+    latency = 0.0  # 首 token 前的等待（秒）
+    token_delay = 0.0  # 每个增量之间的间隔（秒）
+    chunk_chars = 8  # 每个增量的字符数
+    error_rate = 0.0  # 随机返回 429 的比例
+    max_rps = 0.0  # 每秒最多放行多少请求，超出返回 429（0 = 不限），模拟上游限流
+    retry_after = 1.0  # 429 响应里的 Retry-After（秒）
+
+
+def pick_reply(payload: dict) -> str:
+    text = json.dumps(payload.get("input", ""), ensure_ascii=False)
+    if "练习题" in text:
+        return json.dumps(DRILL_REPLY, ensure_ascii=False)
+    m = re.search(r"数量：(\d+)", text)
+    if m:
+        return json.dumps(batch_reply(int(m.group(1))), ensure_ascii=False)
+    if "单选题" in text:
+        return json.dumps(QUESTION_REPLY, ensure_ascii=False)
+    if "JSON" in text:
+        return json.dumps(GRADE_REPLY, ensure_ascii=False)
+    return CHAT_REPLY
+
+
+def _response_obj(resp_id: str, model: str, text: str, status: str = "completed") -> dict:
+    return {
+        "id": resp_id,
+        "object": "response",
+        "created_at": int(time.time()),
+        "status": status,
+        "model": model,
+        "output": [
+            {
+                "id": "msg_" + resp_id,
+                "type": "message",
+                "role": "assistant",
+                "status": status,
+                "content": [{"type": "output_text", "text": text, "annotations": []}],
+            }
+        ] if text else [],
+        "parallel_tool_calls": True,
+        "tool_choice": "auto",
+        "tools": [],
+        "usage": {
+            "input_tokens": 50,
+            "input_tokens_details": {"cached_tokens": 0},
+            "output_tokens": max(len(text) // 4, 1),
+            "output_tokens_details": {"reasoning_tokens": 0},
+            "total_tokens": 50 + max(len(text) // 4, 1),
+        },
+    }
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive，才能测连接复用
+    cfg = FakeConfig
+    _counter = 0
+    _lock = threading.Lock()
+    _window = []  # 最近 1 秒内放行的请求时间
+    throttled = 0  # 返回过多少次 429
+
+    def log_message(self, *args):
+        pass
+
+    def _next_id(self) -> str:
+        with Handler._lock:
+            Handler._counter += 1
+            return f"resp_fake_{Handler._counter}"
+
+    def _send_json(self, status: int, obj: dict, headers=None):
+        body = json.dumps(obj, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _should_throttle(self) -> bool:
+        if self.cfg.error_rate and random.random() < self.cfg.error_rate:
+            return True
+        if not self.cfg.max_rps:
+            return False
+        now = time.monotonic()
+        with Handler._lock:
+            Handler._window = [t for t in Handler._window if now - t < 1.0]
+            if len(Handler._window) >= self.cfg.max_rps:
+                return True
+            Handler._window.append(now)
+        return False
+
+    def _sse(self, event: dict):
+        data = json.dumps(event, ensure_ascii=False)
+        chunk = f"event: {event['type']}\ndata: {data}\n\n".encode("utf-8")
+        # chunked transfer encoding
+        self.wfile.write(f"{len(chunk):X}\r\n".encode() + chunk + b"\r\n")
+        self.wfile.flush()
+
+    def do_POST(self):
+        if not self.path.rstrip("/").endswith("/responses"):
+            self._send_json(404, {"error": {"message": "not found", "type": "invalid_request_error"}})
+            return
+        length = int(self.headers.get("Content-Length", 0))
+        payload = json.loads(self.rfile.read(length) or b"{}")
+        model = payload.get("model", "fake-model")
+        text = pick_reply(payload)
+        resp_id = self._next_id()
+
+        if self._should_throttle():
+            with Handler._lock:
+                Handler.throttled += 1
+            self._send_json(
+                429,
+                {"error": {"message": "Rate limit reached", "type": "rate_limit_exceeded"}},
+                {"Retry-After": str(self.cfg.retry_after)},
+            )
+            return
+
+        time.sleep(self.cfg.latency)
+        if not payload.get("stream"):
+            time.sleep(self.cfg.token_delay * (len(text) // max(self.cfg.chunk_chars, 1)))
+            self._send_json(200, _response_obj(resp_id, model, text))
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        seq = 0
+        self._sse({"type": "response.created", "sequence_number": seq,
+                   "response": _response_obj(resp_id, model, "", status="in_progress")})
+        step = max(self.cfg.chunk_chars, 1)
+        for i in range(0, len(text), step):
+            seq += 1
+            self._sse({
+                "type": "response.output_text.delta",
+                "sequence_number": seq,
+                "item_id": "msg_" + resp_id,
+                "output_index": 0,
+                "content_index": 0,
+                "delta": text[i:i + step],
+                "logprobs": [],
+            })
+            time.sleep(self.cfg.token_delay)
+        seq += 1
+        self._sse({"type": "response.completed", "sequence_number": seq,
+                   "response": _response_obj(resp_id, model, text)})
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+
+def serve(port: int = 0, latency: float = 0.0, token_delay: float = 0.0, error_rate: float = 0.0,
+          max_rps: float = 0.0, retry_after: float = 1.0) -> ThreadingHTTPServer:
+    """在后台线程启动假服务，返回 server（server.server_address[1] 是实际端口）"""
+    cfg = type("Cfg", (FakeConfig,), {
+        "latency": latency, "token_delay": token_delay,
+        "error_rate": error_rate, "max_rps": max_rps, "retry_after": retry_after,
+    })
+    handler = type("FakeHandler", (Handler,), {"cfg": cfg})
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Fake OpenAI Responses endpoint (SSE)")
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--latency", type=float, default=0.3)
+    ap.add_argument("--token-delay", type=float, default=0.02)
+    ap.add_argument("--error-rate", type=float, default=0.0, help="随机返回 429 的比例")
+    ap.add_argument("--max-rps", type=float, default=0.0, help="每秒放行上限，超出返回 429")
+    args = ap.parse_args()
+    srv = serve(args.port, args.latency, args.token_delay, args.error_rate, args.max_rps)
+    print(f"fake Responses API on http://127.0.0.1:{srv.server_address[1]}/v1  (Ctrl+C to stop)")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        srv.shutdown()
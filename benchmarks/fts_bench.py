@@ -0,0 +1,86 @@
+"""
+全文搜索压测：生成 N 行合成错题（默认 10 万），测 wrongbook.search 的查询延迟。
+也顺便验证老库升级时的回填：先按旧结构（迁移到第 2 步）写数据，再 init_db 建索引。
+
+    python benchmarks/fts_bench.py --rows 100000
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import services.wrongbook as wrongbook  # noqa: E402
+
+KEYWORDS = [
+    "ArrayList", "remove", "index", "while", "String", "equals", "substring", "recursion",
+    "constructor", "inheritance", "super", "length", "boolean", "double", "charAt", "compareTo",
+    "循环", "边界", "下标", "越界", "递归", "终止条件", "构造器", "继承", "多态", "字符串", "比较",
+]
+MISTAKES = ["循环边界错误", "off-by-one", "String 比较用了 ==", "整数除法", "忘记 return", "下标越界"]
+SYLLABLES = ["ka", "lo", "mi", "ra", "te", "zu", "pon", "dex", "var", "sum", "cnt", "val", "tmp", "arr", "num"]
+# 真实题目里大部分是变量名、数字和普通叙述，关键词只占少数
+FILLER = ["".join(random.Random(i).choice(SYLLABLES) for _ in range(3)) + str(i % 97) for i in range(20000)]
+
+
+# 第 2 步迁移时的表结构（还没有复习/错因 id/内容哈希这些列）
+LEGACY_INSERT_SQL = """
+INSERT INTO wrongbook
+(created_at, unit, topic, question, user_answer, correct_answer, explanation, mistake_type, next_drill, user_id)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+
+def text(n):
+    words = [random.choice(FILLER) for _ in range(n)]
+    for _ in range(2):
+        words[random.randrange(n)] = random.choice(KEYWORDS)
+    return " ".join(words)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rows", type=int, default=100_000)
+    ap.add_argument("--users", type=int, default=50)
+    ap.add_argument("--queries", type=int, default=200)
+    args = ap.parse_args()
+    random.seed(7)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        wrongbook.DB_PATH = Path(tmp) / "fts.db"
+        c = wrongbook._conn()
+        # 模拟还没有全文索引的老库
+        migrations, wrongbook.MIGRATIONS = wrongbook.MIGRATIONS, wrongbook.MIGRATIONS[:2]
+        wrongbook.init_db()
+        wrongbook.MIGRATIONS = migrations
+        with c:
+            c.executemany(LEGACY_INSERT_SQL, (
+                (f"2026-01-01T00:{i // 60 % 60:02d}:{i % 60:02d}", "Unit 7: ArrayList", random.choice(KEYWORDS),
+                 text(60), "B", "C", text(40), random.choice(MISTAKES), "[]", f"user{i % args.users}")
+                for i in range(args.rows)
+            ))
+        t0 = time.perf_counter()
+        wrongbook.init_db()
+        backfill = time.perf_counter() - t0
+
+        queries = ["ArrayList remove", "循环边界", "substring index", "递归", "equals String", "super constructor"]
+        lat = []
+        hits = 0
+        for i in range(args.queries):
+            q = queries[i % len(queries)]
+            t0 = time.perf_counter()
+            hits += len(wrongbook.search(f"user{i % args.users}", q, limit=20))
+            lat.append(time.perf_counter() - t0)
+        lat.sort()
+
+    print(f"{args.rows} rows, backfill {backfill:.2f}s, {args.queries} queries, {hits} hits")
+    print(f"search p50 {lat[len(lat) // 2] * 1000:.1f} ms | p95 {lat[int(len(lat) * 0.95)] * 1000:.1f} ms"
+          f" | max {lat[-1] * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+输出题本地核对：每次新起 JVM（java Main.java）vs 常驻工作进程池 vs 按代码哈希命中缓存，各跑一遍同一组代码题，
+同时检查输出和预期一致。需要本机装 JDK（java + javac）。
+
+    python benchmarks/java_sandbox_bench.py --repeat 5 --workers 2
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# (代码, 预期输出)
+SNIPPETS = [
+    ("int sum = 0;\nfor (int i = 0; i <= 3; i++) {\n    sum += i;\n}\nSystem.out.println(sum);", "6"),
+    ("int x = 7 / 2;\ndouble y = 7 / 2.0;\nSystem.out.println(x + \" \" + y);", "3 3.5"),
+    ("String s = \"computer\";\nSystem.out.println(s.substring(3, 6));", "put"),
+    ("public static int mystery(int n) {\n    if (n <= 1) return 1;\n    return n * mystery(n - 1);\n}\n"
+     "System.out.println(mystery(5));", "120"),
+    ("ArrayList<Integer> list = new ArrayList<>(Arrays.asList(1, 2, 2, 3));\n"
+     "for (int i = 0; i < list.size(); i++) {\n    if (list.get(i) == 2) list.remove(i);\n}\n"
+     "System.out.println(list);", "[1, 2, 3]"),
+    ("int[][] m = {{1, 2, 3}, {4, 5, 6}};\nint t = 0;\nfor (int[] row : m) {\n    t += row[row.length - 1];\n}\n"
+     "System.out.println(t);", "9"),
+    ("class Animal {\n    public String sound() { return \"...\"; }\n}\n"
+     "class Dog extends Animal {\n    public String sound() { return \"woof\"; }\n}\n"
+     "Animal a = new Dog();\nSystem.out.println(a.sound());", "woof"),
+    ("String a = new String(\"hi\");\nString b = \"hi\";\nSystem.out.println((a == b) + \" \" + a.equals(b));",
+     "false true"),
+    ("int k = 10;\nwhile (k > 1) {\n    k = k / 2;\n    System.out.print(k + \" \");\n}", "5 2 1"),
+]
+
+
+def ms(values, p):
+    values = sorted(values)
+    return round(values[min(len(values) - 1, int(len(values) * p / 100))], 1)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--workers", type=int, default=2)
+    args = ap.parse_args()
+    os.environ["JAVA_SANDBOX"] = "1"
+    os.environ["JAVA_SANDBOX_WORKERS"] = str(args.workers)
+
+    import services.java_sandbox as java_sandbox
+    import services.wrongbook as wrongbook
+
+    if not java_sandbox.enabled():
+        sys.exit("没找到 java/javac（装 JDK 或设置 JAVA_HOME）")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        wrongbook.DB_PATH = java_sandbox.DB_PATH = Path(tmp) / "bench.db"
+        java_sandbox.init_cache()
+
+        # 1. 每次新起 JVM：java 单文件源码模式（编译 + 运行）
+        cold = []
+        for code, expected in SNIPPETS:
+            _, source = java_sandbox.wrap(code)
+            (Path(tmp) / "Main.java").write_text(source, encoding="utf-8")
+            t0 = time.perf_counter()
+            out = subprocess.run([java_sandbox._java_bin("java"), "Main.java"], cwd=tmp, capture_output=True,
+                                 text=True, timeout=60).stdout
+            cold.append((time.perf_counter() - t0) * 1000)
+            assert " ".join(out.split()) == expected, (code, out)
+
+        # 2. 常驻工作进程池：先热身，再每轮清空缓存重跑
+        t0 = time.perf_counter()
+        java_sandbox.warm_up()
+        warm_up_ms = (time.perf_counter() - t0) * 1000
+        warm = []
+        for _ in range(args.repeat):
+            java_sandbox._conn().execute("DELETE FROM java_runs")
+            java_sandbox._conn().commit()
+            for code, expected in SNIPPETS:
+                t0 = time.perf_counter()
+                result = java_sandbox.run_snippet(code)
+                warm.append((time.perf_counter() - t0) * 1000)
+                assert result["status"] == "ok" and " ".join(result["stdout"].split()) == expected, (code, result)
+
+        # 3. 命中缓存
+        cached = []
+        for _ in range(args.repeat):
+            for code, _ in SNIPPETS:
+                t0 = time.perf_counter()
+                assert java_sandbox.run_snippet(code)["cached"]
+                cached.append((time.perf_counter() - t0) * 1000)
+
+    print(f"{len(SNIPPETS)} snippets, outputs match expected")
+    print(f"  new JVM per run : p50 {ms(cold, 50)} ms  p95 {ms(cold, 95)} ms")
+    print(f"  warm worker pool: p50 {ms(warm, 50)} ms  p95 {ms(warm, 95)} ms  (first start + warm-up {warm_up_ms:.0f} ms)")
+    print(f"  cache hit       : p50 {ms(cached, 50)} ms  p95 {ms(cached, 95)} ms")
+    print(f"  stats: {java_sandbox.stats()}")
+
+
+if __name__ == "__main__":
+    main()
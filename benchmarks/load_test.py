@@ -0,0 +1,300 @@
+"""
+压测：N 个学生会话同时跑 聊天 / 生成新题 / 判题，后端默认是进程内的假 OpenAI（fake_responses_server）。
+
+    python benchmarks/load_test.py --sessions 20 --iterations 3 --latency 0.5 --token-delay 0.01
+    python benchmarks/load_test.py --mode direct --sessions 200        # 直接调 services，不跑页面脚本
+    python benchmarks/load_test.py --error-rate 0.05 --max-rps 20      # 注入 429
+    python benchmarks/load_test.py --base-url http://127.0.0.1:8765/v1 # 用已经起好的服务（假的或真的）
+
+--mode apptest 用 Streamlit AppTest 跑真正的 app.py（每个会话一个 AppTest，各自登录）；
+--mode direct 按页面上的调用顺序直接调 services，能压到更多会话。
+输出：总吞吐、每个流程的 p50/p95/p99、SQLite 写入排队/等锁、每个会话占的内存，
+加 --json 可以存成一份结果文件，和之后的改动做对比。
+"""
+import argparse
+import contextlib
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.fake_responses_server import Handler, serve  # noqa: E402
+
+FLOWS = ("generate", "grade", "chat")
+CHAT_PROMPTS = ["什么是多态", "ArrayList 删除元素为什么会跳过", "== 和 equals 的区别", "递归怎么写终止条件"]
+
+
+def rss_mb() -> float:
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+
+
+def pct(values, p):
+    values = sorted(values)
+    return round(values[min(len(values) - 1, int(len(values) * p / 100))] * 1000, 1) if values else None
+
+
+class Gate:
+    """会话登录完在这里等，主线程等所有会话到齐后一起放行，登录不计入压测时间"""
+
+    def __init__(self):
+        self.arrived = 0
+        self._cond = threading.Condition()
+        self._open = False
+
+    def wait(self):
+        with self._cond:
+            self.arrived += 1
+            self._cond.wait_for(lambda: self._open)
+
+    def wait_for_sessions(self, threads):
+        # 中途崩掉的会话不会到齐，只等还活着的
+        while self.arrived < sum(t.is_alive() for t in threads):
+            time.sleep(0.05)
+
+    def set(self):
+        with self._cond:
+            self._open = True
+            self._cond.notify_all()
+
+
+class Recorder:
+    def __init__(self):
+        self.lat = {f: [] for f in FLOWS}
+        self.errors = {f: 0 for f in FLOWS}
+        self.samples = []  # 前几条错误信息
+        self._lock = threading.Lock()
+
+    def run(self, flow, fn):
+        t0 = time.perf_counter()
+        try:
+            error = fn()
+        except Exception as e:
+            error = repr(e)
+        with self._lock:
+            if not error:
+                self.lat[flow].append(time.perf_counter() - t0)
+            else:
+                self.errors[flow] += 1
+                if len(self.samples) < 5:
+                    self.samples.append(f"{flow}: {str(error)[:300]}")
+
+
+# -----------------------------
+# 两种会话驱动
+# -----------------------------
+_compile_lock = threading.Lock()
+
+
+def _prepare_concurrent_apptest():
+    """AppTest 本来是一次跑一个的，多个线程同时跑要先把两处全局状态处理掉"""
+    import streamlit.testing.v1.app_test as app_test
+    from streamlit import config
+    from streamlit.runtime.scriptrunner.script_cache import ScriptCache
+
+    # 1. 每次 run 结束都会把全局配置 global.appTest 改回 False，别的会话正跑着就丢了控件的 format_func；
+    #    压测期间一直保持 True
+    config.set_option("global.appTest", True)
+    app_test.patch_config_options = lambda options: contextlib.nullcontext()
+
+    # 2. CPython 3.11 的 ast.parse 多线程同时跑偶尔报 "AST constructor recursion depth mismatch"；
+    #    每个 AppTest 都要编译一遍 app.py，这一步串行，脚本执行本身仍然并发
+    get_bytecode = ScriptCache.get_bytecode
+
+    def locked(self, script_path):
+        with _compile_lock:
+            return get_bytecode(self, script_path)
+
+    ScriptCache.get_bytecode = locked
+
+
+def apptest_session(i, args, rec, password, ready):
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file(os.path.join(ROOT, "app.py"), default_timeout=120)
+    at.run()
+    at.sidebar.text_input[0].input(f"load{i}")
+    at.sidebar.text_input[1].input(password)
+    at.sidebar.button[0].click().run()
+    ready.wait()
+
+    # 返回页面上的异常（没有就是 None）
+    def click(prefix):
+        found = [b for b in at.button if b.label.startswith(prefix)]
+        if not found:
+            return f"找不到按钮 {prefix!r}，页面异常 {[e.value for e in at.exception]}，" \
+                   f"按钮 {[b.label for b in at.button][:8]}"
+        found[0].click().run()
+        return [e.value for e in at.exception]
+
+    def chat():
+        at.chat_input[0].set_value(random.choice(CHAT_PROMPTS)).run()
+        return [e.value for e in at.exception]
+
+    for _ in range(args.iterations):
+        rec.run("generate", lambda: click("生成新题"))
+        rec.run("grade", lambda: click("判题"))
+        rec.run("chat", chat)
+    return at  # 留着会话对象，内存才算得上
+
+
+def direct_session(i, args, rec, password, ready):
+    """和页面同样的调用顺序：出题走题库，判题先本地比对、判错再流式解释 + 入错题本 + 生成练习"""
+    import services.chat_context as chat_context
+    import services.openai_client as openai_client
+    import services.question_pool as question_pool
+    import services.session_store as session_store
+    import services.telemetry as telemetry
+    import services.tutor_logic as tutor_logic
+    import services.wrongbook as wrongbook
+
+    uid = f"load{i}"
+    telemetry.set_user(uid)
+    state = {"q": None, "chat": [], "ctx": chat_context.new_state()}
+    ready.wait()
+
+    def generate():
+        state["q"] = question_pool.next_question(tutor_logic.UNITS[3], "", viewer=uid)
+
+    def grade():
+        q = state["q"]
+        opts = tutor_logic.parse_question(q["question"])["options"]
+        answer = random.choice(sorted(opts) or ["A"])
+        result = tutor_logic.grade_mcq_locally(opts, q["answer_key"], answer)
+        if result is None or not result["is_correct"]:
+            for field, value in tutor_logic.grade_stream(q["question"], answer, answer_key=q["answer_key"]):
+                if field == "result":
+                    result = value
+        entry_id = wrongbook.add_entry(
+            tutor_logic.UNITS[3], "", q["question"], answer, result.get("correct_answer", ""),
+            result.get("explanation", ""), result.get("mistake_type", ""), "", user_id=uid,
+        )
+        if not result.get("graded_locally"):
+            drills = [f.result() for f in tutor_logic.start_drills(q["question"], result)]
+            wrongbook.set_next_drill(entry_id, json.dumps(drills, ensure_ascii=False), user_id=uid)
+
+    def chat():
+        prompt = random.choice(CHAT_PROMPTS)
+        state["chat"].append({"id": session_store.append_chat(uid, "user", prompt), "role": "user", "content": prompt})
+        messages, _ = chat_context.build_messages("你是AP CSA(Java)家教。", state["chat"], state["ctx"])
+        reply = "".join(openai_client.stream_text(messages, caller="chat"))
+        state["chat"].append({"id": session_store.append_chat(uid, "assistant", reply), "role": "assistant",
+                              "content": reply})
+
+    for _ in range(args.iterations):
+        rec.run("generate", generate)
+        rec.run("grade", grade)
+        rec.run("chat", chat)
+    return state
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--mode", choices=("apptest", "direct"), default="apptest")
+    ap.add_argument("--sessions", type=int, default=20)
+    ap.add_argument("--iterations", type=int, default=3, help="每个会话跑几轮 生成→判题→聊天")
+    ap.add_argument("--base-url", default="", help="不用进程内假服务，直接压这个地址")
+    ap.add_argument("--latency", type=float, default=0.5, help="假服务首 token 前等待（秒）")
+    ap.add_argument("--token-delay", type=float, default=0.01, help="假服务每块之间的间隔（秒）")
+    ap.add_argument("--error-rate", type=float, default=0.0)
+    ap.add_argument("--max-rps", type=float, default=0.0)
+    ap.add_argument("--pool-worker", action="store_true", help="打开后台补题线程（默认关，只测前台）")
+    ap.add_argument("--json", default="", help="结果另存成 JSON 文件")
+    args = ap.parse_args()
+    random.seed(7)
+
+    srv = None
+    if args.base_url:
+        os.environ["OPENAI_BASE_URL"] = args.base_url
+    else:
+        srv = serve(0, args.latency, args.token_delay, error_rate=args.error_rate, max_rps=args.max_rps)
+        os.environ["OPENAI_BASE_URL"] = f"http://127.0.0.1:{srv.server_address[1]}/v1"
+    os.environ.setdefault("OPENAI_API_KEY", "fake")
+    os.environ.setdefault("WEEKLY_PASSWORD_SEED", "load-seed")
+    os.environ["QUESTION_POOL_WORKER"] = "1" if args.pool_worker else "0"
+    os.environ.setdefault("STREAMLIT_LOGGER_LEVEL", "error")  # AppTest 每个会话都会打几行 warning
+
+    import services.auth as auth
+    import services.openai_client as openai_client
+    from services import db
+
+    tmp = tempfile.TemporaryDirectory()
+    os.chdir(tmp.name)  # wrongbook.db 等建在临时目录
+    if args.mode == "direct":
+        import services.question_pool as question_pool
+        import services.session_store as session_store
+        import services.wrongbook as wrongbook
+
+        wrongbook.init_db()
+        question_pool.init_pool()
+        session_store.init_store()
+
+    rec = Recorder()
+    session = apptest_session if args.mode == "apptest" else direct_session
+    if args.mode == "apptest":
+        _prepare_concurrent_apptest()
+    ready = Gate()
+    keep = [None] * args.sessions
+    rss0 = rss_mb()
+
+    def worker(i):
+        keep[i] = session(i, args, rec, auth.current_password(), ready)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(args.sessions)]
+    for t in threads:
+        t.start()
+    ready.wait_for_sessions(threads)
+    rss_ready = rss_mb()
+    writes0 = db.writer_stats()
+    Handler.throttled = 0
+    t0 = time.perf_counter()
+    ready.set()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - t0
+
+    done = sum(len(v) for v in rec.lat.values())
+    report = {
+        "mode": args.mode,
+        "sessions": args.sessions,
+        "iterations": args.iterations,
+        "seconds": round(elapsed, 2),
+        "flows_per_s": round(done / elapsed, 2),
+        "flows": {
+            f: {"ok": len(rec.lat[f]), "errors": rec.errors[f], "p50_ms": pct(rec.lat[f], 50),
+                "p95_ms": pct(rec.lat[f], 95), "p99_ms": pct(rec.lat[f], 99)}
+            for f in FLOWS
+        },
+        "error_samples": rec.samples,
+        "sqlite_writes": {k: v for k, v in db.writer_stats().items() if v != writes0.get(k)},
+        "mem_mb": {"start": round(rss0, 1), "per_session": round((rss_ready - rss0) / args.sessions, 2),
+                   "end": round(rss_mb(), 1)},
+        "llm": {"upstream_429": Handler.throttled, "client": openai_client.client_stats(),
+                "scheduler": openai_client.scheduler_stats()},
+    }
+    print(f"{args.sessions} sessions x {args.iterations} iterations ({args.mode}), "
+          f"{elapsed:.1f}s, {report['flows_per_s']} flows/s")
+    for f, r in report["flows"].items():
+        print(f"  {f:<9} ok {r['ok']:>4}  err {r['errors']:>3}  "
+              f"p50 {r['p50_ms']} ms  p95 {r['p95_ms']} ms  p99 {r['p99_ms']} ms")
+    for name, w in report["sqlite_writes"].items():
+        print(f"  sqlite {name}: {w}")
+    print(f"  memory: {report['mem_mb']}  upstream 429s: {Handler.throttled}")
+    for line in rec.samples:
+        print(f"  error {line}")
+    if args.json:
+        with open(os.path.join(ROOT, args.json) if not os.path.isabs(args.json) else args.json, "w") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2, default=str)
+    os.chdir(ROOT)
+    if srv is not None:
+        srv.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+上游限流时的表现：假服务每秒只放行 --max-rps 个请求，其余返回 429。
+同时压 N 个学生请求（判题）和 M 个后台补题请求，对比：
+  - 无准入控制：各自撞 429、各自重试
+  - 调度器：令牌桶 + 优先队列 + 429 全局暂停降速
+
+    python benchmarks/rate_limit_bench.py --interactive 30 --background 30 --max-rps 10
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fake_responses_server import Handler, serve  # noqa: E402
+
+
+def run(openai_client, llm_scheduler, n_interactive, n_background):
+    done = {"interactive": [], "background": []}
+    failed = {"interactive": 0, "background": 0}
+    lock = threading.Lock()
+    gate = threading.Barrier(n_interactive + n_background)
+
+    def call(kind, i):
+        priority = llm_scheduler.PRIORITY_INTERACTIVE if kind == "interactive" else llm_scheduler.PRIORITY_BACKGROUND
+        msgs = [{"role": "user", "content": f"{kind} #{i} {random.random()}"}]
+        gate.wait()
+        t0 = time.perf_counter()
+        try:
+            openai_client.generate_text(msgs, cache=False, priority=priority)
+        except Exception:
+            with lock:
+                failed[kind] += 1
+            return
+        with lock:
+            done[kind].append(time.perf_counter() - t0)
+
+    threads = [threading.Thread(target=call, args=("background", i)) for i in range(n_background)]
+    threads += [threading.Thread(target=call, args=("interactive", i)) for i in range(n_interactive)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    out = {}
+    for kind in done:
+        lat = sorted(done[kind])
+        out[kind] = {
+            "ok": len(lat),
+            "failed": failed[kind],
+            "p50_s": round(lat[len(lat) // 2], 2) if lat else None,
+            "max_s": round(lat[-1], 2) if lat else None,
+        }
+    return out
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--interactive", type=int, default=30)
+    ap.add_argument("--background", type=int, default=30)
+    ap.add_argument("--max-rps", type=float, default=10)
+    ap.add_argument("--latency", type=float, default=0.2)
+    args = ap.parse_args()
+
+    srv = serve(0, args.latency, 0.0, max_rps=args.max_rps, retry_after=1.0)
+    os.environ["OPENAI_BASE_URL"] = f"http://127.0.0.1:{srv.server_address[1]}/v1"
+    os.environ.setdefault("OPENAI_API_KEY", "fake")
+
+    import services.openai_client as openai_client
+    import services.llm_scheduler as llm_scheduler
+
+    class Unlimited(llm_scheduler.Scheduler):
+        """基线：不排队不限速，429 时只在自己线程里退避一下"""
+
+        def __init__(self):
+            super().__init__(rpm=0, tpm=0, max_queue=10 ** 6)
+
+        def on_rate_limited(self, retry_after=None):
+            self.rate_limited += 1
+            time.sleep(random.uniform(0.25, 0.5))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        openai_client.DB_PATH = Path(tmp) / "wrongbook.db"
+
+        os.environ["OPENAI_MAX_RATE_LIMIT_RETRIES"] = "2"
+        openai_client._scheduler = Unlimited()
+        Handler.throttled = 0
+        baseline = run(openai_client, llm_scheduler, args.interactive, args.background)
+        baseline_429 = Handler.throttled
+
+        os.environ["OPENAI_MAX_RATE_LIMIT_RETRIES"] = "5"
+        # 配置的速率故意比上游高一倍，靠 429 自适应降下来
+        openai_client._scheduler = llm_scheduler.Scheduler(rpm=int(args.max_rps * 60 * 2), tpm=0)
+        Handler.throttled = 0
+        scheduled = run(openai_client, llm_scheduler, args.interactive, args.background)
+        scheduled_429 = Handler.throttled
+
+    print(f"{args.interactive} interactive + {args.background} background, upstream {args.max_rps} req/s")
+    print(f"  no admission control: {baseline}  upstream 429s={baseline_429}")
+    print(f"  scheduler           : {scheduled}  upstream 429s={scheduled_429}")
+    print(f"  scheduler stats     : {openai_client.scheduler_stats()}")
+    srv.shutdown()
+
+
+if __name__ == "__main__":
+    main()
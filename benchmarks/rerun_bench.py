@@ -0,0 +1,89 @@
+"""
+每次 rerun 打了多少条 SQL：登录后连续 rerun（什么都没变）统计每次的语句数和耗时，
+然后加一条错题，看缓存是否只在这一次失效、之后又回到 0。
+
+    python benchmarks/rerun_bench.py --reruns 20 --entries 50
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from services import db  # noqa: E402
+
+_counts = {}
+
+
+def _counting_open(open_):
+    def wrapped(path):
+        c = open_(path)
+        name = threading.current_thread().name
+        c.set_trace_callback(lambda sql: _counts.__setitem__(name, _counts.get(name, 0) + 1))
+        return c
+    return wrapped
+
+
+def script_queries():
+    # 只数页面脚本线程里的（批量写线程、账本线程不算 rerun 的开销）
+    return sum(n for name, n in _counts.items() if "writer" not in name and "ledger" not in name)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--reruns", type=int, default=20)
+    ap.add_argument("--entries", type=int, default=50)
+    args = ap.parse_args()
+
+    os.environ.setdefault("OPENAI_API_KEY", "fake")
+    os.environ.setdefault("WEEKLY_PASSWORD_SEED", "bench-seed")
+    os.environ["QUESTION_POOL_WORKER"] = "0"
+    db._open = _counting_open(db._open)
+
+    from streamlit.testing.v1 import AppTest
+
+    import services.auth as auth
+    import services.wrongbook as wrongbook
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        wrongbook.init_db()
+        for i in range(args.entries):
+            wrongbook.add_entry("Unit 4: Iteration", "for循环", f"q{i}", "A", "B", "e", "循环边界错误", "[]",
+                                user_id="bench")
+
+        at = AppTest.from_file(os.path.join(ROOT, "app.py"), default_timeout=60)
+        at.run()
+        at.sidebar.text_input[0].input("bench")
+        at.sidebar.text_input[1].input(auth.current_password())
+        at.sidebar.button[0].click().run()
+        at.run()  # 第一次 rerun 填缓存
+        assert not at.exception, at.exception
+
+        def rerun():
+            before = script_queries()
+            t0 = time.perf_counter()
+            at.run()
+            return script_queries() - before, (time.perf_counter() - t0) * 1000
+
+        steady = [rerun() for _ in range(args.reruns)]
+        wrongbook.add_entry("Unit 4: Iteration", "for循环", "new", "A", "B", "e", "空指针", "[]", user_id="bench")
+        after_change = rerun()
+        settled = rerun()
+        assert not at.exception, at.exception
+        os.chdir(ROOT)
+
+    queries = sorted(q for q, _ in steady)
+    ms = sorted(t for _, t in steady)
+    print(f"unchanged reruns x{args.reruns}: queries/rerun median {queries[len(queries) // 2]} max {queries[-1]}, "
+          f"p50 {ms[len(ms) // 2]:.1f} ms")
+    print(f"rerun after add_entry: {after_change[0]} queries, {after_change[1]:.1f} ms")
+    print(f"next rerun           : {settled[0]} queries, {settled[1]:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+40 个会话同时对同一道题点“判题”：看合并后实际发出了几次 LLM 请求。
+
+    python benchmarks/singleflight_bench.py --sessions 40 --latency 0.5
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fake_responses_server import serve  # noqa: E402
+
+
+def burst(n, fn):
+    """n 个线程同时起跑调用 fn，返回 (结果列表, 异常列表, 耗时)"""
+    gate = threading.Barrier(n)
+    results, errors = [], []
+
+    def run():
+        gate.wait()
+        try:
+            results.append(fn())
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=run) for _ in range(n)]
+    t0 = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results, errors, time.perf_counter() - t0
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sessions", type=int, default=40)
+    ap.add_argument("--latency", type=float, default=0.5)
+    ap.add_argument("--token-delay", type=float, default=0.01)
+    args = ap.parse_args()
+
+    srv = serve(0, args.latency, args.token_delay)
+    os.environ["OPENAI_BASE_URL"] = f"http://127.0.0.1:{srv.server_address[1]}/v1"
+    os.environ.setdefault("OPENAI_API_KEY", "fake")
+
+    import services.openai_client as openai_client
+
+    with tempfile.TemporaryDirectory() as tmp:
+        openai_client.DB_PATH = Path(tmp) / "wrongbook.db"  # 缓存库 llm_cache.db 跟着放到临时目录
+
+        msgs = [{"role": "user", "content": "判题：for (int i = 0; i < 4; i++) 执行几次？学生答 A"}]
+        results, errors, elapsed = burst(args.sessions, lambda: openai_client.generate_text(msgs))
+        s = openai_client.client_stats()
+        print(f"generate_text x{args.sessions}: {elapsed * 1000:.0f} ms, http_requests={s['http_requests']}, "
+              f"coalesced={s['coalesced']}, distinct results={len(set(results))}, errors={len(errors)}")
+
+        openai_client.reset_client_stats()
+        msgs = [{"role": "user", "content": "解释 == 和 equals"}]
+        results, errors, elapsed = burst(args.sessions, lambda: "".join(openai_client.stream_text(msgs)))
+        s = openai_client.client_stats()
+        print(f"stream_text   x{args.sessions}: {elapsed * 1000:.0f} ms, http_requests={s['http_requests']}, "
+              f"coalesced={s['coalesced']}, distinct results={len(set(results))}, errors={len(errors)}")
+
+        # 领头请求失败时，每个等待者都应拿到同一个错误
+        srv.shutdown()
+        os.environ["OPENAI_BASE_URL"] = "http://127.0.0.1:9/v1"  # 没人监听的端口
+        openai_client.reset_client_stats()
+        msgs = [{"role": "user", "content": "服务挂了"}]
+        results, errors, elapsed = burst(args.sessions, lambda: openai_client.generate_text(msgs))
+        s = openai_client.client_stats()
+        print(f"server down   x{args.sessions}: {elapsed * 1000:.0f} ms, http_requests={s['http_requests']}, "
+              f"coalesced={s['coalesced']}, errors={len(errors)} ({type(errors[0]).__name__ if errors else '-'})")
+
+
+if __name__ == "__main__":
+    main()
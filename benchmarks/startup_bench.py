@@ -0,0 +1,105 @@
+"""
+冷启动和每次 rerun 的开销：
+  1. python -X importtime：app.py 顶部那些 import 一共花多少毫秒、最重的是哪些包
+  2. Streamlit AppTest：第一次运行（冷启动）和登录后连续 rerun 的耗时
+
+    python benchmarks/startup_bench.py --reruns 30
+    python benchmarks/startup_bench.py --max-rerun-ms 150   # 超过就返回非 0，CI 里防回退
+"""
+import argparse
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+APP_IMPORTS = (
+    "import streamlit, services.wrongbook, services.tutor_logic, services.openai_client, services.auth, "
+    "services.question_pool, services.question_sets, services.review, services.analytics, services.chat_context, "
+    "services.session_store, services.tokens"
+)
+_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)")
+
+
+def import_profile(top=8):
+    """返回 (总毫秒, [(cumulative_ms, 包名)], 是否导入了 openai)；只统计顶层包"""
+    out = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", APP_IMPORTS],
+        cwd=ROOT, capture_output=True, text=True, check=True,
+    ).stderr
+    roots = []
+    eager_openai = False
+    for line in out.splitlines():
+        m = _LINE.match(line)
+        eager_openai = eager_openai or bool(m and m.group(4) == "openai")
+        # 缩进一格 = 被 -c 里的语句直接导入的；解释器自己启动时的 site/encodings 不算
+        if m and len(m.group(3)) == 1 and m.group(4).split(".")[0] in ("streamlit", "services"):
+            roots.append((int(m.group(2)) / 1000, m.group(4)))
+    total = sum(ms for ms, _ in roots)
+    return total, sorted(roots, reverse=True)[:top], eager_openai
+
+
+def pct(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def app_timings(reruns):
+    from streamlit.testing.v1 import AppTest
+
+    os.environ.setdefault("OPENAI_API_KEY", "fake")
+    os.environ.setdefault("WEEKLY_PASSWORD_SEED", "bench-seed")
+    os.environ["QUESTION_POOL_WORKER"] = "0"  # 不要后台调 LLM
+    import services.auth as auth
+
+    at = AppTest.from_file(os.path.join(ROOT, "app.py"), default_timeout=60)
+    t0 = time.perf_counter()
+    at.run()
+    cold = time.perf_counter() - t0
+
+    at.sidebar.text_input[0].input("bench")
+    at.sidebar.text_input[1].input(auth.current_password())
+    t0 = time.perf_counter()
+    at.sidebar.button[0].click().run()
+    login = time.perf_counter() - t0
+    assert not at.exception, at.exception
+
+    lat = []
+    for _ in range(reruns):
+        t0 = time.perf_counter()
+        at.run()
+        lat.append(time.perf_counter() - t0)
+    assert not at.exception, at.exception
+    return cold, login, lat
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--reruns", type=int, default=30)
+    ap.add_argument("--max-rerun-ms", type=float, default=0, help="rerun p50 超过这个值就失败（0 = 不检查）")
+    args = ap.parse_args()
+
+    total, heavy, eager_openai = import_profile()
+    print(f"imports: {total:8.1f} ms")
+    for ms, name in heavy:
+        print(f"  {name:<32}{ms:8.1f} ms")
+    print(f"  openai SDK imported at startup: {eager_openai}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)  # wrongbook.db 等建在临时目录
+        cold, login, lat = app_timings(args.reruns)
+    p50 = pct(lat, 50) * 1000
+    print(f"first run (cold): {cold * 1000:8.1f} ms")
+    print(f"login run       : {login * 1000:8.1f} ms")
+    print(f"rerun x{args.reruns:<9}: p50 {p50:.1f} ms  p95 {pct(lat, 95) * 1000:.1f} ms  max {max(lat) * 1000:.1f} ms")
+    if args.max_rerun_ms and p50 > args.max_rerun_ms:
+        print(f"FAIL: rerun p50 {p50:.1f} ms > {args.max_rerun_ms} ms")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
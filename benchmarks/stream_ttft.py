@@ -0,0 +1,55 @@
+"""
+对比阻塞调用和流式调用的等待时间（time-to-first-token），跑在本地假服务上。
+
+    python benchmarks/stream_ttft.py --token-delay 0.02
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fake_responses_server import serve  # noqa: E402
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--latency", type=float, default=0.2)
+    ap.add_argument("--token-delay", type=float, default=0.02)
+    args = ap.parse_args()
+
+    srv = serve(0, args.latency, args.token_delay)
+    os.environ["OPENAI_BASE_URL"] = f"http://127.0.0.1:{srv.server_address[1]}/v1"
+    os.environ.setdefault("OPENAI_API_KEY", "fake")
+
+    import services.openai_client as openai_client
+    import services.tutor_logic as tutor_logic
+
+    msgs = [{"role": "user", "content": "解释 == 和 equals"}]
+    t0 = time.perf_counter()
+    openai_client.generate_text(msgs)
+    blocking = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    first = None
+    for _ in openai_client.stream_text(msgs):
+        first = first or time.perf_counter() - t0
+    streamed = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    seen = {}
+    for field, _ in tutor_logic.grade_stream("for (int i = 0; i < 4; i++) 执行几次？", "A", "Unit 4: Iteration"):
+        seen.setdefault(field, time.perf_counter() - t0)
+
+    print(f"chat  blocking total      : {blocking * 1000:8.1f} ms")
+    print(f"chat  stream first token  : {first * 1000:8.1f} ms  (total {streamed * 1000:.1f} ms)")
+    for field in ("correct_answer", "topic", "result"):
+        if field in seen:
+            print(f"grade field {field:<14}: {seen[field] * 1000:8.1f} ms")
+    print(openai_client.client_stats())
+    srv.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+"""
+长文本去重压缩存储：先按旧结构（迁移到第 7 步，正文直接存在 wrongbook 的列里）灌 N 行合成错题（默认 50 万，
+少量热门题目被全班反复做错，每道题几 KB），测库文件大小和读取延迟；再 init_db 跑压缩迁移（含 VACUUM），
+同样再测一遍，并核对迁移前后读出来的正文一字不差。
+
+    python benchmarks/text_blob_bench.py --rows 500000 --questions 3000
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import services.wrongbook as wrongbook  # noqa: E402
+from services import db  # noqa: E402
+
+# 第 7 步迁移时的写法：正文直接写进 wrongbook 的列里
+LEGACY_INSERT_SQL = """
+INSERT INTO wrongbook
+(created_at, unit, topic, question, user_answer, correct_answer, explanation, mistake_type, next_drill, user_id,
+ due_at, mistake_type_id, content_hash)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+# get_entry / review.due_entries 的查询，表名留空：迁移前读 wrongbook，迁移后读 wrongbook_full
+GET_SQL = "SELECT * FROM {table} WHERE id=? AND user_id=?"
+DUE_SQL = """
+SELECT id, unit, topic, question, correct_answer, explanation, mistake_type, next_drill,
+       ease, interval_days, reps, due_at
+FROM {table} WHERE user_id=? AND due_at < ? ORDER BY due_at LIMIT 5
+"""
+
+UNITS = [f"Unit {i}" for i in range(1, 11)]
+MISTAKES = list(enumerate(wrongbook.SEED, 1))
+CODE = [
+    "int sum = 0;", "for (int i = 0; i <= arr.length; i++) {", "    sum += arr[i];", "}",
+    "ArrayList<Integer> list = new ArrayList<>();", "if (list.get(k) == target) list.remove(k);",
+    "String s = \"computer\";", "System.out.println(s.substring(3, 6));", "while (n > 1) { n = n / 2; }",
+    "public static int mystery(int n) {", "    if (n <= 1) return 1;", "    return n * mystery(n - 1);",
+]
+PROSE = ["循环边界写成了 <=，最后一次访问越界。", "整数除法会截断小数部分。", "String 要用 equals 比较内容。",
+         "删除元素后下标没有回退，跳过了相邻元素。", "递归缺少终止条件会一直调用下去。", "注意 substring 的右端不包含。"]
+
+
+def question(rng, i):
+    lines = [f"// 第 {i} 题：下面这段代码执行后输出什么？"]
+    lines += [rng.choice(CODE) + f"  // {rng.randrange(1000)}" for _ in range(rng.randrange(40, 110))]
+    lines += [f"({k}) {rng.randrange(100)}" for k in "ABCD"]
+    return "\n".join(lines)
+
+
+def explanation(rng):
+    return "".join(rng.choice(PROSE) for _ in range(rng.randrange(15, 50)))
+
+
+def rows(n, questions, students, rng):
+    """热门题目被很多学生做错：按 1/k 的权重挑题；每道题的解析有几个不同版本（LLM 每次说法不一样）"""
+    pool = [(question(rng, k), [explanation(rng) for _ in range(3)], rng.choice("ABCD")) for k in range(questions)]
+    weights = [1 / (k + 1) for k in range(questions)]
+    now = datetime.utcnow()
+    for i, (q, explanations, key) in enumerate(rng.choices(pool, weights, k=n)):
+        created = (now - timedelta(minutes=rng.randrange(60 * 24 * 120))).isoformat()
+        type_id, mistake = rng.choice(MISTAKES)
+        unit, user = rng.choice(UNITS), f"s{rng.randrange(students)}"
+        due = (now + timedelta(hours=rng.randrange(-72, 24 * 14))).isoformat()
+        topic = f"topic{i % 50}"
+        yield (created, unit, topic, q, "A", key, rng.choice(explanations), mistake, "[]", user, due, type_id,
+               wrongbook.content_hash(user, created, unit, topic, q, "A", key))
+
+
+def sizes(c) -> dict:
+    """各表（含索引、全文索引的影子表）占多少 MB"""
+    out = {}
+    for name, size in c.execute("SELECT name, SUM(pgsize) FROM dbstat GROUP BY name"):
+        group = "wrongbook_fts*" if name.startswith("wrongbook_fts") else name
+        out[group] = out.get(group, 0) + size / 2 ** 20
+    return dict(sorted(out.items(), key=lambda kv: -kv[1])[:6])
+
+
+def pct(values, p):
+    values = sorted(values)
+    return round(values[min(len(values) - 1, int(len(values) * p / 100))] * 1000, 2)
+
+
+def measure(path, table, probes, n, students, seed):
+    """新开一条连接（冷的 SQLite 页缓存，操作系统页缓存是热的），测随机单条和到期列表的读取延迟"""
+    db.close_thread_connections()
+    c = wrongbook._conn()
+    rng = random.Random(seed)
+    tomorrow = (datetime.utcnow().date() + timedelta(days=1)).isoformat()
+    lat = {"get_entry": [], "due_entries": []}
+    texts = []
+    for _ in range(probes):
+        entry_id = rng.randrange(1, n + 1)
+        user, = c.execute("SELECT user_id FROM wrongbook WHERE id=?", (entry_id,)).fetchone() or ("",)
+        t0 = time.perf_counter()
+        row = c.execute(GET_SQL.format(table=table), (entry_id, user)).fetchone()
+        lat["get_entry"].append(time.perf_counter() - t0)
+        texts.append(row and (row[4], row[6], row[7]))
+        t0 = time.perf_counter()
+        due = c.execute(DUE_SQL.format(table=table), (f"s{rng.randrange(students)}", tomorrow)).fetchall()
+        lat["due_entries"].append(time.perf_counter() - t0)
+        texts.append([(r[3], r[4], r[5]) for r in due])
+    report = {
+        "file_mb": round(os.path.getsize(path) / 2 ** 20, 1),
+        "tables_mb": {k: round(v, 1) for k, v in sizes(c).items()},
+        **{f"{k}_ms": {"p50": pct(v, 50), "p95": pct(v, 95)} for k, v in lat.items()},
+    }
+    return report, texts
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rows", type=int, default=500_000)
+    ap.add_argument("--questions", type=int, default=3000, help="不同题目的个数")
+    ap.add_argument("--students", type=int, default=200)
+    ap.add_argument("--probes", type=int, default=2000)
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = wrongbook.DB_PATH = Path(tmp) / "wrongbook.db"
+        migrations, wrongbook.MIGRATIONS = wrongbook.MIGRATIONS, wrongbook.MIGRATIONS[:7]
+        wrongbook.init_db()
+        wrongbook.MIGRATIONS = migrations
+        c = wrongbook._conn()
+        t0 = time.perf_counter()
+        source = rows(args.rows, args.questions, args.students, random.Random(5))
+        while chunk := [r for _, r in zip(range(50_000), source)]:
+            with c:
+                c.executemany(LEGACY_INSERT_SQL, chunk)
+        c.execute("VACUUM")
+        print(f"{args.rows:,} rows, {args.questions:,} distinct questions, loaded in {time.perf_counter() - t0:.0f}s")
+
+        before, texts_before = measure(path, "wrongbook", args.probes, args.rows, args.students, 9)
+        t0 = time.perf_counter()
+        wrongbook.init_db()
+        migrate = time.perf_counter() - t0
+        after, texts_after = measure(path, "wrongbook_full", args.probes, args.rows, args.students, 9)
+        assert texts_before == texts_after, "迁移前后读出来的正文不一致"
+        blobs, = wrongbook._conn().execute("SELECT COUNT(*) FROM text_blobs").fetchone()
+
+    print(f"migration + VACUUM {migrate:.1f}s, {blobs:,} distinct texts, reads identical before/after")
+    for name, r in (("before", before), ("after", after)):
+        print(f"  {name:<6} file {r['file_mb']:>8,.1f} MB | get_entry p50 {r['get_entry_ms']['p50']} ms "
+              f"p95 {r['get_entry_ms']['p95']} ms | due_entries p50 {r['due_entries_ms']['p50']} ms "
+              f"p95 {r['due_entries_ms']['p95']} ms")
+        print(f"         {r['tables_mb']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+"""
+错题本写入/读取压测：N 个写会话并发 add_entry，同时 R 个读会话跑 list_entries。
+和 Streamlit 一样，每次操作都在一个新起的短命线程里跑（每次 rerun 换一个 script-runner 线程），
+所以连接复用靠的是进程内连接池，不是线程自己的长连接。
+对比旧实现（每次调用新建连接、rollback journal）和现在的连接池 + WAL + 批量写线程。
+
+    python benchmarks/wrongbook_bench.py --writers 16 --inserts 200 --readers 4
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import services.wrongbook as wrongbook  # noqa: E402
+from services import db  # noqa: E402
+
+# 改造前的写法：正文直接写进 wrongbook 的列里（后面三列：due_at、mistake_type_id、content_hash）
+LEGACY_INSERT_SQL = """
+INSERT INTO wrongbook
+(created_at, unit, topic, question, user_answer, correct_answer, explanation, mistake_type, next_drill, user_id,
+ due_at, mistake_type_id, content_hash)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+ROW = ("Unit 4: Iteration", "for循环", "Q" * 600, "B", "C. 6", "E" * 800, "循环边界错误", "[]")
+
+
+class Legacy:
+    """基线：和改造前的 wrongbook 一样，每次调用都 sqlite3.connect"""
+
+    def __init__(self, path):
+        self.path = path
+
+    def _connect(self):
+        c = sqlite3.connect(self.path)
+        c.create_function("fts_segment", 1, db.segment_cjk)  # 全文索引触发器要用
+        c.create_function("text_unpack", 1, db.unpack_text)
+        return c
+
+    def init_db(self):
+        wrongbook.init_db()  # 建表/迁移走同一套代码，再把日志模式切回旧的 rollback journal
+        db.close_thread_connections()
+        with self._connect() as c:
+            mode = c.execute("PRAGMA journal_mode=DELETE").fetchone()[0]
+        assert mode == "delete", mode
+
+    def add_entry(self, *row):
+        with self._connect() as c:
+            now = datetime.utcnow().isoformat()
+            # 基线不算错因归一和哈希
+            c.execute(LEGACY_INSERT_SQL, (now, *row, "", now, None, None))
+            c.commit()
+
+    def list_entries(self, limit=200):
+        with self._connect() as c:
+            return c.execute(
+                "SELECT id, created_at, unit, topic, question, user_answer, correct_answer, mistake_type "
+                "FROM wrongbook ORDER BY id DESC LIMIT ?", (limit,)
+            ).fetchall()
+
+
+class Pooled:
+    def init_db(self):
+        wrongbook.init_db()
+
+    def add_entry(self, *row):
+        wrongbook.add_entry(*row)
+
+    def list_entries(self, limit=200):
+        return wrongbook.list_entries(limit=limit)
+
+
+def pct(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def rerun(fn, *args):
+    """像一次 Streamlit rerun 一样：新起一个线程跑完就结束"""
+    t = threading.Thread(target=fn, args=args)
+    t.start()
+    t.join()
+
+
+def run(store, writers, inserts, readers):
+    store.init_db()
+    errors = []
+    read_lat = []
+    stop = threading.Event()
+
+    def write_once():
+        try:
+            store.add_entry(*ROW)
+        except sqlite3.OperationalError as e:
+            errors.append(str(e))
+
+    def read_once():
+        t0 = time.perf_counter()
+        try:
+            store.list_entries(limit=50)
+        except sqlite3.OperationalError as e:
+            errors.append(str(e))
+            return
+        read_lat.append(time.perf_counter() - t0)
+
+    def write_loop():
+        for _ in range(inserts):
+            rerun(write_once)
+
+    def read_loop():
+        while not stop.is_set():
+            rerun(read_once)
+
+    rts = [threading.Thread(target=read_loop) for _ in range(readers)]
+    wts = [threading.Thread(target=write_loop) for _ in range(writers)]
+    for t in rts:
+        t.start()
+    t0 = time.perf_counter()
+    for t in wts:
+        t.start()
+    for t in wts:
+        t.join()
+    elapsed = time.perf_counter() - t0
+    stop.set()
+    for t in rts:
+        t.join()
+    total = writers * inserts - len([e for e in errors if "locked" in e])
+    return {
+        "inserts_per_sec": round(total / elapsed, 1),
+        "read_p50_ms": round(pct(read_lat, 50) * 1000, 2),
+        "read_p99_ms": round(pct(read_lat, 99) * 1000, 2),
+        "reads": len(read_lat),
+        "lock_errors": len(errors),
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--writers", type=int, default=16)
+    ap.add_argument("--inserts", type=int, default=200)
+    ap.add_argument("--readers", type=int, default=4)
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        wrongbook.DB_PATH = Path(tmp) / "legacy.db"
+        legacy = run(Legacy(wrongbook.DB_PATH), args.writers, args.inserts, args.readers)
+        wrongbook.DB_PATH = Path(tmp) / "pooled.db"
+        pooled = run(Pooled(), args.writers, args.inserts, args.readers)
+
+    print(f"{args.writers} writers x {args.inserts} inserts, {args.readers} readers")
+    for name, r in (("legacy", legacy), ("pooled+WAL+batch", pooled)):
+        print(f"{name:>18}: {r}")
+
+
+if __name__ == "__main__":
+    main()
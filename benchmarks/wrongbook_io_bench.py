@@ -0,0 +1,106 @@
+"""
+错题本导入/导出吞吐：先灌 --rows 行（默认 100 万），每种格式导出一遍、导入到一个空库、再导入一遍（应该全部去重跳过）。
+同时每 20ms 采一次 RSS，报告每一步比开始时多占了多少内存（应该和行数无关）。
+
+    python benchmarks/wrongbook_io_bench.py --rows 1000000 --formats csv jsonl parquet
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+from datetime import datetime, timedelta
+from itertools import islice
+from pathlib import Path
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import services.wrongbook as wrongbook  # noqa: E402
+import services.wrongbook_io as wrongbook_io  # noqa: E402
+
+UNITS = [f"Unit {i}" for i in range(1, 11)]
+MISTAKES = list(enumerate(wrongbook.SEED, 1))
+
+
+def rss_mb() -> float:
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+
+
+def peak_rss(fn):
+    """跑 fn，返回 (结果, 比开始时多出来的 RSS 峰值 MB)"""
+    base = peak = rss_mb()
+    done = threading.Event()
+
+    def sample():
+        nonlocal peak
+        while not done.wait(0.02):
+            peak = max(peak, rss_mb())
+
+    t = threading.Thread(target=sample, daemon=True)
+    t.start()
+    try:
+        result = fn()
+    finally:
+        done.set()
+        t.join()
+    return result, round(max(peak, rss_mb()) - base, 1)
+
+
+def rows(n, students):
+    now = datetime.utcnow()
+    for i in range(n):
+        created = (now - timedelta(minutes=random.randrange(60 * 24 * 120))).isoformat()
+        type_id, mistake = random.choice(MISTAKES)
+        unit, user = random.choice(UNITS), f"s{random.randrange(students)}"
+        question = f"第 {i} 题：下面这段 Java 代码输出什么？" + "for (int k = 0; k <= n; k++) sum += a[k];" * 3
+        yield (
+            created, unit, f"topic{i % 50}", question, "A", "B", "解析" * 40, mistake, "[]", user, created, type_id,
+            wrongbook.content_hash(user, created, unit, f"topic{i % 50}", question, "A", "B"),
+        )
+
+
+def use_db(path):
+    wrongbook.DB_PATH = Path(path)
+    wrongbook._canon = None  # 错因归一的缓存是按库加载的
+    wrongbook.init_db()
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rows", type=int, default=1_000_000)
+    ap.add_argument("--students", type=int, default=200)
+    ap.add_argument("--formats", nargs="+", default=wrongbook_io.formats())
+    args = ap.parse_args()
+    random.seed(3)
+    if "parquet" in args.formats:
+        wrongbook_io._pyarrow()  # pyarrow 本身占一百多 MB，先导入，不算进导出的内存增量
+
+    with tempfile.TemporaryDirectory() as tmp:
+        use_db(Path(tmp) / "source.db")
+        c = wrongbook._conn()
+        source = rows(args.rows, args.students)
+        while chunk := list(islice(source, 50_000)):
+            with c:
+                wrongbook.insert_entries(c, wrongbook.INSERT_COLUMNS, chunk)
+        print(f"{args.rows:,} rows, chunk {wrongbook_io._chunk_size()}, start RSS {rss_mb():.0f} MB")
+        print(f"{'format':>8} | {'export rows/s':>13} {'+MB':>6} {'file MB':>8} | "
+              f"{'import rows/s':>13} {'+MB':>6} | {'re-import rows/s':>16} {'dup':>9}")
+
+        for fmt in args.formats:
+            path = Path(tmp) / f"wrongbook.{fmt}"
+            use_db(Path(tmp) / "source.db")
+            exported, ex_mb = peak_rss(lambda: wrongbook_io.export_file(path, fmt))
+            use_db(Path(tmp) / f"target_{fmt}.db")
+            imported, im_mb = peak_rss(lambda: wrongbook_io.import_file(path, fmt))
+            again = wrongbook_io.import_file(path, fmt)
+            assert imported["inserted"] == args.rows, imported
+            assert again["inserted"] == 0 and again["duplicates"] == args.rows, again
+            print(f"{fmt:>8} | {exported['rows_per_s']:>13,} {ex_mb:>6} {path.stat().st_size / 2 ** 20:>8.1f} | "
+                  f"{imported['rows_per_s']:>13,} {im_mb:>6} | {again['rows_per_s']:>16,} {again['duplicates']:>9,}")
+            path.unlink()
+
+
+if __name__ == "__main__":
+    main()
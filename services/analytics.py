@@ -0,0 +1,62 @@
+"""
+错因分析看板的数据：只读 mistake_stats / mistake_trend 两张预聚合表（触发器随错题本增删改增量维护），
+不对 wrongbook 做 GROUP BY，错题本多大看板都一样快。
+
+页面缓存以 wrongbook.version() 为 key（进程内的版本号，写入提交后才变），数据没变就不查库。
+user_id 为 None 时看全班。
+"""
+from datetime import datetime, timedelta
+
+from services import db
+from services.wrongbook import DB_PATH, STAT_DIMS
+
+DIMS = [dim for dim, _ in STAT_DIMS]
+
+
+def _conn():
+    return db.connect(DB_PATH)
+
+
+def _scope(user_id):
+    return ("c", "") if user_id is None else ("u", user_id)
+
+
+def total(user_id=None) -> int:
+    # 按 unit 的计数加起来就是错题总数（unit 只有十来个取值）
+    with _conn() as c:
+        row = c.execute(
+            "SELECT COALESCE(SUM(n), 0) FROM mistake_stats WHERE scope=? AND user_id=? AND dim='unit'",
+            _scope(user_id),
+        ).fetchone()
+    return row[0]
+
+
+def breakdown(user_id=None, dim="mistake_type", limit=10):
+    """[(值, 次数)]，次数多的在前；错因按规范错因名显示，空值显示成“（未填）”"""
+    with _conn() as c:
+        rows = c.execute("""
+        SELECT COALESCE(t.name, s.key), s.n FROM mistake_stats s
+        LEFT JOIN mistake_types t ON s.dim = 'mistake_type' AND t.id = CAST(s.key AS INTEGER)
+        WHERE s.scope=? AND s.user_id=? AND s.dim=? AND s.n > 0
+        ORDER BY s.n DESC LIMIT ?
+        """, (*_scope(user_id), dim, limit)).fetchall()
+    return [(k or "（未填）", n) for k, n in rows]
+
+
+def trend(user_id=None, days=30):
+    """最近 days 天每天每个 unit 的错题数：[(day, unit, n)]"""
+    since = (datetime.utcnow() - timedelta(days=days - 1)).strftime("%Y-%m-%d")
+    with _conn() as c:
+        rows = c.execute("""
+        SELECT day, unit, n FROM mistake_trend WHERE scope=? AND user_id=? AND day >= ? AND n > 0
+        ORDER BY day
+        """, (*_scope(user_id), since)).fetchall()
+    return [(d, u or "（未填）", n) for d, u, n in rows]
+
+
+def dashboard(user_id=None, limit=10, days=30) -> dict:
+    """看板要的全部数据（可直接 st.cache_data，key 带上 wrongbook.version()）"""
+    data = {dim: breakdown(user_id, dim, limit) for dim in DIMS}
+    data["trend"] = trend(user_id, days)
+    data["total"] = total(user_id)
+    return data
@@ -1,11 +1,14 @@
 import hmac
 import hashlib
+import threading
+import time
 from datetime import datetime, timedelta, timezone
 from zoneinfo import ZoneInfo
-import streamlit as st
+
+from services.config import setting
 
 def _tz() -> ZoneInfo:
-    tzname = st.secrets.get("TIMEZONE", "UTC")
+    tzname = setting("TIMEZONE", "UTC")
     try:
         return ZoneInfo(tzname)
     except Exception:
@@ -29,7 +32,7 @@ def weekly_password(for_time: datetime | None = None, length: int = 10) -> str:
     HMAC_SHA256(seed, f"{year}-W{iso_week}") -> take digits/letters subset.
     Rotates at Monday 00:00 in TIMEZONE.
     """
-    seed = st.secrets.get("WEEKLY_PASSWORD_SEED", "")
+    seed = setting("WEEKLY_PASSWORD_SEED", "")
     if not seed:
         raise RuntimeError("Missing WEEKLY_PASSWORD_SEED in Streamlit secrets.")
 
@@ -55,11 +58,90 @@ def weekly_password(for_time: datetime | None = None, length: int = 10) -> str:
             break
     return "".join(out)
 
-def check_user_password(pw: str) -> bool:
-    return pw.strip() == weekly_password()
+# 本周密码和下次切换时间算一次缓存到切换时刻；secrets 每分钟最多重读一次（seed/时区改了也会重算）
+_cache_lock = threading.Lock()
+_cache = {"checked": float("-inf")}
+_RECHECK_SECONDS = 60
+
+def _current() -> tuple[str, datetime]:
+    with _cache_lock:
+        now = time.monotonic()
+        if now - _cache["checked"] >= _RECHECK_SECONDS or datetime.now(timezone.utc) >= _cache["until"]:
+            key = (setting("WEEKLY_PASSWORD_SEED", ""), setting("TIMEZONE", "UTC"))
+            if _cache.get("key") != key or datetime.now(timezone.utc) >= _cache["until"]:
+                until = next_rotation_time()
+                _cache.update(key=key, until=until, password=weekly_password(until - timedelta(days=1)))
+            _cache["checked"] = now
+        return _cache["password"], _cache["until"]
+
+def current_password() -> str:
+    """本周密码（缓存版，给登录校验和管理员面板用）"""
+    return _current()[0]
+
+def current_rotation_time() -> datetime:
+    """下次切换时间（缓存版）"""
+    return _current()[1]
+
+# -----------------------------
+# 暴力尝试限流：每个客户端连续失败 LOGIN_FREE_ATTEMPTS 次后开始锁定，
+# 锁定时长每多失败一次翻倍（LOGIN_LOCKOUT_BASE 秒起，最长 LOGIN_LOCKOUT_MAX）。
+# 锁定期间直接拒绝，不算密码；进程内存里一张小表，重启清零。
+# -----------------------------
+_attempts_lock = threading.Lock()
+_attempts = {}  # client -> [连续失败次数, 锁定到(monotonic), 最后一次尝试]
+_MAX_CLIENTS = 10000
+
+def lockout_remaining(client: str) -> float:
+    """client 还要等几秒才能再试（0 = 现在可以试）"""
+    with _attempts_lock:
+        entry = _attempts.get(client)
+        return max(entry[1] - time.monotonic(), 0.0) if entry else 0.0
+
+def _record(client: str, ok: bool):
+    now = time.monotonic()
+    with _attempts_lock:
+        if ok:
+            _attempts.pop(client, None)
+            return
+        if len(_attempts) >= _MAX_CLIENTS:
+            # 丢掉早就不再尝试的客户端
+            horizon = now - setting("LOGIN_LOCKOUT_MAX", 3600.0)
+            for k in [k for k, v in _attempts.items() if v[2] < horizon]:
+                del _attempts[k]
+        entry = _attempts.setdefault(client, [0, 0.0, now])
+        entry[0] += 1
+        entry[2] = now
+        over = entry[0] - setting("LOGIN_FREE_ATTEMPTS", 5)
+        if over >= 0:
+            lock = setting("LOGIN_LOCKOUT_BASE", 30.0) * 2 ** over
+            entry[1] = now + min(lock, setting("LOGIN_LOCKOUT_MAX", 3600.0))
 
-def check_admin_password(pw: str) -> bool:
-    admin = st.secrets.get("ADMIN_PASSWORD", "")
+def _attempt(verify, client: str) -> bool:
+    # 锁定中直接拒绝，连校验都不做
+    if lockout_remaining(client) > 0:
+        return False
+    ok = bool(verify())
+    _record(client, ok)
+    return ok
+
+def _check(expected, pw: str, client: str) -> bool:
+    return _attempt(lambda: hmac.compare_digest(pw.encode("utf-8"), expected().encode("utf-8")), client)
+
+def check_user_password(pw: str, client: str = "") -> bool:
+    return _check(current_password, pw.strip(), "user:" + client)
+
+def check_student_key(verify, user: str) -> bool:
+    """
+    个人口令：verify() 去库里核对（session_store.check_student_key）。失败按名字计入限流，
+    换着客户端猜同一个同学的口令也会被锁。
+    """
+    return _attempt(verify, "key:" + user)
+
+def _admin_password() -> str:
+    admin = setting("ADMIN_PASSWORD", "")
     if not admin:
         raise RuntimeError("Missing ADMIN_PASSWORD in Streamlit secrets.")
-    return pw == admin
+    return admin
+
+def check_admin_password(pw: str, client: str = "") -> bool:
+    return _check(_admin_password, pw, "admin:" + client)
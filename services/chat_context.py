@@ -0,0 +1,104 @@
+"""
+聊天上下文按 token 预算打包：
+
+- 从最新一轮往前装，装满 CHAT_CONTEXT_TOKENS 为止
+- 装不下的旧对话折叠进一段滚动摘要；摘要只在窗口溢出时重算，
+  而且一次折叠到只剩半个预算，后面几轮都不用再算
+- 单条消息本身就超预算（贴了整个 Java 文件）时保留头尾、省略中间
+"""
+from services import openai_client
+from services.config import setting
+from services.tokens import count_message_tokens, count_tokens
+
+SUMMARY_SYSTEM = (
+    "你在帮AP CSA家教压缩聊天记录。把已有摘要和新的对话合并成一段新摘要："
+    "保留学生问过的知识点、卡住的地方、老师给的结论和代码里的关键名字；不超过200字。只输出摘要。"
+)
+
+
+def new_state() -> dict:
+    """放在 session_state 里：chat[:upto] 已经折叠进 summary"""
+    return {"upto": 0, "summary": ""}
+
+
+def dump_state(chat, state: dict) -> dict:
+    """持久化用：upto 是列表下标，换成最后一条已折叠消息的 id（chat 里的消息带 id 时）"""
+    upto = state["upto"]
+    return {"summary": state["summary"], "summary_upto_id": chat[upto - 1].get("id", 0) if upto else 0}
+
+
+def restore_state(chat, saved: dict) -> dict:
+    """dump_state 的逆操作：chat 是重新从库里加载的最近几条"""
+    upto_id = saved.get("summary_upto_id", 0)
+    upto = sum(1 for m in chat if upto_id and m.get("id", 0) <= upto_id)
+    return {"upto": upto, "summary": saved.get("summary", "")}
+
+
+def _truncate(text: str, budget: int) -> str:
+    if count_tokens(text) <= budget:
+        return text
+    # 按比例保留开头 2/3、结尾 1/3（问题一般写在开头或结尾）
+    keep = max(int(len(text) * budget / count_tokens(text)), 1)
+    head = text[: keep * 2 // 3]
+    tail = text[len(text) - keep // 3:]
+    return f"{head}\n…（中间省略 {len(text) - len(head) - len(tail)} 字）…\n{tail}"
+
+
+def _summarize(summary: str, turns) -> str:
+    lines = [f"已有摘要：{summary or '（无）'}", "新的对话："]
+    lines += [f"{'学生' if m['role'] == 'user' else '老师'}：{_truncate(m['content'], 400)}" for m in turns]
+    return openai_client.generate_text(
+        [{"role": "system", "content": SUMMARY_SYSTEM}, {"role": "user", "content": "\n".join(lines)}],
+        model=setting("CHAT_SUMMARY_MODEL", "") or None,
+        temperature=0.2,
+        caller="summary",
+    ).strip()
+
+
+def build_messages(system: str, chat, state: dict, budget: int = None):
+    """
+    返回 (messages, info)。messages 可直接交给 openai_client；
+    info 里有本轮 prompt token 数、带了几条原文、是否重算了摘要。state 会被就地更新。
+    """
+    budget = budget or setting("CHAT_CONTEXT_TOKENS", 2000)
+    head = [{"role": "system", "content": system}]
+    upto = min(state["upto"], len(chat) - 1)  # 最新一条无论如何都要原文带上
+    recent = chat[upto:]
+    resummarized = False
+    if count_message_tokens(recent) > budget and len(recent) > 1:
+        # 窗口溢出：从后往前留到半个预算，其余折叠进摘要
+        costs = [count_message_tokens([m]) for m in recent]
+        keep, used = 1, costs[-1]
+        while keep < len(recent) and used + costs[-keep - 1] <= budget // 2:
+            keep += 1
+            used += costs[-keep]
+        fold_to = len(chat) - keep
+        try:
+            state["summary"] = _summarize(state["summary"], chat[upto:fold_to])
+            state["upto"] = fold_to
+            resummarized = True
+        except Exception:
+            pass  # 摘要失败就只丢弃旧对话，不影响这一轮回答
+        recent = chat[fold_to:]
+    if state["summary"]:
+        head.append({"role": "system", "content": "之前的对话摘要：" + state["summary"]})
+
+    # 还超的话从旧到新丢，最后一条超长就截断
+    left = budget - count_message_tokens(head)
+    msgs = []
+    for m in reversed(recent):
+        cost = count_message_tokens([m])
+        if cost > left:
+            if not msgs:
+                msgs.append({"role": m["role"], "content": _truncate(m["content"], max(left - 24, 50))})
+            break
+        msgs.append({"role": m["role"], "content": m["content"]})
+        left -= cost
+    msgs.reverse()
+    messages = head + msgs
+    return messages, {
+        "prompt_tokens": count_message_tokens(messages),
+        "turns_sent": len(msgs),
+        "turns_summarized": state["upto"],
+        "resummarized": resummarized,
+    }
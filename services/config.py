@@ -0,0 +1,18 @@
+import os
+
+import streamlit as st
+
+
+def setting(name, default):
+    """先读 Streamlit secrets，再读环境变量，按 default 的类型转换"""
+    try:
+        value = st.secrets.get(name)
+    except Exception:
+        value = None
+    if value is None:
+        value = os.getenv(name)
+    if value is None:
+        return default
+    if isinstance(default, bool) and isinstance(value, str):
+        return value.strip().lower() not in ("0", "false", "no", "off", "")
+    return type(default)(value)
@@ -0,0 +1,260 @@
+"""
+SQLite 连接管理：
+- 进程内连接池：Streamlit 每次 rerun 都换一个新的 script-runner 线程，连接不能跟着线程开关。
+  线程第一次用某个库时从池里借一条空闲连接（没有才新开），线程结束时还回池里，
+  PRAGMA、注册的函数和预编译语句缓存都留着给下一次 rerun 用
+- WAL 日志 + synchronous=NORMAL：读写互不阻塞，提交不再每次 fsync 主库
+- busy_timeout：偶发写锁冲突时等待而不是立刻报 "database is locked"
+- BatchWriter：并发会话的插入排队，由一个写线程合并成一个事务提交（group commit）
+- 每条连接都注册 fts_segment()（全文索引的触发器要用）和 text_unpack()（读压缩存储的长文本）
+"""
+import queue
+import re
+import sqlite3
+import threading
+import time
+import weakref
+import zlib
+from pathlib import Path
+
+BUSY_TIMEOUT_SECONDS = 5.0
+WRITER_CHECK_SECONDS = 1.0  # 提交者每隔这么久看一眼写线程还活着没有
+MAX_IDLE_CONNECTIONS = 16  # 每个库最多留这么多条空闲连接，多出来的直接关掉
+
+_local = threading.local()
+_idle = {}  # 库文件 -> 空闲连接
+_idle_lock = threading.Lock()
+
+_CJK = "[\u3400-\u9fff\uf900-\ufaff]"
+_CJK_RUN = re.compile(_CJK + "+")
+# segment_cjk 加的空格：紧挨着汉字的那一个（snippet 的 ** 高亮标记夹在中间也算），原文自带的空格不动
+_SEGMENT_SPACE = re.compile(rf"(?<={_CJK}) |(?<={_CJK}\*\*) | (?={_CJK})| (?=\*\*{_CJK})")
+
+
+def segment_cjk(text):
+    """
+    给每个汉字两边加空格，让 FTS5 的 unicode61 分词把汉字按单字切开
+    （否则一整段中文是一个词，搜“循环边界”搜不到“循环边界错误”）。英文单词不受影响。
+    """
+    # 按连续的一段汉字整体替换，比逐字用模板替换快好几倍（导入时全文索引触发器每行都要调）
+    return _CJK_RUN.sub(lambda m: " " + " ".join(m.group()) + " ", text) if isinstance(text, str) else text
+
+
+def unsegment_cjk(text):
+    """
+    segment_cjk 的逆操作，用于把 snippet 还原成正常显示的文字：每个汉字两边各去掉一个空格
+    （两个汉字之间只有一个，是共用的），原文里汉字旁边本来就有的空格和英文之间的空格都留着。
+    """
+    return _SEGMENT_SPACE.sub("", text) if isinstance(text, str) else text
+
+
+# 压缩文本的格式：第一个字节是编码，后面是内容
+_RAW, _ZLIB = b"\x00", b"\x01"
+COMPRESS_MIN_BYTES = 64  # 太短的压不小，原样存
+
+
+def pack_text(text: str) -> bytes:
+    raw = text.encode("utf-8")
+    if len(raw) >= COMPRESS_MIN_BYTES:
+        packed = zlib.compress(raw, 6)
+        if len(packed) < len(raw):
+            return _ZLIB + packed
+    return _RAW + raw
+
+
+def unpack_text(data):
+    """pack_text 的逆操作；None 原样返回"""
+    if data is None:
+        return None
+    data = bytes(data)
+    body = zlib.decompress(data[1:]) if data[:1] == _ZLIB else data[1:]
+    return body.decode("utf-8")
+
+
+def _open(path) -> sqlite3.Connection:
+    # 连接会在线程之间传（还回池里再借给别的线程），同一时间只有一个线程在用
+    c = sqlite3.connect(str(path), timeout=BUSY_TIMEOUT_SECONDS, cached_statements=256, check_same_thread=False)
+    c.create_function("fts_segment", 1, segment_cjk, deterministic=True)
+    c.create_function("text_unpack", 1, unpack_text, deterministic=True)
+    c.execute("PRAGMA journal_mode=WAL")
+    c.execute("PRAGMA synchronous=NORMAL")
+    c.execute("PRAGMA foreign_keys=ON")
+    return c
+
+
+def _give_back(conns):
+    """线程结束时把它借的连接还回池里；没提交的事务先回滚"""
+    for key, c in conns.items():
+        try:
+            if c.in_transaction:
+                c.rollback()
+        except sqlite3.Error:
+            c.close()
+            continue
+        with _idle_lock:
+            idle = _idle.setdefault(key, [])
+            if len(idle) < MAX_IDLE_CONNECTIONS:
+                idle.append(c)
+                c = None
+        if c is not None:
+            c.close()
+    conns.clear()
+
+
+class _Borrowed:
+    """当前线程借着的连接；线程结束时随 threading.local 一起被回收，回收时把连接还回池里"""
+
+    def __init__(self):
+        self.conns = {}
+        weakref.finalize(self, _give_back, self.conns)
+
+
+def connect(path) -> sqlite3.Connection:
+    """当前线程对 path 的连接（从池里借，线程结束自动还）；SQL 用固定字符串 + 参数，sqlite3 会复用预编译语句"""
+    borrowed = getattr(_local, "borrowed", None)
+    if borrowed is None:
+        borrowed = _local.borrowed = _Borrowed()
+    key = str(Path(path).resolve())
+    c = borrowed.conns.get(key)
+    if c is None:
+        with _idle_lock:
+            idle = _idle.get(key)
+            c = idle.pop() if idle else None
+        c = borrowed.conns[key] = c or _open(path)
+    return c
+
+
+def close_thread_connections():
+    """关闭当前线程借着的和池里空闲的所有连接（切换库文件、改日志模式前用）"""
+    borrowed = getattr(_local, "borrowed", None)
+    conns = list(borrowed.conns.values()) if borrowed else []
+    if borrowed:
+        borrowed.conns.clear()
+    with _idle_lock:
+        for idle in _idle.values():
+            conns += idle
+        _idle.clear()
+    for c in conns:
+        c.close()
+
+
+class _Job:
+    __slots__ = ("sql", "params", "before", "done", "result", "error", "queued_at")
+
+    def __init__(self, sql, params, before=()):
+        self.sql = sql
+        self.params = params
+        self.before = before
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.queued_at = time.perf_counter()
+
+
+class BatchWriter:
+    """单写线程：攒一批插入（最多 max_batch 条或等 max_wait 秒）后一次 COMMIT"""
+
+    def __init__(self, path, max_batch=128, max_wait=0.005):
+        self.path = path
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._q = queue.Queue()
+        self.batches = 0
+        self.rows = 0
+        # 排队 + 等写锁 + 提交的耗时（提交者视角），以及事务本身（含 busy_timeout 等锁）的耗时
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.commit_total = 0.0
+        self.commit_max = 0.0
+        self.locked = 0  # 等了 busy_timeout 还拿不到锁的次数
+        self._thread = threading.Thread(target=self._run, name="sqlite-batch-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, sql, params, before=()):
+        """
+        排队写入并等待提交完成，返回 lastrowid；写失败时把异常抛回给调用方。
+        before 是要在同一个事务里先执行的 [(sql, params)]（比如先存被引用的行）。
+        """
+        job = _Job(sql, params, before)
+        self._q.put(job)
+        while not job.done.wait(WRITER_CHECK_SECONDS):
+            if not self._thread.is_alive():
+                raise RuntimeError(f"SQLite 写线程已退出（{self.path}），这次写入没有执行")
+        if job.error is not None:
+            raise job.error
+        return job.result
+
+    def _run(self):
+        c = _open(self.path)
+        while True:
+            jobs = [self._q.get()]
+            try:
+                while len(jobs) < self.max_batch:
+                    jobs.append(self._q.get(timeout=self.max_wait))
+            except queue.Empty:
+                pass
+            start = time.perf_counter()
+            try:
+                self._commit(c, jobs)
+            finally:
+                # 不管怎样都要叫醒提交者，写线程不能因为某一条写入卡死所有会话
+                now = time.perf_counter()
+                self.commit_total += now - start
+                self.commit_max = max(self.commit_max, now - start)
+                self.batches += 1
+                self.rows += len(jobs)
+                for job in jobs:
+                    self.wait_total += now - job.queued_at
+                    self.wait_max = max(self.wait_max, now - job.queued_at)
+                    job.done.set()
+
+    def _commit(self, c, jobs):
+        try:
+            with c:
+                for job in jobs:
+                    job.result = self._execute(c, job)
+        except Exception:
+            # 整批回滚后逐条重试，只让真正出错的那条失败（参数不对的 TypeError 等也一样交回给提交者）
+            for job in jobs:
+                try:
+                    with c:
+                        job.result = self._execute(c, job)
+                except Exception as e:
+                    self.locked += "locked" in str(e)
+                    job.error = e
+
+    @staticmethod
+    def _execute(c, job):
+        for sql, params in job.before:
+            c.execute(sql, params)
+        return c.execute(job.sql, job.params).lastrowid
+
+    def snapshot(self) -> dict:
+        return {
+            "rows": self.rows,
+            "batches": self.batches,
+            "avg_wait_ms": round(self.wait_total / self.rows * 1000, 2) if self.rows else 0.0,
+            "max_wait_ms": round(self.wait_max * 1000, 2),
+            "avg_commit_ms": round(self.commit_total / self.batches * 1000, 2) if self.batches else 0.0,
+            "max_commit_ms": round(self.commit_max * 1000, 2),
+            "locked": self.locked,
+        }
+
+
+_writers = {}
+_writers_lock = threading.Lock()
+
+
+def writer_stats() -> dict:
+    """各个库的批量写线程统计（库文件名 -> snapshot）"""
+    with _writers_lock:
+        return {Path(k).name: w.snapshot() for k, w in _writers.items()}
+
+
+def writer(path) -> BatchWriter:
+    key = str(Path(path).resolve())
+    with _writers_lock:
+        w = _writers.get(key)
+        if w is None or not w._thread.is_alive():  # 写线程意外退出了就换一个新的
+            w = _writers[key] = BatchWriter(path)
+        return w
@@ -0,0 +1,584 @@
+"""
+本地 Java 沙箱：“这段代码输出什么”的题，把题里的代码抽出来本地编译运行，拿真实输出当标准答案。
+
+- 可选功能：JAVA_SANDBOX=1 打开，机器上要有 JDK（java + javac，编译用 javax.tools）；没有就全部返回 None，照旧走 LLM
+- 常驻 JVM 工作进程池（JAVA_SANDBOX_WORKERS 个）：每个进程在内存里编译、用新的 ClassLoader 跑 main，
+  省掉每次启动 JVM 和 javac 的一两秒；跑满 JAVA_SANDBOX_MAX_RUNS 次换新进程
+- 限制：墙钟超时（超时直接杀掉进程，下次用到再起新的）、-Xmx 堆上限、输出截断、nice 降优先级，
+  外加 rlimit（CPU 时间、地址空间、打开文件数、不能写文件）；放进没有网卡的网络命名空间（unshare -rn），
+  unshare 用不了时默认不开沙箱（JAVA_SANDBOX_UNCONFINED=1 才放行）
+- 源码先去掉注释和点号两边的空白再查：出现文件/网络/进程/线程/反射等 API 的直接拒绝，用到的类型名
+  还得在白名单里（输出题常用的 java.lang / java.util 类型）；含 \\u 转义的也拒绝（javac 在分词前就会解码，正则看不出来）
+- main 在单独的线程里跑，跑完还有代码自己起的线程活着（可能往协议流或下一题的输出里写）就换掉这个进程
+- 结果按代码哈希存进 SQLite（java_runs 表），同一段代码只跑一次
+"""
+import hashlib
+import os
+import re
+import resource
+import select
+import shutil
+import stat
+import subprocess
+import tempfile
+import threading
+import time
+from pathlib import Path
+from queue import Empty, Queue
+
+from services import db
+from services.config import setting
+from services.wrongbook import DB_PATH
+
+# 学生题目用不到、又可能逃出沙箱或让结果不确定的 API：类型名之外，还有只靠方法名就能摸到的
+# （"".getClass().getClassLoader()、list.parallelStream() 会借公共线程池起线程）
+_FORBIDDEN = re.compile(
+    r"java\.(net|nio|io)|java\.lang\.(invoke|reflect|ref|management)|java\.util\.concurrent|\.reflect\b|"
+    r"\b(File\w*|PrintWriter|Paths|Socket\w*|URL\w*|Process\w*|Runtime|Thread\w*|Executor\w*|\w*ClassLoader\w*|"
+    r"CompletableFuture|ForkJoin\w*|Unsafe|native|forName|getModule|getDeclared\w*|getMethods?|getFields?|"
+    r"getConstructors?|newInstance|invoke\w*|setAccessible|parallel\w*)\b|"
+    r"System\s*\.\s*(exit|getenv|getProperty|setProperty|setIn|setOut|setErr|load\w*|console|inheritedChannel)"
+)
+# 白名单：输出题用得到的 java.lang / java.util 类型。代码里别的类型名（大写开头）一律不跑，照旧走 LLM
+_ALLOWED_TYPES = frozenset("""
+Object String StringBuilder StringBuffer CharSequence Character Integer Long Short Byte Double Float Boolean Number
+Math System Comparable Iterable Override FunctionalInterface SuppressWarnings Deprecated
+Arrays Collections Objects Optional Collection List ArrayList LinkedList Map HashMap TreeMap LinkedHashMap
+Set HashSet TreeSet LinkedHashSet Entry Iterator ListIterator Queue Deque ArrayDeque Stack PriorityQueue Comparator
+Exception RuntimeException Error ArithmeticException ArrayIndexOutOfBoundsException IndexOutOfBoundsException
+StringIndexOutOfBoundsException NullPointerException IllegalArgumentException IllegalStateException
+ClassCastException NumberFormatException UnsupportedOperationException ConcurrentModificationException
+NoSuchElementException StackOverflowError
+""".split())
+_TYPE_NAME = re.compile(r"(?<![\w$])([A-Z][\w$]*)")
+_QUALIFIED_TYPE = re.compile(r"(?<![\w$.])(?:[a-z_$][\w$]*\.)+([A-Z][\w$]*)")
+_DECLARED_TYPE = re.compile(r"\b(?:class|interface|enum|record)\s+([A-Za-z_$][\w$]*)")
+_CONSTANT = re.compile(r"[A-Z][A-Z0-9_]*")
+# 输出每次不一样的代码没有标准答案
+_NONDETERMINISTIC = re.compile(
+    r"Math\s*\.\s*random|\bRandom\b|currentTimeMillis|nanoTime|\bLocalDate|\bLocalTime|\bInstant\b|\.hashCode\s*\("
+)
+# 字符串/字符字面量原样保留（里面的 // 不是注释），注释换成空格
+_LITERAL_OR_COMMENT = re.compile(
+    r'(""".*?"""|"(?:\\.|[^"\\\n])*"|\'(?:\\.|[^\'\\\n])*\')|//[^\n]*|/\*.*?(?:\*/|$)', re.S
+)
+_DOT_SPACE = re.compile(r"\s*\.\s*")
+_FENCE = re.compile(r"```(?:java)?[^\n]*\n(.*?)```", re.S | re.I)
+_MCQ_LINE = re.compile(r"^\s*[A-Da-d]\s*[\.\)\:\：]\s*.+")
+_CODE_LINE = re.compile(r"[;{}]\s*(//.*)?$|^\s*(//|/\*|\*)")
+_OUTPUT_WORDS = re.compile(r"输出|打印|print|output|display", re.I)
+_PUBLIC_CLASS = re.compile(r"\bpublic\s+(?:final\s+)?class\s+([A-Za-z_]\w*)")
+_CLASS = re.compile(r"\bclass\s+([A-Za-z_]\w*)")
+_MAIN = re.compile(r"\bstatic\s+void\s+main\s*\(")
+# 顶层的类型声明和方法声明，其余语句放进 main
+_TYPE_DECL = re.compile(r"^\s*(public\s+|abstract\s+|final\s+)*(class|interface|enum)\b")
+_METHOD_DECL = re.compile(
+    r"^\s*(?:(?:public|private|protected|static|final)\s+)*"
+    r"(?!(?:if|else|for|while|do|switch|return|new|try|catch|throw)\b)"
+    r"[\w<>\[\], ]+\s+\w+\s*\([^;]*\)\s*(throws\s+[\w., ]+)?\s*\{?\s*$"
+)
+
+_stats_lock = threading.Lock()
+_stats = {"runs": 0, "cache_hits": 0, "compile_errors": 0, "runtime_errors": 0, "timeouts": 0, "rejected": 0,
+          "leaked_threads": 0, "workers_started": 0, "verified": 0, "overridden": 0, "run_ms_total": 0.0}
+
+
+def _conn():
+    return db.connect(DB_PATH)
+
+
+def init_cache():
+    with _conn() as c:
+        c.execute("""
+        CREATE TABLE IF NOT EXISTS java_runs (
+            code_hash TEXT PRIMARY KEY,
+            status TEXT NOT NULL,
+            stdout TEXT NOT NULL,
+            ms REAL,
+            created_at REAL
+        )
+        """)
+
+
+def _count(key, n=1):
+    with _stats_lock:
+        _stats[key] += n
+
+
+def stats() -> dict:
+    with _stats_lock:
+        out = dict(_stats)
+    out["avg_run_ms"] = round(out.pop("run_ms_total") / out["runs"], 1) if out["runs"] else 0.0
+    return out
+
+
+def _java_bin(name):
+    home = setting("JAVA_HOME", "")
+    path = Path(home) / "bin" / name if home else None
+    return str(path) if path and path.exists() else shutil.which(name)
+
+
+def enabled() -> bool:
+    if not setting("JAVA_SANDBOX", False) or _java_bin("java") is None or _java_bin("javac") is None:
+        return False
+    # 隔离不了网络就不跑（代码来自 LLM，学生能通过题目要求间接影响）
+    return bool(_sandbox_prefix()) or setting("JAVA_SANDBOX_UNCONFINED", False)
+
+
+# -----------------------------
+# 从题目里取代码、包成可运行的类
+# -----------------------------
+def extract_code(question: str):
+    """优先取 ``` 代码块；没有代码块时取选项之前、连续的像代码的几行"""
+    if not isinstance(question, str):
+        return None
+    m = _FENCE.search(question)
+    if m:
+        return m.group(1).strip() or None
+    block, best = [], []
+    for line in question.splitlines():
+        if _MCQ_LINE.match(line):
+            break
+        if _CODE_LINE.search(line) or (block and line.strip() and line[:1].isspace()):
+            block.append(line)
+        else:
+            if len(block) > len(best):
+                best = block
+            block = []
+    best = block if len(block) > len(best) else best
+    return "\n".join(best).strip() or None
+
+
+def is_output_question(question: str) -> bool:
+    code = extract_code(question)
+    stem = _FENCE.sub("", question or "")
+    return bool(code and "System.out" in code and _OUTPUT_WORDS.search(stem))
+
+
+def wrap(code: str):
+    """
+    返回 (类名, 完整源码)。已经是带 main 的类就原样用；否则顶层的方法放进 Main 类体（补上 static），
+    顶层的类/接口放在 Main 后面，其余语句放进 main。
+    """
+    imports = [L for L in code.splitlines() if L.strip().startswith("import ")]
+    body = [L for L in code.splitlines() if not L.strip().startswith("import ")]
+    header = "\n".join(["import java.util.*;", *imports])
+    if _MAIN.search(code):
+        m = _PUBLIC_CLASS.search(code) or _CLASS.search(code)
+        if m:
+            return m.group(1), header + "\n" + "\n".join(body)
+    types, methods, statements = [], [], []
+    depth = 0
+    target = statements
+    for line in body:
+        if depth == 0:
+            if _TYPE_DECL.match(line):
+                target = types
+                line = re.sub(r"^(\s*)public\s+", r"\1", line)  # 一个文件只能有一个 public 类
+            elif _METHOD_DECL.match(line):
+                target = methods
+                if not re.search(r"\bstatic\b", line):
+                    line = re.sub(r"^(\s*)", r"\1static ", line, count=1)
+            else:
+                target = statements
+        target.append(line)
+        depth = max(0, depth + line.count("{") - line.count("}"))
+    source = "\n".join([
+        header,
+        "public class Main {",
+        *methods,
+        "    public static void main(String[] args) throws Exception {",
+        *statements,
+        "    }",
+        "}",
+        *types,
+    ])
+    return "Main", source
+
+
+def _screen(code: str):
+    """
+    拒绝的原因（None 表示可以跑）：先去掉注释、合并点号两边的空白（java. io.File 也算 java.io），再查黑名单；
+    然后去掉字面量查白名单：大写开头的名字只能是白名单里的类型、代码自己声明的类/泛型参数或全大写常量，
+    带包名写的（java.lang.Thread）只认白名单——自己声明一个同名类挡不住全限定名。
+    \\uXXXX 转义一律拒绝：javac 分词前先解码，\\u0052untime 就是 Runtime。
+    """
+    if "\\u" in code:
+        return "rejected"
+    text = _DOT_SPACE.sub(".", _LITERAL_OR_COMMENT.sub(lambda m: m.group(1) or " ", code))
+    text = " ".join(text.split())
+    if _FORBIDDEN.search(text):
+        return "rejected"
+    if _NONDETERMINISTIC.search(text):
+        return "nondeterministic"
+    bare = _DOT_SPACE.sub(".", _LITERAL_OR_COMMENT.sub(" ", code))
+    declared = set(_DECLARED_TYPE.findall(bare))
+    if any(name not in _ALLOWED_TYPES for name in _QUALIFIED_TYPE.findall(bare)):
+        return "rejected"
+    for name in _TYPE_NAME.findall(bare):
+        if name not in _ALLOWED_TYPES and name not in declared and not _CONSTANT.fullmatch(name):
+            return "rejected"
+    return None
+
+
+def code_hash(source: str) -> str:
+    norm = "\n".join(L.rstrip() for L in source.replace("\r\n", "\n").split("\n")).strip()
+    return hashlib.sha256(norm.encode("utf-8")).hexdigest()
+
+
+# -----------------------------
+# 常驻 JVM 工作进程
+# -----------------------------
+# 协议（stdin/stdout）：请求 "<字节数> <类名>\n<源码>"；回复 "<状态> <毫秒> <字节数>\n<输出>"
+WORKER_SOURCE = r"""
+import javax.tools.*;
+import java.io.*;
+import java.lang.reflect.*;
+import java.net.URI;
+import java.nio.charset.StandardCharsets;
+import java.util.*;
+
+public class SandboxWorker {
+    static final int MAX_OUT = 64 * 1024;
+
+    static class Source extends SimpleJavaFileObject {
+        final String code;
+        Source(String name, String code) {
+            super(URI.create("string:///" + name + ".java"), Kind.SOURCE);
+            this.code = code;
+        }
+        @Override public CharSequence getCharContent(boolean ignore) { return code; }
+    }
+
+    static class Bytes extends SimpleJavaFileObject {
+        final ByteArrayOutputStream out = new ByteArrayOutputStream();
+        Bytes(String name) { super(URI.create("bytes:///" + name + ".class"), Kind.CLASS); }
+        @Override public OutputStream openOutputStream() { return out; }
+    }
+
+    static class Capped extends OutputStream {
+        final ByteArrayOutputStream buf = new ByteArrayOutputStream();
+        boolean truncated;
+        @Override public void write(int b) {
+            if (buf.size() < MAX_OUT) buf.write(b); else truncated = true;
+        }
+    }
+
+    static String readLine(InputStream in) throws IOException {
+        StringBuilder sb = new StringBuilder();
+        int ch;
+        while ((ch = in.read()) != -1 && ch != '\n') sb.append((char) ch);
+        return ch == -1 && sb.length() == 0 ? null : sb.toString();
+    }
+
+    public static void main(String[] args) throws Exception {
+        DataInputStream in = new DataInputStream(new BufferedInputStream(new FileInputStream(FileDescriptor.in)));
+        OutputStream reply = new BufferedOutputStream(new FileOutputStream(FileDescriptor.out));
+        System.setIn(new ByteArrayInputStream(new byte[0]));
+        // 协议只走 reply；System.out/err 平时指向空流，漏网的线程写不进协议流
+        PrintStream idle = new PrintStream(OutputStream.nullOutputStream());
+        System.setOut(idle);
+        System.setErr(idle);
+        JavaCompiler javac = ToolProvider.getSystemJavaCompiler();
+        StandardJavaFileManager std = javac.getStandardFileManager(null, null, StandardCharsets.UTF_8);
+        String header;
+        while ((header = readLine(in)) != null) {
+            String[] parts = header.trim().split(" ");
+            byte[] src = new byte[Integer.parseInt(parts[0])];
+            in.readFully(src);
+            long t0 = System.nanoTime();
+            Map<String, Bytes> classes = new HashMap<>();
+            JavaFileManager fm = new ForwardingJavaFileManager<JavaFileManager>(std) {
+                @Override public JavaFileObject getJavaFileForOutput(
+                        Location loc, String name, JavaFileObject.Kind kind, FileObject sibling) {
+                    Bytes b = new Bytes(name);
+                    classes.put(name, b);
+                    return b;
+                }
+            };
+            StringWriter diag = new StringWriter();
+            Source source = new Source(parts[1], new String(src, StandardCharsets.UTF_8));
+            boolean ok = javac.getTask(diag, fm, null, Arrays.asList("-nowarn", "-proc:none", "-g:none"),
+                    null, Collections.singletonList(source)).call();
+            String status;
+            boolean leaked = false;
+            Capped out = new Capped();
+            if (!ok) {
+                status = "compile_error";
+                out.write(diag.toString().getBytes(StandardCharsets.UTF_8));
+            } else {
+                ClassLoader loader = new ClassLoader(SandboxWorker.class.getClassLoader()) {
+                    @Override protected Class<?> findClass(String name) throws ClassNotFoundException {
+                        Bytes b = classes.get(name);
+                        if (b == null) throw new ClassNotFoundException(name);
+                        byte[] code = b.out.toByteArray();
+                        return defineClass(name, code, 0, code.length);
+                    }
+                };
+                PrintStream capture = new PrintStream(out, true, "UTF-8");
+                System.setOut(capture);
+                Set<Thread> before = Thread.getAllStackTraces().keySet();
+                String[] result = {"ok"};
+                // main 单独一个线程跑，跑完好数有没有它自己起的、还活着的线程
+                Thread runner = new Thread(() -> {
+                    try {
+                        Method main = loader.loadClass(parts[1]).getMethod("main", String[].class);
+                        main.invoke(null, (Object) new String[0]);
+                    } catch (InvocationTargetException e) {
+                        result[0] = "runtime_error";
+                        capture.println(e.getCause());
+                    } catch (Throwable e) {
+                        result[0] = "runtime_error";
+                        capture.println(e);
+                    }
+                }, "sandbox-main");
+                runner.start();
+                runner.join();
+                status = result[0];
+                for (Thread t : Thread.getAllStackTraces().keySet()) {
+                    if (t.isAlive() && !before.contains(t)) leaked = true;
+                }
+                capture.flush();
+                System.setOut(idle);
+            }
+            // 还有线程活着：输出可能掺了它写的东西，不作数；Python 那边会换掉这个进程
+            byte[] body = leaked ? new byte[0] : out.buf.toByteArray();
+            double ms = (System.nanoTime() - t0) / 1e6;
+            reply.write(String.format(Locale.ROOT, "%s %.2f %d\n",
+                    leaked ? "leaked_thread" : out.truncated ? "output_limit" : status, ms,
+                    body.length).getBytes(StandardCharsets.UTF_8));
+            reply.write(body);
+            reply.flush();
+        }
+    }
+}
+"""
+
+_build_lock = threading.Lock()
+_netns_prefix = None
+
+
+def _check_private(path: Path):
+    """只信自己建的、别人写不了的目录/文件（否则别的本地用户可以事先放一个 SandboxWorker.class 进来）"""
+    st = path.lstat()
+    if stat.S_ISLNK(st.st_mode) or st.st_uid != os.getuid() or st.st_mode & 0o022:
+        raise RuntimeError(f"Java 沙箱目录不安全（不是本用户所有或别人可写）：{path}")
+
+
+def _worker_dir() -> Path:
+    """
+    编译好的 SandboxWorker.class 放在数据库旁边的 .java_sandbox/（0700）下，按源码哈希分目录，改了源码自动重新编译。
+    先编译到同级的临时目录再改名，别的进程不会读到编译了一半的文件。
+    """
+    base = Path(DB_PATH).resolve().parent / ".java_sandbox"
+    d = base / code_hash(WORKER_SOURCE)[:12]
+    with _build_lock:
+        base.mkdir(mode=0o700, exist_ok=True)
+        _check_private(base)
+        if not d.exists():
+            tmp = Path(tempfile.mkdtemp(prefix="build-", dir=base))
+            try:
+                (tmp / "SandboxWorker.java").write_text(WORKER_SOURCE, encoding="utf-8")
+                subprocess.run([_java_bin("javac"), "-encoding", "UTF-8", "SandboxWorker.java"], cwd=tmp,
+                               check=True, capture_output=True, timeout=120)
+                os.rename(tmp, d)
+            except OSError:
+                if not d.exists():
+                    raise
+            finally:
+                shutil.rmtree(tmp, ignore_errors=True)
+        for path in (d, *d.iterdir()):
+            _check_private(path)
+    return d
+
+
+def _sandbox_prefix() -> list:
+    """能用 unshare 就放进只有回环网卡的网络命名空间（不能联网）；探测一次"""
+    global _netns_prefix
+    if _netns_prefix is None:
+        prefix = []
+        if setting("JAVA_SANDBOX_NETNS", True) and shutil.which("unshare"):
+            try:
+                probe = subprocess.run(["unshare", "-rn", "true"], capture_output=True, timeout=5)
+                prefix = ["unshare", "-rn"] if probe.returncode == 0 else []
+            except (OSError, subprocess.SubprocessError):
+                pass
+        _netns_prefix = prefix
+    return _netns_prefix
+
+
+def _limit_child():
+    os.nice(10)  # 沙箱跑代码时让着页面
+    # 一个工作进程总共能用的 CPU 秒数（超了被 SIGXCPU 杀掉，下次起新的）、地址空间、打开文件数；不能写文件
+    cpu = setting("JAVA_SANDBOX_CPU_SECONDS", 120)
+    address_space = setting("JAVA_SANDBOX_AS_MB", 2048) * 2 ** 20
+    resource.setrlimit(resource.RLIMIT_CPU, (cpu, cpu))
+    resource.setrlimit(resource.RLIMIT_AS, (address_space, address_space))
+    resource.setrlimit(resource.RLIMIT_NOFILE, (128, 128))
+    resource.setrlimit(resource.RLIMIT_FSIZE, (0, 0))
+    resource.setrlimit(resource.RLIMIT_CORE, (0, 0))
+
+
+class _Worker:
+    def __init__(self):
+        cmd = [
+            *_sandbox_prefix(), _java_bin("java"),
+            f"-Xmx{setting('JAVA_SANDBOX_HEAP_MB', 64)}m", "-Xss4m", "-XX:MaxMetaspaceSize=96m",
+            # 压低 JVM 预留的虚拟内存，才放得进 RLIMIT_AS；不写 hsperfdata（RLIMIT_FSIZE 为 0）
+            "-XX:CompressedClassSpaceSize=64m", "-XX:ReservedCodeCacheSize=32m", "-XX:-UsePerfData",
+            "-XX:+UseSerialGC", "-XX:TieredStopAtLevel=1", "-Xshare:auto", "-Djava.awt.headless=true",
+            "-cp", str(_worker_dir()), "SandboxWorker",
+        ]
+        self.proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                                     preexec_fn=_limit_child, cwd=tempfile.gettempdir())
+        self.runs = 0
+        _count("workers_started")
+
+    def _read(self, n, deadline) -> bytes:
+        fd = self.proc.stdout.fileno()
+        out = b""
+        while len(out) < n:
+            left = deadline - time.monotonic()
+            if left <= 0 or not select.select([fd], [], [], left)[0]:
+                raise TimeoutError
+            chunk = os.read(fd, n - len(out))
+            if not chunk:
+                raise EOFError
+            out += chunk
+        return out
+
+    def _read_line(self, deadline) -> str:
+        line = b""
+        while not line.endswith(b"\n"):
+            line += self._read(1, deadline)
+        return line.decode("utf-8")
+
+    def run(self, class_name, source, timeout):
+        data = source.encode("utf-8")
+        self.proc.stdin.write(f"{len(data)} {class_name}\n".encode("utf-8") + data)
+        self.proc.stdin.flush()
+        # 新进程第一次还要加载编译器，多给几秒
+        deadline = time.monotonic() + timeout + (setting("JAVA_SANDBOX_STARTUP", 10.0) if self.runs == 0 else 0)
+        status, ms, n = self._read_line(deadline).split()
+        self.runs += 1
+        return status, self._read(int(n), deadline).decode("utf-8", "replace"), float(ms)
+
+    def kill(self):
+        self.proc.kill()
+        self.proc.wait()
+
+
+_pool = Queue()
+_pool_lock = threading.Lock()
+_pool_size = 0
+
+
+def _acquire():
+    """空闲的取一个；都忙且没到上限就新起一个；否则等别人用完"""
+    global _pool_size
+    while True:
+        try:
+            return _pool.get_nowait()
+        except Empty:
+            pass
+        with _pool_lock:
+            if _pool_size < setting("JAVA_SANDBOX_WORKERS", 2):
+                _pool_size += 1
+                break
+        try:
+            return _pool.get(timeout=0.2)  # 超时再看一眼：用完被换掉的进程不会放回池子
+        except Empty:
+            continue
+    try:
+        return _Worker()
+    except Exception:
+        with _pool_lock:
+            _pool_size -= 1
+        raise
+
+
+def _release(worker, broken=False):
+    global _pool_size
+    if broken or worker.runs >= setting("JAVA_SANDBOX_MAX_RUNS", 200) or worker.proc.poll() is not None:
+        worker.kill()
+        with _pool_lock:
+            _pool_size -= 1
+    else:
+        _pool.put(worker)
+
+
+def warm_up():
+    """预先起好工作进程并跑一段代码（JIT/编译器热身），后台线程里调"""
+    if enabled():
+        run_snippet('System.out.println("ok");')
+
+
+def run_snippet(code: str):
+    """
+    编译运行一段代码，返回 {"status", "stdout", "ms", "cached"}；没开沙箱返回 None。
+    status：ok / compile_error / runtime_error / output_limit / timeout / leaked_thread / rejected / nondeterministic。
+    """
+    if not enabled() or not code:
+        return None
+    verdict = _screen(code)
+    if verdict is not None:
+        if verdict == "rejected":
+            _count("rejected")
+        return {"status": verdict, "stdout": "", "ms": 0.0, "cached": False}
+    class_name, source = wrap(code)
+    key = code_hash(source)
+    row = _conn().execute("SELECT status, stdout, ms FROM java_runs WHERE code_hash=?", (key,)).fetchone()
+    if row:
+        _count("cache_hits")
+        return {"status": row[0], "stdout": row[1], "ms": row[2], "cached": True}
+
+    worker = _acquire()
+    broken = False
+    try:
+        status, stdout, ms = worker.run(class_name, source, setting("JAVA_SANDBOX_TIMEOUT", 3.0))
+        broken = status == "leaked_thread"  # 代码起的线程还活着，这个进程不能再接下一题
+    except (TimeoutError, EOFError, OSError, ValueError):
+        # 死循环、爆内存、进程挂了：杀掉换新的，结果不缓存
+        broken = True
+        _count("timeouts")
+        return {"status": "timeout", "stdout": "", "ms": 0.0, "cached": False}
+    finally:
+        _release(worker, broken)
+    _count("runs")
+    _count("run_ms_total", ms)
+    if status in ("compile_error", "runtime_error", "leaked_thread"):
+        _count(status + "s")
+    db.writer(DB_PATH).submit(
+        "INSERT OR REPLACE INTO java_runs (code_hash, status, stdout, ms, created_at) VALUES (?, ?, ?, ?, ?)",
+        (key, status, stdout, ms, time.time()),
+    )
+    return {"status": status, "stdout": stdout, "ms": ms, "cached": False}
+
+
+def _norm_output(text: str) -> str:
+    # 选项里多行输出常被写成一行、或者加了引号
+    return " ".join(str(text).strip().strip("`\"'").split())
+
+
+def answer_from_output(options: dict, stdout: str):
+    """真实输出和哪个选项一致（忽略空白差异）就返回哪个字母；没有或不唯一返回 None"""
+    want = _norm_output(stdout)
+    hits = [k for k, v in options.items() if _norm_output(v) == want]
+    return hits[0] if len(hits) == 1 else None
+
+
+def verified_answer_key(question: str, options: dict, answer_key=None):
+    """
+    “这段代码输出什么”的选择题：本地跑一遍，输出对上哪个选项就以哪个为准（LLM 给的答案可能算错）。
+    没开沙箱、不是输出题、没跑通或对不上唯一选项时，原样返回 answer_key。
+    """
+    if not enabled() or not is_output_question(question):
+        return answer_key
+    result = run_snippet(extract_code(question))
+    key = answer_from_output(options, result["stdout"]) if result and result["status"] == "ok" else None
+    if key is None:
+        return answer_key
+    _count("verified")
+    if key != answer_key:
+        _count("overridden")  # LLM 给的答案和真实输出不一致
+    return key
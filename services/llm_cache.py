@@ -0,0 +1,133 @@
+"""
+Prompt -> 回复的内容寻址缓存。
+
+两层：进程内 LRU（最近用过的 N 条）+ SQLite 磁盘层（放在 wrongbook.db 旁边），
+key = sha256(model + 规范化后的 messages + temperature)。
+磁盘层按 TTL 过期，总大小超过上限时按最久未命中淘汰。
+"""
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+def _normalize_content(content):
+    if not isinstance(content, str):
+        return content
+    # 统一换行、去掉行尾空白和首尾空行；行首缩进保留（代码题里有意义）
+    lines = [L.rstrip() for L in content.replace("\r\n", "\n").split("\n")]
+    return "\n".join(lines).strip()
+
+
+def make_key(model: str, messages, temperature) -> str:
+    norm = [
+        {"role": str(m.get("role", "")).strip().lower(), "content": _normalize_content(m.get("content", ""))}
+        for m in messages
+    ]
+    payload = json.dumps(
+        {"model": model, "messages": norm, "temperature": round(float(temperature), 3)},
+        ensure_ascii=False,
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class PromptCache:
+    def __init__(self, path, mem_items=512, ttl_seconds=7 * 24 * 3600, max_bytes=50 * 1024 * 1024):
+        self.mem_items = mem_items
+        self.ttl = ttl_seconds
+        self.max_bytes = max_bytes
+        self._mem = OrderedDict()  # key -> (created_at, value)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(path), check_same_thread=False, timeout=10)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("""
+        CREATE TABLE IF NOT EXISTS llm_cache (
+            key TEXT PRIMARY KEY,
+            model TEXT,
+            value TEXT,
+            size INTEGER,
+            created_at REAL,
+            last_hit REAL
+        )
+        """)
+        self._db.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_last_hit ON llm_cache(last_hit)")
+        self._db.commit()
+        self._puts = 0
+        self.stats = {"mem_hits": 0, "disk_hits": 0, "misses": 0, "puts": 0, "evicted": 0}
+
+    def _remember(self, key, created_at, value):
+        self._mem[key] = (created_at, value)
+        self._mem.move_to_end(key)
+        while len(self._mem) > self.mem_items:
+            self._mem.popitem(last=False)
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            hit = self._mem.get(key)
+            if hit and now - hit[0] < self.ttl:
+                self._mem.move_to_end(key)
+                self.stats["mem_hits"] += 1
+                return hit[1]
+            row = self._db.execute(
+                "SELECT value, created_at FROM llm_cache WHERE key=? AND created_at>?",
+                (key, now - self.ttl),
+            ).fetchone()
+            if row is None:
+                self._mem.pop(key, None)
+                self.stats["misses"] += 1
+                return None
+            self._db.execute("UPDATE llm_cache SET last_hit=? WHERE key=?", (now, key))
+            self._db.commit()
+            self._remember(key, row[1], row[0])
+            self.stats["disk_hits"] += 1
+            return row[0]
+
+    def put(self, key, model, value):
+        now = time.time()
+        with self._lock:
+            self._remember(key, now, value)
+            self._db.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, model, value, size, created_at, last_hit) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, model, value, len(value.encode("utf-8")), now, now),
+            )
+            self._db.commit()
+            self.stats["puts"] += 1
+            self._puts += 1
+            if self._puts % 50 == 0:
+                self._evict(now)
+
+    def _evict(self, now):
+        cur = self._db.execute("DELETE FROM llm_cache WHERE created_at<=?", (now - self.ttl,))
+        evicted = cur.rowcount
+        total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM llm_cache").fetchone()[0]
+        if total > self.max_bytes:
+            # 按最久未命中的顺序删，直到降到上限的 90%
+            target = total - int(self.max_bytes * 0.9)
+            freed = 0
+            doomed = []
+            for key, size in self._db.execute("SELECT key, size FROM llm_cache ORDER BY last_hit"):
+                doomed.append((key,))
+                freed += size
+                if freed >= target:
+                    break
+            self._db.executemany("DELETE FROM llm_cache WHERE key=?", doomed)
+            evicted += len(doomed)
+            for (key,) in doomed:
+                self._mem.pop(key, None)
+        self._db.commit()
+        self.stats["evicted"] += evicted
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            rows, size = self._db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM llm_cache").fetchone()
+            out = dict(self.stats)
+            lookups = out["mem_hits"] + out["disk_hits"] + out["misses"]
+            out["hit_rate"] = round((out["mem_hits"] + out["disk_hits"]) / lookups, 3) if lookups else 0.0
+            out["mem_items"] = len(self._mem)
+            out["disk_items"] = rows
+            out["disk_mb"] = round(size / 1024 / 1024, 2)
+            return out
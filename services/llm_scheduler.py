@@ -0,0 +1,167 @@
+"""
+出站 LLM 请求的准入控制。
+
+- 两个令牌桶：每分钟请求数（RPM）和每分钟 token 数（TPM）
+- 有界优先队列：学生在等的请求（判题/聊天）排在后台补题前面；队列满或等太久直接报 LLMBusyError
+- 收到 429 时全体暂停一段时间（优先用 Retry-After），并把速率减半；之后每次成功慢慢恢复
+"""
+import heapq
+import itertools
+import threading
+import time
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BATCH = 5  # 老师批量出题：在等，但量大，排在学生后面
+PRIORITY_BACKGROUND = 10
+
+# 排队等待时间直方图的桶边界（秒）
+WAIT_BUCKETS = (0.01, 0.1, 0.5, 1, 2, 5, 10, 30)
+
+
+class LLMBusyError(RuntimeError):
+    """排队的请求太多，或等了太久还没轮到"""
+
+
+class TokenBucket:
+    """每分钟 per_minute 个令牌，最多攒 burst 个；per_minute <= 0 表示不限"""
+
+    def __init__(self, per_minute, burst=None):
+        self.per_minute = per_minute
+        self.capacity = burst or per_minute
+        self.level = self.capacity
+        self._ts = time.monotonic()
+
+    def _refill(self, now, factor):
+        self.level = min(self.capacity, self.level + (now - self._ts) * self.per_minute * factor / 60)
+        self._ts = now
+
+    def wait_time(self, n, now, factor=1.0) -> float:
+        """还要等几秒才能拿到 n 个令牌（超过桶容量的按容量算，不然永远等不到）"""
+        if self.per_minute <= 0:
+            return 0.0
+        self._refill(now, factor)
+        need = min(n, self.capacity) - self.level
+        return max(need, 0) * 60 / (self.per_minute * factor)
+
+    def take(self, n):
+        if self.per_minute > 0:
+            self.level -= n  # 可以是负数：实际用量超过预估时先记账，后面的请求多等一会儿
+
+
+class Scheduler:
+    def __init__(self, rpm=500, tpm=200_000, max_queue=200, queue_timeout=60.0,
+                 min_factor=0.1, recover_step=0.02, pause_base=1.0, pause_max=30.0, burst_seconds=6):
+        # 桶容量只攒 burst_seconds 秒的量：上游一般按更短的窗口限流，一分钟的量一次放出去必然 429
+        self.requests = TokenBucket(rpm, burst=max(1, rpm * burst_seconds // 60))
+        self.tokens = TokenBucket(tpm, burst=max(1, tpm * burst_seconds // 60))
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.min_factor = min_factor
+        self.recover_step = recover_step
+        self.pause_base = pause_base
+        self.pause_max = pause_max
+        self.factor = 1.0  # 当前速率 = 配置速率 * factor，429 时减半
+        self.paused_until = 0.0
+        self._strikes = 0  # 连续 429 次数
+        self._cond = threading.Condition()
+        self._heap = []
+        self._seq = itertools.count()
+        self.admitted = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.rate_limited = 0
+        self.max_depth = 0
+        self.wait_sum = {PRIORITY_INTERACTIVE: 0.0, PRIORITY_BACKGROUND: 0.0}
+        self.wait_count = {PRIORITY_INTERACTIVE: 0, PRIORITY_BACKGROUND: 0}
+        self.wait_hist = [0] * (len(WAIT_BUCKETS) + 1)
+
+    def acquire(self, priority=PRIORITY_INTERACTIVE, tokens=0):
+        """阻塞到轮到自己并且令牌够用为止；返回排队等了几秒"""
+        start = time.monotonic()
+        deadline = start + self.queue_timeout
+        with self._cond:
+            if len(self._heap) >= self.max_queue:
+                self.rejected += 1
+                raise LLMBusyError("too many LLM requests queued")
+            entry = (priority, next(self._seq))
+            heapq.heappush(self._heap, entry)
+            self.max_depth = max(self.max_depth, len(self._heap))
+            try:
+                while True:
+                    now = time.monotonic()
+                    wait = None  # 不在队首：等别人出队时的通知
+                    if self._heap[0] == entry:
+                        wait = max(
+                            self.paused_until - now,
+                            self.requests.wait_time(1, now, self.factor),
+                            self.tokens.wait_time(tokens, now, self.factor),
+                        )
+                        if wait <= 0:
+                            self.requests.take(1)
+                            self.tokens.take(tokens)
+                            break
+                    if now >= deadline:
+                        self.timeouts += 1
+                        raise LLMBusyError("waited too long for an LLM request slot")
+                    self._cond.wait(deadline - now if wait is None else min(wait, deadline - now))
+            finally:
+                # 正常出队和异常退出都要把自己从堆里拿掉，并叫醒下一个
+                if entry in self._heap:
+                    self._heap.remove(entry)
+                    heapq.heapify(self._heap)
+                self._cond.notify_all()
+            waited = time.monotonic() - start
+            self._observe_wait(priority, waited)
+            self.admitted += 1
+            return waited
+
+    def _observe_wait(self, priority, seconds):
+        i = 0
+        while i < len(WAIT_BUCKETS) and seconds > WAIT_BUCKETS[i]:
+            i += 1
+        self.wait_hist[i] += 1
+        key = PRIORITY_INTERACTIVE if priority <= PRIORITY_INTERACTIVE else PRIORITY_BACKGROUND
+        self.wait_sum[key] += seconds
+        self.wait_count[key] += 1
+
+    def settle(self, estimated, actual):
+        """请求结束后按实际 token 用量补扣/退还预估差额"""
+        if actual:
+            with self._cond:
+                self.tokens.take(actual - estimated)
+
+    def on_success(self):
+        with self._cond:
+            self._strikes = 0
+            self.factor = min(1.0, self.factor + self.recover_step)
+
+    def on_rate_limited(self, retry_after=None):
+        """收到 429：所有排队的请求一起暂停，速率减半"""
+        with self._cond:
+            self.rate_limited += 1
+            self._strikes += 1
+            self.factor = max(self.min_factor, self.factor / 2)
+            self.requests.level = min(self.requests.level, 0)  # 攒下的突发额度作废
+            pause = retry_after if retry_after else min(self.pause_max, self.pause_base * 2 ** (self._strikes - 1))
+            self.paused_until = max(self.paused_until, time.monotonic() + pause)
+            self._cond.notify_all()
+
+    def snapshot(self):
+        with self._cond:
+            labels = [f"<={b}s" for b in WAIT_BUCKETS] + [f">{WAIT_BUCKETS[-1]}s"]
+            avg = {
+                name: round(self.wait_sum[p] / self.wait_count[p], 3) if self.wait_count[p] else 0.0
+                for name, p in (("interactive", PRIORITY_INTERACTIVE), ("background", PRIORITY_BACKGROUND))
+            }
+            return {
+                "queue_depth": len(self._heap),
+                "max_queue_depth": self.max_depth,
+                "admitted": self.admitted,
+                "rejected": self.rejected,
+                "timeouts": self.timeouts,
+                "rate_limited_429": self.rate_limited,
+                "rate_factor": round(self.factor, 3),
+                "paused_for_s": round(max(self.paused_until - time.monotonic(), 0.0), 2),
+                "avg_wait_s": avg,
+                "wait_hist": dict(zip(labels, self.wait_hist)),
+            }
@@ -0,0 +1,121 @@
+"""
+错因类型归一：LLM 给的 mistake_type 是自由文本（"off-by-one"、"循环边界错误"、"loop bound error"…），
+这里把它们映射到一小组规范错因上，纯本地计算、不联网：
+
+- 规范化：NFKC（全角转半角）+ 小写 + 去标点空白
+- 切词：英文单词 + 英文字符 3-gram + 汉字单字和 2-gram
+- 相似度：TF-IDF 加权余弦，候选只从倒排索引里取（共享至少一个特征的别名）
+
+跨语言的同义靠 SEED 里的别名表；别名表之外的新说法，和已有别名足够像就归进去，否则成为新的规范错因。
+只有非常像的说法才会记成新别名，避免别名一路串联漂移。
+表结构和持久化在 wrongbook 里，这个模块不碰数据库。
+"""
+import math
+import re
+import unicodedata
+from collections import defaultdict
+
+# 相似度低于这个就当成新的错因
+MATCH_THRESHOLD = 0.45
+# 近似命中的说法相似度到这个才记成别名（以后也拿它去匹配别的说法），否则只归类不记
+ALIAS_THRESHOLD = 0.8
+
+# 规范错因名 -> 别名（中英混合，写常见说法即可，相近的说法靠相似度匹配）
+SEED = {
+    "循环边界错误": ["off-by-one", "off by one error", "loop bound error", "loop boundary", "循环边界",
+                "循环次数错误", "边界条件错误", "差一错误", "fencepost error"],
+    "数组/列表越界": ["index out of bounds", "ArrayIndexOutOfBoundsException", "IndexOutOfBoundsException",
+                 "下标越界", "索引越界", "数组越界"],
+    "空指针": ["NullPointerException", "null pointer", "空指针异常", "对象未初始化"],
+    "整数除法截断": ["integer division", "int division truncation", "整数除法", "除法取整错误"],
+    "用==比较对象/字符串": ["== vs equals", "string comparison with ==", "equals误用", "字符串比较错误", "引用比较"],
+    "类型转换错误": ["casting error", "type cast error", "强制类型转换错误", "类型不匹配", "type mismatch"],
+    "运算符优先级": ["operator precedence", "优先级错误", "取模运算错误", "modulo error"],
+    "布尔逻辑/短路求值": ["boolean logic error", "short circuit evaluation", "短路求值", "布尔逻辑错误", "德摩根定律",
+                   "De Morgan"],
+    "遍历时删除元素": ["ArrayList remove while iterating", "遍历时删除", "remove跳过元素", "删除后下标移动",
+                "ConcurrentModificationException"],
+    "递归终止条件错误": ["recursion base case", "递归终止条件", "基线条件错误", "递归错误", "recursion error"],
+    "值传递与引用理解错误": ["pass by value", "值传递", "引用传递", "aliasing", "参数传递错误"],
+    "作用域/变量遮蔽": ["scope error", "variable shadowing", "作用域错误", "局部变量与成员变量混淆"],
+    "继承与多态理解错误": ["inheritance", "polymorphism", "method overriding", "方法重写", "多态", "继承",
+                   "super调用错误", "构造器调用顺序"],
+    "String方法用法错误": ["substring index", "String method misuse", "substring边界", "indexOf用法错误",
+                       "字符串方法错误"],
+    "静态与实例混淆": ["static vs instance", "静态方法调用实例变量", "static方法错误"],
+    "二维数组遍历错误": ["2D array traversal", "row major order", "二维数组行列混淆", "二维数组遍历"],
+    "代码追踪错误": ["code tracing error", "trace error", "追踪错误", "计算错误", "粗心"],
+    "概念理解错误": ["concept misunderstanding", "概念错误", "理解错误", "知识点不熟"],
+}
+
+_PUNCT = re.compile(r"[\s\W_]+", re.UNICODE)
+_CJK_RUN = re.compile(r"[㐀-鿿豈-﫿]+")
+_WORD = re.compile(r"[a-z0-9]+")
+
+
+def normalize(text) -> str:
+    """规范化后的别名 key：全角转半角、小写、去掉标点和空白"""
+    return _PUNCT.sub("", unicodedata.normalize("NFKC", str(text or "")).lower())
+
+
+def features(text) -> set:
+    """切词特征（对原文算，英文单词边界还在）"""
+    text = unicodedata.normalize("NFKC", str(text or "")).lower()
+    out = set()
+    for w in _WORD.findall(text):
+        out.add("w:" + w)
+    ascii_only = "".join(_WORD.findall(text))
+    out.update("t:" + ascii_only[i:i + 3] for i in range(len(ascii_only) - 2))
+    for run in _CJK_RUN.findall(text):
+        out.update("c:" + ch for ch in run)
+        out.update("c:" + run[i:i + 2] for i in range(len(run) - 1))
+    return out
+
+
+class Canonicalizer:
+    """别名 -> 规范错因 id 的内存索引；aliases 是 [(原文别名, type_id)]"""
+
+    def __init__(self, aliases=()):
+        self.exact = {}
+        self._feats = []  # [(type_id, {特征})]
+        self._postings = defaultdict(list)  # 特征 -> 下标
+        self._df = defaultdict(int)
+        for text, type_id in aliases:
+            self.add(text, type_id)
+
+    def add(self, text, type_id):
+        key = normalize(text)
+        if not key or key in self.exact:
+            return
+        self.exact[key] = type_id
+        feats = features(text)
+        idx = len(self._feats)
+        self._feats.append((type_id, feats))
+        for f in feats:
+            self._postings[f].append(idx)
+            self._df[f] += 1
+
+    def _idf(self, f):
+        return math.log((1 + len(self._feats)) / (1 + self._df.get(f, 0))) + 1
+
+    def match(self, text):
+        """返回 (type_id, 相似度)；完全同名（规范化后）相似度为 1，找不到返回 (None, 0)"""
+        key = normalize(text)
+        if not key:
+            return None, 0.0
+        if key in self.exact:
+            return self.exact[key], 1.0
+        q = {f: self._idf(f) for f in features(text)}
+        q_norm = math.sqrt(sum(w * w for w in q.values()))
+        candidates = {i for f in q for i in self._postings.get(f, ())}
+        best, best_score = None, 0.0
+        for i in candidates:
+            type_id, feats = self._feats[i]
+            dot = sum(q[f] * q[f] for f in feats if f in q)
+            norm = math.sqrt(sum(self._idf(f) ** 2 for f in feats))
+            score = dot / (q_norm * norm) if q_norm and norm else 0.0
+            if score > best_score:
+                best, best_score = type_id, score
+        if best_score < MATCH_THRESHOLD:
+            return None, best_score
+        return best, best_score
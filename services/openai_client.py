@@ -1,22 +1,516 @@
-import os
-import streamlit as st
-from openai import OpenAI
+import random
+import threading
+import time
 
-def get_client() -> OpenAI:
-    api_key = st.secrets.get("OPENAI_API_KEY") or os.getenv("OPENAI_API_KEY")
+from services.config import setting
+from services.llm_cache import PromptCache, make_key
+from services.llm_scheduler import PRIORITY_INTERACTIVE, Scheduler
+from services import telemetry
+from services.tokens import count_message_tokens
+from services.wrongbook import DB_PATH
+
+# openai SDK 导入要 0.5s 左右，放到第一次真正调用 LLM 时再导入（import 本模块很轻）
+
+
+def _retryable():
+    """可重试的错误：网络抖动 / 超时 / 429 / 5xx"""
+    from openai import APIConnectionError, APITimeoutError, InternalServerError, RateLimitError
+    return (APIConnectionError, APITimeoutError, RateLimitError, InternalServerError)
+
+
+# 延迟直方图的桶边界（秒），最后一个桶是 "> 60s"
+LATENCY_BUCKETS = (0.5, 1, 2, 5, 10, 20, 30, 60)
+
+
+def _bucket(seconds):
+    i = 0
+    while i < len(LATENCY_BUCKETS) and seconds > LATENCY_BUCKETS[i]:
+        i += 1
+    return i
+
+
+class _ClientStats:
+    """进程级计数器：HTTP 请求数、新建连接（握手）数、重试、延迟直方图"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.clients_built = 0
+            self.http_requests = 0
+            self.tcp_connects = 0
+            self.tls_handshakes = 0
+            self.retries = 0
+            self.errors = 0
+            self.calls = 0
+            self.latency_sum = 0.0
+            self.latency_hist = [0] * (len(LATENCY_BUCKETS) + 1)
+            self.streams = 0
+            self.ttft_sum = 0.0
+            self.ttft_hist = [0] * (len(LATENCY_BUCKETS) + 1)
+            self.flights = 0
+            self.coalesced = 0
+            self.coalesce_timeouts = 0
+
+    def incr(self, field, n=1):
+        with self._lock:
+            setattr(self, field, getattr(self, field) + n)
+
+    def observe_latency(self, seconds):
+        i = _bucket(seconds)
+        with self._lock:
+            self.calls += 1
+            self.latency_sum += seconds
+            self.latency_hist[i] += 1
+
+    def observe_ttft(self, seconds):
+        i = _bucket(seconds)
+        with self._lock:
+            self.streams += 1
+            self.ttft_sum += seconds
+            self.ttft_hist[i] += 1
+
+    def snapshot(self):
+        with self._lock:
+            reused = max(self.http_requests - self.tcp_connects, 0)
+            labels = [f"<={b}s" for b in LATENCY_BUCKETS] + [f">{LATENCY_BUCKETS[-1]}s"]
+            return {
+                "clients_built": self.clients_built,
+                "http_requests": self.http_requests,
+                "tcp_connects": self.tcp_connects,
+                "tls_handshakes": self.tls_handshakes,
+                "reuse_rate": round(reused / self.http_requests, 3) if self.http_requests else 0.0,
+                "retries": self.retries,
+                "errors": self.errors,
+                "calls": self.calls,
+                "avg_latency_s": round(self.latency_sum / self.calls, 3) if self.calls else 0.0,
+                "latency_hist": dict(zip(labels, self.latency_hist)),
+                "streams": self.streams,
+                "avg_ttft_s": round(self.ttft_sum / self.streams, 3) if self.streams else 0.0,
+                "ttft_hist": dict(zip(labels, self.ttft_hist)),
+                "flights": self.flights,
+                "coalesced": self.coalesced,  # 搭了别人在途请求的调用数
+                "coalesce_timeouts": self.coalesce_timeouts,
+            }
+
+
+_stats = _ClientStats()
+
+
+def _trace(event_name, info):
+    # httpcore 的 trace 回调：只有新建连接时才会出现 connect_tcp / start_tls 事件
+    if event_name == "connection.connect_tcp.complete":
+        _stats.incr("tcp_connects")
+    elif event_name == "connection.start_tls.complete":
+        _stats.incr("tls_handshakes")
+
+
+def _on_request(request):
+    _stats.incr("http_requests")
+    request.extensions["trace"] = _trace
+
+
+def _build_client(api_key: str, base_url: str):
+    import httpx
+    from openai import OpenAI
+
+    http_client = httpx.Client(
+        limits=httpx.Limits(
+            max_connections=setting("OPENAI_MAX_CONNECTIONS", 20),
+            max_keepalive_connections=setting("OPENAI_MAX_KEEPALIVE", 10),
+            keepalive_expiry=setting("OPENAI_KEEPALIVE_EXPIRY", 60.0),
+        ),
+        timeout=httpx.Timeout(
+            setting("OPENAI_READ_TIMEOUT", 60.0),
+            connect=setting("OPENAI_CONNECT_TIMEOUT", 5.0),
+        ),
+        event_hooks={"request": [_on_request]},
+    )
+    _stats.incr("clients_built")
+    # 重试由 _call_with_retries 统一处理，SDK 自带的关掉，避免重试次数相乘
+    return OpenAI(
+        api_key=api_key,
+        base_url=base_url or None,
+        http_client=http_client,
+        max_retries=0,
+    )
+
+
+_client_lock = threading.Lock()
+_client = None
+_client_key = None
+
+
+def get_client():
+    """进程内共享的 OpenAI client（线程安全）；secrets 里的 key/base_url 变了就重建"""
+    global _client, _client_key
+    api_key = setting("OPENAI_API_KEY", "")
     if not api_key:
         raise RuntimeError("Missing OPENAI_API_KEY. Add it to Streamlit secrets or env var.")
-    return OpenAI(api_key=api_key)
+    # OPENAI_BASE_URL 可指向本地假服务（benchmarks/fake_responses_server.py）做测试
+    key = (api_key, setting("OPENAI_BASE_URL", ""))
+    with _client_lock:
+        if _client is None or _client_key != key:
+            # 旧 client 不主动 close：其他会话可能还有请求在路上，交给 GC 回收
+            _client = _build_client(*key)
+            _client_key = key
+        return _client
+
+
+_scheduler_lock = threading.Lock()
+_scheduler = None
+
+
+def _get_scheduler() -> Scheduler:
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = Scheduler(
+                rpm=setting("LLM_RPM", 500),
+                tpm=setting("LLM_TPM", 200_000),
+                max_queue=setting("LLM_QUEUE_MAX", 200),
+                queue_timeout=setting("LLM_QUEUE_TIMEOUT", 60.0),
+            )
+        return _scheduler
+
 
-def generate_text(messages, model=None, temperature=0.4) -> str:
+def _estimate_tokens(messages) -> int:
+    # 输入本地粗估，输出按配置预留，结束后再按实际用量 settle
+    return count_message_tokens(messages) + setting("LLM_EST_OUTPUT_TOKENS", 600)
+
+
+def _retry_after(error):
+    try:
+        return float(error.response.headers.get("retry-after"))
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+
+def _call_with_retries(fn, priority=PRIORITY_INTERACTIVE, tokens=0):
+    """
+    每次尝试前先经调度器排队拿令牌；429 交给调度器做全局暂停+降速，
+    其他可重试错误指数退避 + 抖动。次数和退避参数可在 secrets/env 配置。
+    """
+    max_retries = setting("OPENAI_MAX_RETRIES", 2)
+    max_429 = setting("OPENAI_MAX_RATE_LIMIT_RETRIES", 5)
+    base = setting("OPENAI_BACKOFF_BASE", 0.5)
+    cap = setting("OPENAI_BACKOFF_MAX", 8.0)
+    from openai import RateLimitError
+
+    retryable = _retryable()
+    scheduler = _get_scheduler()
+    attempt = 0
+    limited = 0
+    while True:
+        scheduler.acquire(priority, tokens)
+        try:
+            result = fn()
+        except RateLimitError as e:
+            scheduler.on_rate_limited(_retry_after(e))
+            if limited >= max_429:
+                _stats.incr("errors")
+                raise
+            _stats.incr("retries")
+            limited += 1
+            continue
+        except retryable:
+            if attempt >= max_retries:
+                _stats.incr("errors")
+                raise
+            _stats.incr("retries")
+            time.sleep(min(cap, base * (2 ** attempt)) * random.uniform(0.5, 1.0))
+            attempt += 1
+            continue
+        scheduler.on_success()
+        return result
+
+
+def _usage_tokens(response) -> int:
+    usage = getattr(response, "usage", None)
+    return getattr(usage, "total_tokens", 0) or 0
+
+
+_cache_lock = threading.Lock()
+_cache = None
+
+
+def _get_cache() -> PromptCache:
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = PromptCache(
+                DB_PATH.with_name("llm_cache.db"),
+                mem_items=setting("LLM_CACHE_MEM_ITEMS", 512),
+                ttl_seconds=setting("LLM_CACHE_TTL_SECONDS", 7 * 24 * 3600),
+                max_bytes=setting("LLM_CACHE_MAX_MB", 50) * 1024 * 1024,
+            )
+        return _cache
+
+
+class _Flight:
+    """一次在途的 LLM 请求：领头的线程边收边 append，跟随的线程等结果或按顺序重放增量"""
+
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.parts = []
+        self.done = False
+        self.error = None
+
+    def append(self, delta):
+        with self.cond:
+            self.parts.append(delta)
+            self.cond.notify_all()
+
+    def finish(self, error=None):
+        with self.cond:
+            self.done = True
+            self.error = error
+            self.cond.notify_all()
+
+    def _wait(self, ready, timeout):
+        if not self.cond.wait_for(ready, timeout):
+            _stats.incr("coalesce_timeouts")
+            raise TimeoutError("waited too long for an identical in-flight LLM request")
+
+    def wait(self, timeout) -> str:
+        with self.cond:
+            self._wait(lambda: self.done, timeout)
+            if self.error is not None:
+                raise self.error
+            return "".join(self.parts)
+
+    def follow(self, timeout):
+        i = 0
+        while True:
+            with self.cond:
+                self._wait(lambda: self.done or len(self.parts) > i, timeout)
+                chunk = self.parts[i:]
+                i = len(self.parts)
+                if not chunk and self.done:
+                    if self.error is not None:
+                        raise self.error
+                    return
+            yield from chunk
+
+
+# 进程级 single-flight：同一个缓存 key 同时只发一个请求，所有会话线程共享
+_flights = {}
+_flights_lock = threading.Lock()
+
+
+def _join_flight(key):
+    """返回 (flight, 是否领头)；领头的负责真正请求，结束后必须调用 _land"""
+    with _flights_lock:
+        flight = _flights.get(key)
+        if flight is not None:
+            _stats.incr("coalesced")
+            return flight, False
+        flight = _flights[key] = _Flight()
+    _stats.incr("flights")
+    return flight, True
+
+
+def _land(key, flight, error=None):
+    # 先摘掉再通知：之后来的调用直接读缓存，不会再挂到一个已结束的 flight 上
+    with _flights_lock:
+        _flights.pop(key, None)
+    flight.finish(error)
+
+
+def cache_stats() -> dict:
+    return _get_cache().snapshot()
+
+
+def client_stats() -> dict:
+    return _stats.snapshot()
+
+
+def scheduler_stats() -> dict:
+    return _get_scheduler().snapshot()
+
+
+def reset_client_stats():
+    _stats.reset()
+
+
+def _usage(response):
+    usage = getattr(response, "usage", None)
+    return getattr(usage, "input_tokens", 0) or 0, getattr(usage, "output_tokens", 0) or 0
+
+
+def _log_call(caller, model, start, meta, error=None):
+    telemetry.record(
+        model, caller, time.perf_counter() - start,
+        prompt_tokens=meta.get("prompt_tokens", 0),
+        completion_tokens=meta.get("completion_tokens", 0),
+        ttft_s=meta.get("ttft"),
+        cache_hit=meta.get("cache_hit", False),
+        coalesced=meta.get("coalesced", False),
+        ok=error is None,
+    )
+
+
+def generate_text(messages, model=None, temperature=0.4, cache=True, priority=PRIORITY_INTERACTIVE,
+                  caller="other") -> str:
     """
     messages: list of {"role": "user"/"assistant"/"system", "content": "..."}
+    cache=False 时跳过读缓存（比如要一道全新的题），结果仍会写回缓存。
+    priority: 后台任务传 llm_scheduler.PRIORITY_BACKGROUND，排在学生的请求后面。
+    同时有相同请求在路上时不再重复发送，等那一个的结果（cache=False 的不合并）。
+    caller: 记账用的调用方（chat/generate/grade/drill…），每次调用都会写进 telemetry 账本。
+    """
+    model = model or setting("MODEL", "gpt-5.2")
+    meta = {}
+    start = time.perf_counter()
+    try:
+        text = _generate(messages, model, temperature, cache, priority, meta)
+    except Exception as e:
+        _log_call(caller, model, start, meta, e)
+        raise
+    _log_call(caller, model, start, meta)
+    return text
+
+
+def _generate(messages, model, temperature, cache, priority, meta) -> str:
+    key = make_key(model, messages, temperature)
+    if not cache:
+        return _request_text(messages, model, temperature, key, priority, meta)
+    hit = _get_cache().get(key)
+    if hit is not None:
+        meta["cache_hit"] = True
+        return hit
+    flight, leader = _join_flight(key)
+    if not leader:
+        meta["coalesced"] = True
+        return flight.wait(setting("LLM_SINGLEFLIGHT_TIMEOUT", 120.0))
+    try:
+        # 上一个 flight 可能刚落地，缓存里已经有了
+        text = _get_cache().get(key)
+        if text is None:
+            text = _request_text(messages, model, temperature, key, priority, meta)
+        else:
+            meta["cache_hit"] = True
+        flight.append(text)
+    except BaseException as e:
+        _land(key, flight, e)
+        raise
+    _land(key, flight)
+    return text
+
+
+def _request_text(messages, model, temperature, key, priority, meta) -> str:
+    client = get_client()
+    start = time.perf_counter()
+    tokens = _estimate_tokens(messages)
+    resp = _call_with_retries(
+        lambda: client.responses.create(
+            model=model,
+            input=messages,
+            temperature=temperature,
+        ),
+        priority,
+        tokens,
+    )
+    _stats.observe_latency(time.perf_counter() - start)
+    _get_scheduler().settle(tokens, _usage_tokens(resp))
+    meta["prompt_tokens"], meta["completion_tokens"] = _usage(resp)
+    text = resp.output_text
+    if text:
+        _get_cache().put(key, model, text)
+    return text
+
+
+def stream_text(messages, model=None, temperature=0.4, cache=True, priority=PRIORITY_INTERACTIVE,
+                caller="other"):
     """
+    generate_text 的流式版本：逐段 yield 文本增量，可直接交给 st.write_stream。
+    首个增量到达的耗时记为 time-to-first-token。命中缓存时整段一次性 yield。
+    相同请求已经在路上时，跟着它的增量重放，不另发请求（cache=False 的不合并）。
+    """
+    model = model or setting("MODEL", "gpt-5.2")
+    meta = {}
+    start = time.perf_counter()
+    error = None
+    try:
+        for chunk in _stream(messages, model, temperature, cache, priority, meta):
+            meta.setdefault("ttft", time.perf_counter() - start)
+            yield chunk
+    except BaseException as e:  # 包括调用方中途不读了（GeneratorExit）
+        error = e
+        raise
+    finally:
+        _log_call(caller, model, start, meta, error)
+
+
+def _stream(messages, model, temperature, cache, priority, meta):
+    key = make_key(model, messages, temperature)
+    if not cache:
+        yield from _request_stream(messages, model, temperature, key, None, priority, meta)
+        return
+    hit = _get_cache().get(key)
+    if hit is not None:
+        meta["cache_hit"] = True
+        yield hit
+        return
+    flight, leader = _join_flight(key)
+    if not leader:
+        meta["coalesced"] = True
+        yield from flight.follow(setting("LLM_SINGLEFLIGHT_TIMEOUT", 120.0))
+        return
+    error = RuntimeError("leading LLM stream was abandoned")  # 调用方中途不再读流时，跟随者也得结束
+    try:
+        hit = _get_cache().get(key)
+        if hit is not None:
+            meta["cache_hit"] = True
+            flight.append(hit)
+            yield hit
+        else:
+            yield from _request_stream(messages, model, temperature, key, flight, priority, meta)
+        error = None
+    except BaseException as e:
+        error = e
+        raise
+    finally:
+        _land(key, flight, error)
+
+
+def _request_stream(messages, model, temperature, key, flight, priority, meta):
     client = get_client()
-    model = model or st.secrets.get("MODEL", "gpt-5.2")
-    resp = client.responses.create(
-        model=model,
-        input=messages,
-        temperature=temperature,
+    start = time.perf_counter()
+    tokens = _estimate_tokens(messages)
+    # 只对“建立流”这一步重试；已经吐出部分文本后再重试会导致内容重复
+    stream = _call_with_retries(
+        lambda: client.responses.create(
+            model=model,
+            input=messages,
+            temperature=temperature,
+            stream=True,
+        ),
+        priority,
+        tokens,
     )
-    return resp.output_text
+    first = True
+    parts = []
+    try:
+        for event in stream:
+            if event.type == "response.output_text.delta":
+                if first:
+                    _stats.observe_ttft(time.perf_counter() - start)
+                    first = False
+                parts.append(event.delta)
+                if flight is not None:
+                    flight.append(event.delta)
+                yield event.delta
+            elif event.type == "response.completed":
+                _get_scheduler().settle(tokens, _usage_tokens(event.response))
+                meta["prompt_tokens"], meta["completion_tokens"] = _usage(event.response)
+            elif event.type in ("error", "response.failed"):
+                _stats.incr("errors")
+                raise RuntimeError(f"LLM stream failed: {event.type}")
+    finally:
+        stream.close()
+    _stats.observe_latency(time.perf_counter() - start)
+    if parts:
+        _get_cache().put(key, model, "".join(parts))
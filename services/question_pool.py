@@ -0,0 +1,259 @@
+"""
+预生成题库：每个 (unit, topic, difficulty) 一个桶，后台线程把桶补到目标水位。
+“生成新题”优先从桶里取（毫秒级），桶空了才现场调 LLM。
+同一个学生（viewer）看过的题记在 question_seen 里，不会再发给他。
+"""
+import hashlib
+import threading
+import time
+from datetime import datetime, timedelta
+
+import services.tutor_logic as tutor_logic
+from services import db
+from services.config import setting
+from services.llm_scheduler import PRIORITY_BACKGROUND
+from services.wrongbook import DB_PATH
+
+DEFAULT_DIFFICULTY = "easy"
+
+
+def _conn():
+    return db.connect(DB_PATH)
+
+
+def question_hash(question: str) -> str:
+    """题目内容哈希（忽略空白差异），去重用"""
+    norm = " ".join(question.split())
+    return hashlib.sha256(norm.encode("utf-8")).hexdigest()
+
+
+def init_pool():
+    with _conn() as c:
+        c.execute("""
+        CREATE TABLE IF NOT EXISTS question_pool (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            created_at TEXT,
+            unit TEXT,
+            topic TEXT,
+            difficulty TEXT,
+            question TEXT,
+            q_hash TEXT UNIQUE,
+            answer_key TEXT
+        )
+        """)
+        # 老库补列：没有答案的旧题照常发，判题时走 LLM
+        cols = [r[1] for r in c.execute("PRAGMA table_info(question_pool)")]
+        if "answer_key" not in cols:
+            c.execute("ALTER TABLE question_pool ADD COLUMN answer_key TEXT")
+        c.execute("CREATE INDEX IF NOT EXISTS idx_pool_bucket ON question_pool(unit, topic, difficulty, id)")
+        c.execute("""
+        CREATE TABLE IF NOT EXISTS question_seen (
+            viewer TEXT,
+            q_hash TEXT,
+            seen_at TEXT,
+            PRIMARY KEY (viewer, q_hash)
+        )
+        """)
+        # 需要补货的桶：每个 Unit 的默认桶 + 学生实际点过的 (unit, topic, difficulty)
+        c.execute("""
+        CREATE TABLE IF NOT EXISTS question_buckets (
+            unit TEXT,
+            topic TEXT,
+            difficulty TEXT,
+            last_request TEXT,
+            PRIMARY KEY (unit, topic, difficulty)
+        )
+        """)
+        c.executemany(
+            "INSERT OR IGNORE INTO question_buckets (unit, topic, difficulty, last_request) VALUES (?, '', ?, ?)",
+            [(u, DEFAULT_DIFFICULTY, datetime.utcnow().isoformat()) for u in tutor_logic.UNITS],
+        )
+        c.commit()
+
+
+def add_questions(unit, topic, difficulty, questions) -> int:
+    """
+    写入题库（按内容哈希去重），返回实际新增条数。
+    questions 里是 tutor_logic.generate_question 的结果 {"question", "answer_key"}，也可以是只有题面的字符串。
+    """
+    now = datetime.utcnow().isoformat()
+    rows = []
+    for item in questions:
+        if isinstance(item, str):
+            item = {"question": item, "answer_key": None}
+        q = item.get("question")
+        if isinstance(q, str) and tutor_logic.is_mcq(q):
+            rows.append((now, unit, topic, difficulty, q, question_hash(q), item.get("answer_key")))
+    with _conn() as c:
+        before = c.total_changes
+        c.executemany("""
+        INSERT OR IGNORE INTO question_pool (created_at, unit, topic, difficulty, question, q_hash, answer_key)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, rows)
+        c.commit()
+        return c.total_changes - before
+
+
+def _mark_seen(c, viewer, q_hash):
+    c.execute(
+        "INSERT OR IGNORE INTO question_seen (viewer, q_hash, seen_at) VALUES (?, ?, ?)",
+        (viewer, q_hash, datetime.utcnow().isoformat()),
+    )
+
+
+def pop_question(unit, topic="", difficulty=DEFAULT_DIFFICULTY, viewer=""):
+    """从桶里取一道该 viewer 没见过的题并移出题库，返回 {"question", "answer_key"}；桶里没有就返回 None"""
+    topic = topic.strip()
+    with _conn() as c:
+        c.execute("BEGIN IMMEDIATE")
+        c.execute("""
+        INSERT INTO question_buckets (unit, topic, difficulty, last_request) VALUES (?, ?, ?, ?)
+        ON CONFLICT(unit, topic, difficulty) DO UPDATE SET last_request=excluded.last_request
+        """, (unit, topic, difficulty, datetime.utcnow().isoformat()))
+        row = c.execute("""
+        SELECT id, question, q_hash, answer_key FROM question_pool p
+        WHERE unit=? AND topic=? AND difficulty=?
+          AND NOT EXISTS (SELECT 1 FROM question_seen s WHERE s.viewer=? AND s.q_hash=p.q_hash)
+        ORDER BY id LIMIT 1
+        """, (unit, topic, difficulty, viewer)).fetchone()
+        if row:
+            c.execute("DELETE FROM question_pool WHERE id=?", (row[0],))
+            _mark_seen(c, viewer, row[2])
+        c.commit()
+    _stats.incr("pool_hits" if row else "pool_misses")
+    return {"question": row[1], "answer_key": row[3]} if row else None
+
+
+def next_question(unit, topic="", difficulty=DEFAULT_DIFFICULTY, viewer=""):
+    """
+    练习页用：先从题库取，桶空了才现场生成（同样保证 viewer 没见过）。
+    返回 {"question", "answer_key"}；answer_key 为 None 时只能交给 LLM 判题。
+    """
+    item = pop_question(unit, topic, difficulty, viewer)
+    if item is not None:
+        return item
+    item = tutor_logic.generate_question(unit, topic, difficulty=difficulty)
+    with _conn() as c:
+        seen = c.execute(
+            "SELECT 1 FROM question_seen WHERE viewer=? AND q_hash=?", (viewer, question_hash(item["question"]))
+        ).fetchone()
+    if seen:
+        # 缓存里那道题这个学生已经做过了，要一道新的
+        item = tutor_logic.generate_question(unit, topic, difficulty=difficulty, fresh=True)
+    with _conn() as c:
+        _mark_seen(c, viewer, question_hash(item["question"]))
+        c.commit()
+    return item
+
+
+def pool_depth():
+    """每个桶当前的库存，给管理员面板用"""
+    with _conn() as c:
+        return c.execute("""
+        SELECT b.unit, b.topic, b.difficulty, COUNT(p.id)
+        FROM question_buckets b
+        LEFT JOIN question_pool p
+          ON p.unit=b.unit AND p.topic=b.topic AND p.difficulty=b.difficulty
+        GROUP BY b.unit, b.topic, b.difficulty
+        ORDER BY b.unit, b.topic, b.difficulty
+        """).fetchall()
+
+
+# -----------------------------
+# 后台补货
+# -----------------------------
+class _PoolStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.generated = 0
+        self.rejected = 0
+        self.failures = 0
+        self.refill_seconds = 0.0
+        self.pool_hits = 0
+        self.pool_misses = 0
+
+    def incr(self, field, n=1):
+        with self._lock:
+            setattr(self, field, getattr(self, field) + n)
+
+    def snapshot(self):
+        with self._lock:
+            per_min = self.generated / self.refill_seconds * 60 if self.refill_seconds else 0.0
+            served = self.pool_hits + self.pool_misses
+            return {
+                "generated": self.generated,
+                "rejected": self.rejected,  # 重复或不是规范选择题
+                "failures": self.failures,
+                "refill_questions_per_min": round(per_min, 2),
+                "pool_hits": self.pool_hits,
+                "pool_misses": self.pool_misses,
+                "pool_hit_rate": round(self.pool_hits / served, 3) if served else 0.0,
+            }
+
+
+_stats = _PoolStats()
+
+
+def pool_stats() -> dict:
+    return _stats.snapshot()
+
+
+def _low_buckets(target: int):
+    # 默认桶一直补；学生自己填 topic 的桶只补最近有人点过的，免得冷门 topic 一直烧钱
+    since = (datetime.utcnow() - timedelta(days=setting("QUESTION_POOL_BUCKET_TTL_DAYS", 7))).isoformat()
+    with _conn() as c:
+        return c.execute("""
+        SELECT b.unit, b.topic, b.difficulty
+        FROM question_buckets b
+        LEFT JOIN question_pool p
+          ON p.unit=b.unit AND p.topic=b.topic AND p.difficulty=b.difficulty
+        WHERE b.topic='' OR b.last_request>=?
+        GROUP BY b.unit, b.topic, b.difficulty
+        HAVING COUNT(p.id) < ?
+        """, (since, target)).fetchall()
+
+
+def refill_once(target: int) -> int:
+    """把每个低于水位的桶补一道题（轮流补，避免一个桶占满 LLM），返回补进去的数量"""
+    added = 0
+    for unit, topic, difficulty in _low_buckets(target):
+        start = time.perf_counter()
+        try:
+            item = tutor_logic.generate_question(
+                unit, topic, difficulty=difficulty, fresh=True, priority=PRIORITY_BACKGROUND
+            )
+        except Exception:
+            _stats.incr("failures")
+            continue
+        n = add_questions(unit, topic, difficulty, [item])
+        _stats.incr("refill_seconds", time.perf_counter() - start)
+        _stats.incr("generated", n)
+        _stats.incr("rejected", 1 - n)
+        added += n
+    return added
+
+
+def _worker_loop():
+    while True:
+        target = setting("QUESTION_POOL_TARGET", 5)
+        try:
+            if refill_once(target):
+                continue  # 还有桶没满，接着补
+        except Exception:
+            _stats.incr("failures")
+        time.sleep(setting("QUESTION_POOL_INTERVAL_SECONDS", 30))
+
+
+_worker_lock = threading.Lock()
+_worker = None
+
+
+def ensure_worker():
+    """每个进程只启动一个补货线程（QUESTION_POOL_WORKER=0 可关闭）"""
+    global _worker
+    if not setting("QUESTION_POOL_WORKER", True):
+        return
+    with _worker_lock:
+        if _worker is None or not _worker.is_alive():
+            _worker = threading.Thread(target=_worker_loop, name="question-pool-refill", daemon=True)
+            _worker.start()
@@ -0,0 +1,167 @@
+"""
+批量出题（老师的整套测验/学案）：一次生成 N 道，存成一个题组，可导出 CSV/JSON。
+
+- 每次 LLM 调用出 QUESTION_BATCH_PER_CALL 道（结构化 JSON），分块并发，最多 QUESTION_BATCH_CONCURRENCY 个同时在跑
+- 逐道校验（规范选择题 + 答案字母有效），按内容哈希去重（本组内 + 历史题组）
+- 不够数就再补几轮，最多 QUESTION_BATCH_MAX_ROUNDS 轮
+"""
+import csv
+import io
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+
+import services.tutor_logic as tutor_logic
+from services import db
+from services.config import setting
+from services.llm_scheduler import PRIORITY_BATCH
+from services.question_pool import add_questions, question_hash
+from services.tokens import count_tokens
+from services.wrongbook import DB_PATH
+
+EXPORT_FIELDS = ["position", "unit", "topic", "difficulty", "question", "answer_key"]
+PROMPT_TOKENS = 150
+
+
+def _conn():
+    return db.connect(DB_PATH)
+
+
+def init_sets():
+    with _conn() as c:
+        c.execute("""
+        CREATE TABLE IF NOT EXISTS question_sets (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            created_at TEXT,
+            title TEXT,
+            unit TEXT,
+            topic TEXT,
+            difficulty TEXT,
+            stats TEXT
+        )
+        """)
+        c.execute("""
+        CREATE TABLE IF NOT EXISTS question_set_items (
+            set_id INTEGER NOT NULL REFERENCES question_sets(id) ON DELETE CASCADE,
+            position INTEGER NOT NULL,
+            question TEXT,
+            answer_key TEXT,
+            q_hash TEXT,
+            PRIMARY KEY (set_id, position)
+        )
+        """)
+        c.execute("CREATE INDEX IF NOT EXISTS idx_set_items_hash ON question_set_items(q_hash)")
+        c.commit()
+
+
+def _known_hashes(unit, topic, difficulty):
+    # 同一 unit/topic/难度 以前出过的题，新题组里不再出现
+    with _conn() as c:
+        rows = c.execute("""
+        SELECT i.q_hash FROM question_set_items i JOIN question_sets s ON s.id = i.set_id
+        WHERE s.unit=? AND s.topic=? AND s.difficulty=?
+        """, (unit, topic, difficulty)).fetchall()
+    return {r[0] for r in rows}
+
+
+def generate_set(unit, topic="", difficulty="easy", total=30, title="", to_pool=False, on_progress=None):
+    """
+    生成一个 total 道题的题组并入库，返回 (set_id, stats)。
+    on_progress(已收集, total) 在调用线程里回调（可以直接更新 Streamlit 进度条）。
+    to_pool=True 时顺便放进练习题库。
+    """
+    topic = topic.strip()
+    per_call = max(1, setting("QUESTION_BATCH_PER_CALL", 5))
+    seen = _known_hashes(unit, topic, difficulty)
+    items = []
+    # dropped = 要了但没返回或没通过校验的（generate_questions 里已经滤掉）
+    stats = {"calls": 0, "failed_calls": 0, "returned": 0, "dropped": 0, "duplicates": 0, "est_tokens": 0}
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=setting("QUESTION_BATCH_CONCURRENCY", 4)) as pool:
+        for _ in range(setting("QUESTION_BATCH_MAX_ROUNDS", 3)):
+            missing = total - len(items)
+            if missing <= 0:
+                break
+            # 多要一点，抵掉校验/去重丢掉的
+            want = missing + (missing + 9) // 10
+            sizes = [min(per_call, want - i) for i in range(0, want, per_call)]
+            futures = {
+                pool.submit(tutor_logic.generate_questions, unit, topic, difficulty, n, PRIORITY_BATCH): n
+                for n in sizes
+            }
+            for f in as_completed(futures):
+                stats["calls"] += 1
+                try:
+                    batch = f.result()
+                except Exception:
+                    stats["failed_calls"] += 1
+                    continue
+                stats["returned"] += len(batch)
+                stats["dropped"] += futures[f] - len(batch)
+                # 粗估：固定 prompt 约 PROMPT_TOKENS，输出按题面 token 数算
+                stats["est_tokens"] += PROMPT_TOKENS + sum(count_tokens(q["question"]) + 8 for q in batch)
+                for q in batch:
+                    h = question_hash(q["question"])
+                    if h in seen:
+                        stats["duplicates"] += 1
+                        continue
+                    if len(items) < total:
+                        seen.add(h)
+                        items.append(dict(q, q_hash=h))
+                if on_progress is not None:
+                    on_progress(len(items), total)
+    elapsed = time.perf_counter() - start
+    stats.update(
+        questions=len(items),
+        seconds=round(elapsed, 2),
+        questions_per_min=round(len(items) / elapsed * 60, 1) if elapsed else 0.0,
+        est_tokens_per_question=round(stats["est_tokens"] / len(items), 1) if items else 0.0,
+    )
+
+    with _conn() as c:
+        set_id = c.execute(
+            "INSERT INTO question_sets (created_at, title, unit, topic, difficulty, stats) VALUES (?, ?, ?, ?, ?, ?)",
+            (datetime.utcnow().isoformat(), title or f"{unit} {topic}".strip(), unit, topic, difficulty,
+             json.dumps(stats, ensure_ascii=False)),
+        ).lastrowid
+        c.executemany(
+            "INSERT INTO question_set_items (set_id, position, question, answer_key, q_hash) VALUES (?, ?, ?, ?, ?)",
+            [(set_id, i + 1, q["question"], q["answer_key"], q["q_hash"]) for i, q in enumerate(items)],
+        )
+        c.commit()
+    if to_pool:
+        add_questions(unit, topic, difficulty, items)
+    return set_id, stats
+
+
+def list_sets(limit=50):
+    with _conn() as c:
+        return c.execute("""
+        SELECT s.id, s.created_at, s.title, s.unit, s.topic, s.difficulty, COUNT(i.position)
+        FROM question_sets s LEFT JOIN question_set_items i ON i.set_id = s.id
+        GROUP BY s.id ORDER BY s.id DESC LIMIT ?
+        """, (limit,)).fetchall()
+
+
+def get_items(set_id):
+    """[{"position", "unit", "topic", "difficulty", "question", "answer_key"}]，按题号顺序"""
+    with _conn() as c:
+        rows = c.execute("""
+        SELECT i.position, s.unit, s.topic, s.difficulty, i.question, i.answer_key
+        FROM question_set_items i JOIN question_sets s ON s.id = i.set_id
+        WHERE i.set_id=? ORDER BY i.position
+        """, (set_id,)).fetchall()
+    return [dict(zip(EXPORT_FIELDS, r)) for r in rows]
+
+
+def export_csv(set_id) -> str:
+    buf = io.StringIO()
+    w = csv.DictWriter(buf, fieldnames=EXPORT_FIELDS)
+    w.writeheader()
+    w.writerows(get_items(set_id))
+    return buf.getvalue()
+
+
+def export_json(set_id) -> str:
+    return json.dumps(get_items(set_id), ensure_ascii=False, indent=2)
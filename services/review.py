@@ -0,0 +1,93 @@
+"""
+错题本间隔复习（SM-2）：
+
+- 每道错题有 ease / interval_days / reps / due_at，学生复习时自评 0-5 分，按 SM-2 算下次复习时间
+- “今天到期几题”读 review_due（触发器增量维护的每日计数），不扫错题表
+- 复习队列走 (user_id, due_at) 索引取最早到期的几条，题目和练习题都用库里存好的，不再调 LLM
+"""
+import json
+from datetime import datetime, timedelta
+
+from services import db
+from services.wrongbook import DB_PATH, mark_changed
+
+MIN_EASE = 1.3
+
+# 复习按钮：(文案, SM-2 质量分)
+GRADES = [("😵 忘了", 1), ("🤔 模糊", 3), ("🙂 记得", 4), ("😎 很简单", 5)]
+
+
+def _conn():
+    return db.connect(DB_PATH)
+
+
+def sm2(ease: float, interval_days: int, reps: int, quality: int):
+    """返回新的 (ease, interval_days, reps)；quality < 3 算没记住，间隔重置为 1 天"""
+    if quality < 3:
+        reps, interval_days = 0, 1
+    else:
+        reps += 1
+        interval_days = 1 if reps == 1 else 6 if reps == 2 else max(round(interval_days * ease), 1)
+    ease = max(MIN_EASE, ease + 0.1 - (5 - quality) * (0.08 + (5 - quality) * 0.02))
+    return round(ease, 3), interval_days, reps
+
+
+def _tomorrow(now=None) -> str:
+    """“今天到期”的上界：UTC 明天 0 点（due_at 和 created_at 一样用 UTC）"""
+    return ((now or datetime.utcnow()).date() + timedelta(days=1)).isoformat()
+
+
+def due_count(user_id, now=None) -> int:
+    with _conn() as c:
+        row = c.execute(
+            "SELECT COALESCE(SUM(n), 0) FROM review_due WHERE user_id=? AND day < ?",
+            (user_id, _tomorrow(now)),
+        ).fetchone()
+    return row[0]
+
+
+def due_entries(user_id, limit=1, now=None):
+    """
+    今天到期的错题（最早到期的在前），返回
+    [{"id", "unit", "topic", "question", "correct_answer", "explanation", "mistake_type", "drills", ...}]。
+    drills 是判题时生成并存下的同错因练习。
+    """
+    with _conn() as c:
+        rows = c.execute("""
+        SELECT id, unit, topic, question, correct_answer, explanation, mistake_type, next_drill,
+               ease, interval_days, reps, due_at
+        FROM wrongbook_full WHERE user_id=? AND due_at < ?
+        ORDER BY due_at LIMIT ?
+        """, (user_id, _tomorrow(now), limit)).fetchall()
+    out = []
+    for r in rows:
+        try:
+            drills = json.loads(r[7] or "[]")
+        except ValueError:
+            drills = []
+        out.append({
+            "id": r[0], "unit": r[1], "topic": r[2], "question": r[3], "correct_answer": r[4],
+            "explanation": r[5], "mistake_type": r[6],
+            "drills": [d for d in drills if isinstance(d, dict)] if isinstance(drills, list) else [],
+            "ease": r[8], "interval_days": r[9], "reps": r[10], "due_at": r[11],
+        })
+    return out
+
+
+def record_review(entry_id, user_id, quality: int, now=None):
+    """记一次复习，返回新的 (ease, interval_days, reps, due_at)；不是该学生的错题返回 None"""
+    with _conn() as c:
+        row = c.execute(
+            "SELECT ease, interval_days, reps FROM wrongbook WHERE id=? AND user_id=?", (entry_id, user_id)
+        ).fetchone()
+    if row is None:
+        return None
+    now = now or datetime.utcnow()
+    ease, interval_days, reps = sm2(*row, quality)
+    due_at = (now + timedelta(days=interval_days)).isoformat()
+    db.writer(DB_PATH).submit("""
+    UPDATE wrongbook SET ease=?, interval_days=?, reps=?, lapses=lapses + ?, due_at=?, last_reviewed_at=?
+    WHERE id=? AND user_id=?
+    """, (ease, interval_days, reps, int(quality < 3), due_at, now.isoformat(), entry_id, user_id))
+    mark_changed(user_id)
+    return ease, interval_days, reps, due_at
@@ -0,0 +1,137 @@
+"""
+按登录名持久化的会话状态（和错题本同一个库）：
+- chat_log：只追加的聊天记录，页面只加载最近一页，往上翻再按需取更早的
+- session_state：每个学生一行 JSON（当前题目、判题结果、聊天摘要…），断线重连/刷新后恢复，
+  已经花钱生成的题目和解析不用再生成一遍
+- student_keys：个人口令。周密码全班共用，光凭名字谁都能冒充同学、看到他的聊天和错题；
+  名字第一次登录时发一个随机口令（库里只存加盐哈希），以后登录要名字 + 口令对上
+"""
+import hashlib
+import hmac
+import json
+import secrets
+from datetime import datetime
+
+from services import db
+from services.wrongbook import DB_PATH
+
+CHAT_PAGE_SIZE = 20
+KEY_ALPHABET = "ABCDEFGHJKLMNPQRSTUVWXYZ23456789"  # 没有容易看混的 I/O/1/0
+KEY_LENGTH = 8
+KEY_HASH_ROUNDS = 100_000
+
+
+def _conn():
+    return db.connect(DB_PATH)
+
+
+def init_store():
+    with _conn() as c:
+        c.execute("""
+        CREATE TABLE IF NOT EXISTS chat_log (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id TEXT NOT NULL,
+            created_at TEXT,
+            role TEXT,
+            content TEXT
+        )
+        """)
+        c.execute("CREATE INDEX IF NOT EXISTS idx_chat_log_user ON chat_log(user_id, id)")
+        c.execute("""
+        CREATE TABLE IF NOT EXISTS session_state (
+            user_id TEXT PRIMARY KEY,
+            state TEXT NOT NULL,
+            updated_at TEXT
+        )
+        """)
+        c.execute("""
+        CREATE TABLE IF NOT EXISTS student_keys (
+            user_id TEXT PRIMARY KEY,
+            salt BLOB NOT NULL,
+            key_hash BLOB NOT NULL,
+            created_at TEXT
+        )
+        """)
+        c.commit()
+
+
+def append_chat(user_id, role, content) -> int:
+    """追加一条聊天记录，返回 id"""
+    return db.writer(DB_PATH).submit(
+        "INSERT INTO chat_log (user_id, created_at, role, content) VALUES (?, ?, ?, ?)",
+        (user_id, datetime.utcnow().isoformat(), role, content),
+    )
+
+
+def load_chat(user_id, before_id=None, limit=CHAT_PAGE_SIZE):
+    """取 before_id 之前（不给就是最新）的 limit 条，按时间正序返回 [{"id", "role", "content"}]"""
+    with _conn() as c:
+        rows = c.execute("""
+        SELECT id, role, content FROM chat_log
+        WHERE user_id=? AND id < ?
+        ORDER BY id DESC LIMIT ?
+        """, (user_id, before_id if before_id is not None else 2 ** 63 - 1, limit)).fetchall()
+    return [{"id": i, "role": r, "content": t} for i, r, t in reversed(rows)]
+
+
+def count_chat(user_id) -> int:
+    """该学生一共存了多少条聊天记录"""
+    with _conn() as c:
+        return c.execute("SELECT COUNT(*) FROM chat_log WHERE user_id=?", (user_id,)).fetchone()[0]
+
+
+def save_state(user_id, **fields):
+    """
+    合并写入该学生的会话状态（json_patch 语义：值为 None 的字段会被删掉）。
+    值要能 JSON 序列化。
+    """
+    patch = json.dumps(fields, ensure_ascii=False)
+    # excluded.state 已经去掉了 null，删字段要拿原始 patch 再 patch 一次
+    return db.writer(DB_PATH).submit("""
+    INSERT INTO session_state (user_id, state, updated_at) VALUES (?, json_patch('{}', ?), ?)
+    ON CONFLICT(user_id) DO UPDATE SET state=json_patch(state, ?), updated_at=excluded.updated_at
+    """, (user_id, patch, datetime.utcnow().isoformat(), patch))
+
+
+def load_state(user_id) -> dict:
+    with _conn() as c:
+        row = c.execute("SELECT state FROM session_state WHERE user_id=?", (user_id,)).fetchone()
+    return json.loads(row[0]) if row else {}
+
+
+def _hash_key(key: str, salt: bytes) -> bytes:
+    return hashlib.pbkdf2_hmac("sha256", key.strip().upper().encode("utf-8"), salt, KEY_HASH_ROUNDS)
+
+
+def issue_student_key(user_id):
+    """
+    名字还没有个人口令时发一个，返回明文（只在这次登录给学生看一次）；已经有了返回 None。
+    两个人同时抢同一个新名字只有一个插得进去（主键冲突），另一个拿到 None，照常要口令。
+    """
+    key = "".join(secrets.choice(KEY_ALPHABET) for _ in range(KEY_LENGTH))
+    salt = secrets.token_bytes(16)
+    with _conn() as c:
+        if c.execute("SELECT 1 FROM student_keys WHERE user_id=?", (user_id,)).fetchone():
+            return None
+    db.writer(DB_PATH).submit(
+        "INSERT OR IGNORE INTO student_keys (user_id, salt, key_hash, created_at) VALUES (?, ?, ?, ?)",
+        (user_id, salt, _hash_key(key, salt), datetime.utcnow().isoformat()),
+    )
+    with _conn() as c:
+        row = c.execute("SELECT salt FROM student_keys WHERE user_id=?", (user_id,)).fetchone()
+    return key if row and row[0] == salt else None
+
+
+def check_student_key(user_id, key) -> bool:
+    """个人口令对不对；名字还没有口令时也返回 False（先走 issue_student_key）"""
+    with _conn() as c:
+        row = c.execute("SELECT salt, key_hash FROM student_keys WHERE user_id=?", (user_id,)).fetchone()
+    return bool(row) and hmac.compare_digest(_hash_key(key or "", row[0]), row[1])
+
+
+def reset_student_key(user_id) -> bool:
+    """管理员：学生忘了口令就删掉，下次用这个名字登录会重新发一个；返回原来有没有口令"""
+    with _conn() as c:
+        existed = c.execute("SELECT 1 FROM student_keys WHERE user_id=?", (user_id,)).fetchone() is not None
+    db.writer(DB_PATH).submit("DELETE FROM student_keys WHERE user_id=?", (user_id,))
+    return existed
@@ -0,0 +1,216 @@
+"""
+LLM 调用账本：每次 generate_text / stream_text 记一行
+（模型、prompt/completion token、总耗时、首 token 延迟、是否命中缓存/合并、调用方、学生、估算费用）。
+
+record() 只往内存队列里放，后台线程攒批写进 llm_ledger.db，调用方从不等磁盘；
+队列满了就丢（计数），宁可少记也不拖慢判题。
+"""
+import queue
+import threading
+import time
+from contextvars import ContextVar
+from datetime import datetime, timedelta
+
+from services import db
+from services.config import setting
+from services.wrongbook import DB_PATH
+
+# 当前是哪个学生在调用；app 每次 rerun 设置，线程池任务用 contextvars.copy_context() 带过去
+_user = ContextVar("llm_user", default="")
+
+COLUMNS = (
+    "ts", "day", "model", "caller", "user_id", "prompt_tokens", "completion_tokens",
+    "latency_s", "ttft_s", "cache_hit", "coalesced", "ok", "cost_usd",
+)
+
+
+def set_user(user_id: str):
+    _user.set(user_id or "")
+
+
+def current_user() -> str:
+    return _user.get()
+
+
+def _path():
+    return DB_PATH.with_name("llm_ledger.db")
+
+
+def _conn():
+    return db.connect(_path())
+
+
+def _ensure_table(c):
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS llm_calls (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        ts REAL,
+        day TEXT,
+        model TEXT,
+        caller TEXT,
+        user_id TEXT,
+        prompt_tokens INTEGER,
+        completion_tokens INTEGER,
+        latency_s REAL,
+        ttft_s REAL,
+        cache_hit INTEGER,
+        coalesced INTEGER,
+        ok INTEGER,
+        cost_usd REAL
+    )
+    """)
+    c.execute("CREATE INDEX IF NOT EXISTS idx_llm_calls_day ON llm_calls(day)")
+    c.commit()
+
+
+def cost_usd(prompt_tokens, completion_tokens) -> float:
+    """按每百万 token 单价估算（LLM_PRICE_INPUT_PER_M / LLM_PRICE_OUTPUT_PER_M，美元）"""
+    return (
+        prompt_tokens * setting("LLM_PRICE_INPUT_PER_M", 1.25)
+        + completion_tokens * setting("LLM_PRICE_OUTPUT_PER_M", 10.0)
+    ) / 1_000_000
+
+
+class _Ledger:
+    def __init__(self, max_queue=10000, max_batch=500, interval=1.0):
+        self._q = queue.Queue(maxsize=max_queue)
+        self.max_batch = max_batch
+        self.interval = interval
+        self.written = 0
+        self.dropped = 0
+        self.flushes = 0
+        self._thread = threading.Thread(target=self._run, name="llm-ledger-writer", daemon=True)
+        self._thread.start()
+
+    def put(self, row):
+        try:
+            self._q.put_nowait(row)
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self):
+        c = _conn()
+        _ensure_table(c)
+        placeholders = ", ".join("?" for _ in COLUMNS)
+        sql = f"INSERT INTO llm_calls ({', '.join(COLUMNS)}) VALUES ({placeholders})"
+        while True:
+            rows = [self._q.get()]
+            deadline = time.monotonic() + self.interval
+            try:
+                while len(rows) < self.max_batch:
+                    rows.append(self._q.get(timeout=max(deadline - time.monotonic(), 0)))
+            except queue.Empty:
+                pass
+            try:
+                with c:
+                    c.executemany(sql, rows)
+                self.written += len(rows)
+            except Exception:
+                self.dropped += len(rows)
+            self.flushes += 1
+
+    def snapshot(self):
+        return {"queued": self._q.qsize(), "written": self.written, "dropped": self.dropped, "flushes": self.flushes}
+
+
+_ledger_lock = threading.Lock()
+_ledger = None
+
+
+def _get_ledger() -> _Ledger:
+    global _ledger
+    with _ledger_lock:
+        if _ledger is None:
+            _ledger = _Ledger()
+        return _ledger
+
+
+def record(model, caller, latency_s, prompt_tokens=0, completion_tokens=0, ttft_s=None,
+           cache_hit=False, coalesced=False, ok=True, user_id=None):
+    """记一次 LLM 调用（不阻塞）"""
+    now = time.time()
+    _get_ledger().put((
+        now, datetime.utcfromtimestamp(now).strftime("%Y-%m-%d"), model, caller,
+        current_user() if user_id is None else user_id,
+        prompt_tokens, completion_tokens, latency_s, ttft_s,
+        int(cache_hit), int(coalesced), int(ok), cost_usd(prompt_tokens, completion_tokens),
+    ))
+
+
+def ledger_stats() -> dict:
+    return _get_ledger().snapshot()
+
+
+# -----------------------------
+# 管理员面板用的聚合
+# -----------------------------
+def _pct(values, p):
+    if not values:
+        return None
+    return round(values[min(len(values) - 1, int(len(values) * p / 100))], 3)
+
+
+def _since(days):
+    return (datetime.utcnow() - timedelta(days=days - 1)).strftime("%Y-%m-%d")
+
+
+def latency_by_caller(days=7):
+    """每个调用方的调用数、缓存命中率、p50/p95 总耗时和首 token 延迟（只算真正发出去的请求）"""
+    c = _conn()
+    _ensure_table(c)
+    rows = c.execute("""
+    SELECT caller, latency_s, ttft_s, cache_hit OR coalesced FROM llm_calls
+    WHERE day >= ? AND ok = 1 ORDER BY caller, latency_s
+    """, (_since(days),)).fetchall()
+    out = {}
+    for caller, latency, ttft, reused in rows:
+        d = out.setdefault(caller, {"lat": [], "ttft": [], "calls": 0, "reused": 0})
+        d["calls"] += 1
+        d["reused"] += reused
+        if not reused:
+            d["lat"].append(latency)
+            if ttft is not None:
+                d["ttft"].append(ttft)
+    result = []
+    for caller, d in out.items():
+        d["ttft"].sort()
+        result.append({
+            "caller": caller,
+            "calls": d["calls"],
+            "cache_or_coalesced": round(d["reused"] / d["calls"], 3),
+            "p50_s": _pct(d["lat"], 50),
+            "p95_s": _pct(d["lat"], 95),
+            "ttft_p50_s": _pct(d["ttft"], 50),
+            "ttft_p95_s": _pct(d["ttft"], 95),
+        })
+    return result
+
+
+def tokens_by_user(days=7, limit=50):
+    c = _conn()
+    _ensure_table(c)
+    return c.execute("""
+    SELECT user_id, COUNT(*), SUM(prompt_tokens), SUM(completion_tokens), SUM(cost_usd)
+    FROM llm_calls WHERE day >= ?
+    GROUP BY user_id ORDER BY SUM(cost_usd) DESC LIMIT ?
+    """, (_since(days), limit)).fetchall()
+
+
+def daily_spend(days=14):
+    c = _conn()
+    _ensure_table(c)
+    return c.execute("""
+    SELECT day, COUNT(*), SUM(prompt_tokens), SUM(completion_tokens), SUM(cost_usd)
+    FROM llm_calls WHERE day >= ?
+    GROUP BY day ORDER BY day
+    """, (_since(days),)).fetchall()
+
+
+def spend_by_caller(days=7):
+    c = _conn()
+    _ensure_table(c)
+    return c.execute("""
+    SELECT caller, COUNT(*), SUM(prompt_tokens), SUM(completion_tokens), SUM(cost_usd)
+    FROM llm_calls WHERE day >= ?
+    GROUP BY caller ORDER BY SUM(cost_usd) DESC
+    """, (_since(days),)).fetchall()
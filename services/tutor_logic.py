@@ -1,57 +1,50 @@
+import contextvars
+import json
 import re
-import streamlit as st
-
-from services.wrongbook import (
-    init_db,
-    add_entry,
-    list_entries,
-    get_entry,
-)
-
-from services.tutor_logic import (
-    generate_new_question,
-    grade_and_extract_mistake,
-    UNITS,
-)
-
-from services.auth import (
-    check_user_password,
-    check_admin_password,
-    weekly_password,
-    next_rotation_time,
-)
-
-# -----------------------------
-# Page / Init
-# -----------------------------
-st.set_page_config(page_title="AP CSA Tutor + 错题本", layout="wide")
-init_db()
-
-# Session defaults
-if "is_user_authed" not in st.session_state:
-    st.session_state.is_user_authed = False
-if "is_admin" not in st.session_state:
-    st.session_state.is_admin = False
-if "current_q" not in st.session_state:
-    st.session_state.current_q = ""
-if "last_result" not in st.session_state:
-    st.session_state.last_result = None
-if "unit" not in st.session_state:
-    st.session_state.unit = UNITS[0]
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import services.java_sandbox as java_sandbox
+import services.openai_client as openai_client
+from services.config import setting
+from services.llm_scheduler import PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE
+
+UNITS = [
+    "Unit 1: Primitive Types",
+    "Unit 2: Using Objects",
+    "Unit 3: Boolean Expressions and if Statements",
+    "Unit 4: Iteration",
+    "Unit 5: Writing Classes",
+    "Unit 6: Array",
+    "Unit 7: ArrayList",
+    "Unit 8: 2D Array",
+    "Unit 9: Inheritance",
+    "Unit 10: Recursion",
+]
+
+# 判题结果的字段顺序：也是让模型输出 JSON 的顺序，保证“正确答案”最先流出来。
+# 同错因练习不在这里生成，判题完成后由 start_drills 并发生成。
+GRADE_FIELDS = ["is_correct", "correct_answer", "explanation", "mistake_type", "unit", "topic"]
+
+DRILL_COUNT = 3
 
 
 # -----------------------------
 # Helpers
 # -----------------------------
+# 支持 A. A) A: A： 四种；预编译，避免每次 rerun 都重新编译
+_MCQ_LINE = re.compile(r"^\s*[A-Da-d]\s*[\.\)\:\：]\s*.+")
+_MCQ_OPTION = re.compile(r"^\s*([A-Da-d])\s*[\.\)\:\：]\s*(.+?)\s*$")
+_ANSWER_LETTER = re.compile(r"^\s*([A-Da-d])\b")
+
+
 def is_mcq(text: str) -> bool:
     """粗略判断是否是选择题：是否包含 A./B./C./D. 这样的选项行"""
     if not isinstance(text, str):
         return False
-    # 支持 A. A) A: A： 四种
-    lines = text.splitlines()
     hit = 0
-    for L in lines:
-        if re.match(r"^\s*[A-Da-d]\s*[\.\)\:\：]\s*.+", L):
+    for L in text.splitlines():
+        if _MCQ_LINE.match(L):
             hit += 1
     return hit >= 2  # 至少两项就认为是 MCQ
 
@@ -62,7 +55,7 @@ def extract_mcq_options(text: str):
     if not isinstance(text, str):
         return opts
     for L in text.splitlines():
-        m = re.match(r"^\s*([A-Da-d])\s*[\.\)\:\：]\s*(.+?)\s*$", L)
+        m = _MCQ_OPTION.match(L)
         if m:
             k = m.group(1).upper()
             v = m.group(2).strip()
@@ -70,221 +63,291 @@ def extract_mcq_options(text: str):
     return opts
 
 
-# -----------------------------
-# Sidebar: Auth
-# -----------------------------
-with st.sidebar:
-    st.header("🔐 登录")
-
-    # 用户登录
-    if not st.session_state.is_user_authed:
-        user_pw = st.text_input("本周访问密码", type="password")
-        if st.button("登录（用户）"):
-            if check_user_password(user_pw):
-                st.session_state.is_user_authed = True
-                st.success("用户已登录")
-            else:
-                st.error("密码错误")
-    else:
-        st.success("用户已登录")
-        if st.button("退出用户登录"):
-            st.session_state.is_user_authed = False
-
-    st.divider()
-
-    # 管理员登录
-    st.header("🔥 管理员")
-    if not st.session_state.is_admin:
-        admin_pw = st.text_input("管理员密码", type="password")
-        if st.button("登录（管理员）"):
-            if check_admin_password(admin_pw):
-                st.session_state.is_admin = True
-                st.success("管理员已登录")
-            else:
-                st.error("管理员密码错误")
-    else:
-        st.success("管理员已登录")
-        if st.button("退出管理员"):
-            st.session_state.is_admin = False
-
-    st.divider()
-
-    # 每周密码（仅管理员可见）
-    st.subheader("本周密码（管理员可见）")
-    if st.session_state.is_admin:
-        st.code(weekly_password(), language="text")
-        st.caption(f"下次自动切换时间：{next_rotation_time()}")
-    else:
-        st.info("管理员登录后可查看")
-
-
-# 未登录用户：直接阻止访问主功能
-if not st.session_state.is_user_authed:
-    st.stop()
+def parse_question(text: str) -> dict:
+    """出题时解析一次，结果和题目一起存着，之后每次 rerun 直接用"""
+    mcq = is_mcq(text)
+    return {"is_mcq": mcq, "options": extract_mcq_options(text) if mcq else {}}
+
+
+def _parse_json(text: str) -> dict:
+    """模型偶尔会包 ```json 代码块或前后加话，取第一个 { 到最后一个 }"""
+    start, end = text.find("{"), text.rfind("}")
+    if start < 0 or end <= start:
+        return {}
+    try:
+        data = json.loads(text[start:end + 1])
+    except json.JSONDecodeError:
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+class _ProgressiveJSON:
+    """
+    增量解析流式输出的 JSON 对象：每个顶层字段完整到达后立即产出 (key, value)。
+    值后面必须已经出现 , 或 }，避免把还没流完的数字/字面量当成完整值。
+    """
+
+    def __init__(self):
+        self.buf = ""
+        self.pos = None
+        self._dec = json.JSONDecoder()
+
+    def _skip(self, chars):
+        while self.pos < len(self.buf) and self.buf[self.pos] in chars:
+            self.pos += 1
+
+    def feed(self, chunk: str):
+        self.buf += chunk
+        out = []
+        if self.pos is None:
+            start = self.buf.find("{")
+            if start < 0:
+                return out
+            self.pos = start + 1
+        while True:
+            mark = self.pos
+            self._skip(" \t\r\n,")
+            try:
+                key, p = self._dec.raw_decode(self.buf, self.pos)
+                self.pos = p
+                self._skip(" \t\r\n")
+                if self.pos >= len(self.buf) or self.buf[self.pos] != ":":
+                    raise ValueError
+                self.pos += 1
+                self._skip(" \t\r\n")
+                value, p = self._dec.raw_decode(self.buf, self.pos)
+                rest = self.buf[p:].lstrip()
+                if not rest or rest[0] not in ",}":
+                    raise ValueError
+            except ValueError:  # JSONDecodeError 也是 ValueError：数据还没到齐
+                self.pos = mark
+                return out
+            self.pos = p
+            out.append((key, value))
 
 
 # -----------------------------
-# Main UI
+# LLM: 出题
 # -----------------------------
-tab1, tab2, tab3 = st.tabs(["💬 讲解/提问", "🧪 刷题", "📒 错题本"])
+def generate_question(unit: str, topic: str = "", difficulty: str = "easy", fresh: bool = False,
+                      priority=PRIORITY_INTERACTIVE) -> dict:
+    """
+    出一道选择题，连同标准答案一起返回：{"question": 题面, "answer_key": "A"~"D" 或 None}。
+    答案只存在服务端，用来本地判题，不显示给学生。
+    同一 (unit, topic, difficulty) 默认复用缓存里的题；fresh=True 强制出一道新题。
+    后台补题传 priority=PRIORITY_BACKGROUND，不和学生抢 LLM 配额。
+    """
+    system = (
+        "你是AP CSA(Java)出题老师。只出1道单选题。"
+        '只输出JSON：{"question": "题干（可含Java代码块）+ 4行选项，分别以 A. B. C. D. 开头", '
+        '"answer": "正确选项字母"}。题干里不要给答案，不要给解析，不要写“答案”二字。'
+    )
+    user = f"单元：{unit}\n知识点：{topic.strip() or '该单元任意重点'}\n难度：{difficulty}"
+    text = openai_client.generate_text(
+        [{"role": "system", "content": system}, {"role": "user", "content": user}],
+        temperature=0.8,
+        cache=not fresh,
+        priority=priority,
+        caller="refill" if priority >= PRIORITY_BACKGROUND else "generate",
+    ).strip()
+    data = _parse_json(text)
+    question = str(data.get("question", "")).strip() or text
+    return {"question": question, "answer_key": _answer_key(question, data.get("answer"))}
+
+
+def _answer_key(question: str, answer):
+    m = _ANSWER_LETTER.match(str(answer or ""))
+    key = m.group(1).upper() if m else None
+    options = extract_mcq_options(question)
+    if key and key not in options:
+        key = None  # 答案字母不在选项里，宁可交给 LLM 判
+    # 输出题在本地 Java 沙箱里核对一遍（没开沙箱时原样返回）
+    return java_sandbox.verified_answer_key(question, options, key)
+
+
+def generate_questions(unit: str, topic: str = "", difficulty: str = "easy", n: int = 5,
+                       priority=PRIORITY_INTERACTIVE) -> list:
+    """
+    一次调用出 n 道不同的单选题（批量出题用），返回 [{"question", "answer_key"}]。
+    只保留是规范选择题且答案字母有效的；数量可能少于 n，由调用方补。
+    """
+    system = (
+        f"你是AP CSA(Java)出题老师。出{n}道互不相同的单选题（考点或情境各不相同）。"
+        '只输出JSON：{"questions": [{"question": "题干（可含Java代码块）+ 4行选项，分别以 A. B. C. D. 开头", '
+        '"answer": "正确选项字母"}, ...]}。题干里不要给答案，不要给解析，不要写“答案”二字。'
+    )
+    user = f"单元：{unit}\n知识点：{topic.strip() or '该单元任意重点'}\n难度：{difficulty}\n数量：{n}"
+    text = openai_client.generate_text(
+        [{"role": "system", "content": system}, {"role": "user", "content": user}],
+        temperature=0.9,
+        cache=False,
+        priority=priority,
+        caller="batch",
+    )
+    items = _parse_json(text).get("questions")
+    out = []
+    for item in items if isinstance(items, list) else []:
+        if not isinstance(item, dict):
+            continue
+        question = str(item.get("question", "")).strip()
+        key = _answer_key(question, item.get("answer"))
+        if key and is_mcq(question):
+            out.append({"question": question, "answer_key": key})
+    return out
+
+
+def generate_new_question(unit: str, topic: str = "", difficulty: str = "easy", fresh: bool = False) -> str:
+    """只要题面（不关心标准答案）的调用方用这个"""
+    return generate_question(unit, topic, difficulty, fresh)["question"]
 
 
 # -----------------------------
-# Tab 1: Ask / Explain
+# LLM: 判题 + 错因 + 同错因练习
 # -----------------------------
-with tab1:
-    st.subheader("💬 讲解/提问（你可以把题目/代码/疑问贴这里）")
-
-    prompt = st.text_area("你的问题", height=150, placeholder="例如：解释一下 Java 的 String 比较，或者贴一题让我讲解。")
-
-    if st.button("让AI讲解"):
-        if not prompt.strip():
-            st.warning("先输入问题。")
-        else:
-            # 这里你原来可能有聊天模式；如果你暂时没有，就先简单复用判题逻辑的 LLM 输出
-            # 也可以后续单独做一个 chat_service
-            res = grade_and_extract_mistake(
-                question="（讲解模式）\n" + prompt.strip(),
-                user_answer="请讲解并给例子。",
-                unit_hint=st.session_state.unit,
-            )
-            st.markdown("### 讲解")
-            st.write(res.get("explanation", ""))
+def _grade_messages(question: str, user_answer: str, unit_hint: str = "", answer_key=None):
+    # 选择题答案统一成大写字母，同一题同一选项能命中同一条缓存
+    user_answer = (user_answer or "").strip()
+    if len(user_answer) == 1:
+        user_answer = user_answer.upper()
+    system = (
+        "你是AP CSA(Java)判题老师。只输出一个JSON对象，不要输出其他文字。"
+        f"字段按这个顺序输出：{', '.join(GRADE_FIELDS)}。"
+        "is_correct: true/false；correct_answer: 正确答案（选择题给字母+简述）；"
+        "explanation: 分点解析，指出学生错在哪；mistake_type: 简短错因类型；"
+        "unit: 所属单元；topic: 知识点。"
+    )
+    user = f"单元提示：{unit_hint}\n\n题目：\n{question}\n\n学生答案：\n{user_answer}"
+    if answer_key:
+        user += f"\n\n标准答案：{answer_key}（以此为准，重点解释学生为什么错）"
+    return [{"role": "system", "content": system}, {"role": "user", "content": user}]
+
+
+def _normalize_result(data: dict, unit_hint: str = "") -> dict:
+    data.setdefault("is_correct", False)
+    data.setdefault("correct_answer", "")
+    data.setdefault("explanation", "")
+    data.setdefault("mistake_type", "")
+    data.setdefault("unit", unit_hint)
+    data.setdefault("topic", "")
+    drills = data.get("drills")
+    data["drills"] = [d for d in drills if isinstance(d, dict)] if isinstance(drills, list) else []
+    return data
+
+
+def grade_and_extract_mistake(question: str, user_answer: str, unit_hint: str = "") -> dict:
+    """一次拿到完整结果（含 drills）；UI 上请用 grade_stream + start_drills，先出判题结果"""
+    text = openai_client.generate_text(
+        _grade_messages(question, user_answer, unit_hint), temperature=0.2, caller="grade"
+    )
+    data = _parse_json(text)
+    if not data:
+        data = {"explanation": text}
+    result = _normalize_result(data, unit_hint)
+    result["drills"] = [f.result() for f in start_drills(question, result)]
+    return result
+
+
+def grade_mcq_locally(options: dict, answer_key, user_answer: str):
+    """
+    有标准答案的选择题直接本地比对字母，不调 LLM。
+    返回的结果没有 explanation/mistake_type（答错时再按需调 LLM 解释）；没法本地判时返回 None。
+    """
+    answer = (user_answer or "").strip().upper()
+    if not answer_key or answer not in options:
+        return None
+    correct = answer == answer_key
+    return {
+        "is_correct": correct,
+        "correct_answer": f"{answer_key}. {options.get(answer_key, '')}",
+        "explanation": "" if not correct else "答对了。",
+        "mistake_type": "",
+        "unit": "",
+        "topic": "",
+        "drills": [],
+        "graded_locally": True,
+    }
+
+
+def grade_stream(question: str, user_answer: str, unit_hint: str = "", answer_key=None):
+    """
+    流式判题：每个字段解析完整就 yield (field, value)，最后 yield ("result", 完整结果 dict)。
+    UI 可以先显示 correct_answer，再等 drills 慢慢生成。
+    answer_key 已知时会告诉模型标准答案，只让它解释错因。
+    """
+    parser = _ProgressiveJSON()
+    data = {}
+    messages = _grade_messages(question, user_answer, unit_hint, answer_key)
+    for chunk in openai_client.stream_text(messages, temperature=0.2, caller="grade"):
+        for key, value in parser.feed(chunk):
+            data[key] = value
+            yield key, value
+    if not data:
+        # 模型没按 JSON 输出：整段当解析兜底
+        data = _parse_json(parser.buf) or {"explanation": parser.buf}
+    yield "result", _normalize_result(data, unit_hint)
 
 
 # -----------------------------
-# Tab 2: Practice
+# LLM: 同错因练习（判题之后并发生成）
 # -----------------------------
-with tab2:
-    st.subheader("🧪 刷题")
-
-    colA, colB = st.columns([1, 1])
+_drill_pool_lock = threading.Lock()
+_drill_pool = None
 
-    with colA:
-        st.session_state.unit = st.selectbox("选择单元（Unit）", UNITS, index=UNITS.index(st.session_state.unit))
-        topic = st.text_input("topic（可选，比如：for循环/构造器/ArrayList）", "")
 
-        if st.button("生成新题"):
-            st.session_state.current_q = generate_new_question(
-                st.session_state.unit,
-                topic,
-                difficulty="easy",
+def _get_drill_pool() -> ThreadPoolExecutor:
+    # 进程内共享，DRILL_CONCURRENCY 限制同时在跑的练习题请求数（所有学生加起来）
+    global _drill_pool
+    with _drill_pool_lock:
+        if _drill_pool is None:
+            _drill_pool = ThreadPoolExecutor(
+                max_workers=setting("DRILL_CONCURRENCY", 8), thread_name_prefix="drills"
             )
-            st.session_state.last_result = None
-
-    with colB:
-        st.markdown("### 题目")
-        q = st.session_state.current_q or "点击“生成新题”开始。"
-        st.write(q)
-
-    st.divider()
-
-    # ---------- Answer Input ----------
-    st.subheader("提交你的答案（写思路或写最终答案都行）")
-
-    mcq = is_mcq(st.session_state.current_q)
-    opts = extract_mcq_options(st.session_state.current_q) if mcq else {}
-
-    user_answer = ""
-
-    if mcq and opts:
-        # 用 radio 根治大小写/格式问题
-        labels = []
-        keys = ["A", "B", "C", "D"]
-        for k in keys:
-            if k in opts:
-                labels.append(f"{k}. {opts[k]}")
-        # 兜底：如果解析不到四项，就给纯字母
-        if len(labels) < 2:
-            chosen = st.radio("选择你的选项", ["A", "B", "C", "D"], horizontal=True)
-            user_answer = chosen
-        else:
-            chosen_label = st.radio("选择你的选项", labels)
-            user_answer = chosen_label.split(".", 1)[0].strip().upper()
-    else:
-        user_answer = st.text_area("你的答案", height=120, placeholder="例如：C，或写出推导过程/最终值。")
-
-    if st.button("判题 + 生成同错因练习 + 加入错题本"):
-        if not st.session_state.current_q or st.session_state.current_q.startswith("点击"):
-            st.warning("先生成题目。")
-        else:
-            result = grade_and_extract_mistake(
-                question=st.session_state.current_q,
-                user_answer=user_answer,
-                unit_hint=st.session_state.unit,
-            )
-            st.session_state.last_result = result
-
-            st.markdown("## 判题结果")
-            st.write("是否正确：", result.get("is_correct", False))
-
-            st.markdown("### 正确答案")
-            st.write(result.get("correct_answer", ""))
-
-            st.markdown("### 解析/你错在哪")
-            st.write(result.get("explanation", ""))
-
-            st.markdown("### 错因类型")
-            st.write(result.get("mistake_type", ""))
-
-            st.markdown("### 同错因针对练习（3题）")
-            drills = result.get("drills", []) or []
-            for i, d in enumerate(drills, 1):
-                st.markdown(f"**{i}. {d.get('q','')}**")
-                st.caption(f"答案要点：{d.get('a','')}")
-
-            # 写入错题本（只在判错时记录；你想记录全部也可以改）
-            if not result.get("is_correct", False):
-                add_entry(
-                    question=st.session_state.current_q,
-                    user_answer=user_answer,
-                    correct_answer=result.get("correct_answer", ""),
-                    explanation=result.get("explanation", ""),
-                    mistake_type=result.get("mistake_type", ""),
-                    unit=result.get("unit", st.session_state.unit),
-                    topic=result.get("topic", ""),
-                )
-                st.success("已加入错题本 ✅")
-            else:
-                st.info("本题答对了，不加入错题本。")
-
-
-# -----------------------------
-# Tab 3: Wrongbook
-# -----------------------------
-with tab3:
-    st.subheader("📒 错题本")
-
-    entries = list_entries(limit=50)
-    if not entries:
-        st.info("错题本还没有内容。去刷题吧。")
-    else:
-        # 左侧列表
-        left, right = st.columns([1, 2])
-        with left:
-            labels = []
-            ids = []
-            for e in entries:
-                ids.append(e["id"])
-                labels.append(f'#{e["id"]} | {e.get("mistake_type","")} | {e.get("unit","")}')
-            selected = st.selectbox("选择一条错题", list(range(len(labels))), format_func=lambda i: labels[i])
-
-        with right:
-            item = get_entry(ids[selected])
-            st.markdown("### 题目")
-            st.write(item.get("question", ""))
-
-            st.markdown("### 你的答案")
-            st.write(item.get("user_answer", ""))
-
-            st.markdown("### 正确答案")
-            st.write(item.get("correct_answer", ""))
-
-            st.markdown("### 解析")
-            st.write(item.get("explanation", ""))
-
-            st.markdown("### 错因类型")
-            st.write(item.get("mistake_type", ""))
-
-            st.markdown("### Unit / Topic")
-            st.write(item.get("unit", ""), " / ", item.get("topic", ""))
+        return _drill_pool
+
+
+def generate_drill(question: str, result: dict, index: int) -> dict:
+    """针对同一错因出 1 道练习题，返回 {"q": ..., "a": ...}"""
+    system = (
+        "你是AP CSA(Java)老师。针对学生的错因出1道短练习题（和原题考点相同、情境不同）。"
+        '只输出JSON：{"q": "题目", "a": "答案要点"}。'
+    )
+    user = (
+        f"原题：\n{question}\n\n正确答案：{result.get('correct_answer', '')}\n"
+        f"错因类型：{result.get('mistake_type', '')}\n单元：{result.get('unit', '')}\n"
+        f"这是第 {index} 题，请和其他几题换不同的情境。"
+    )
+    text = openai_client.generate_text(
+        [{"role": "system", "content": system}, {"role": "user", "content": user}],
+        temperature=0.7,
+        caller="drill",
+    )
+    data = _parse_json(text)
+    return {"q": str(data.get("q", text)), "a": str(data.get("a", ""))}
+
+
+def start_drills(question: str, result: dict, n: int = DRILL_COUNT, on_complete=None):
+    """
+    把 n 道练习题丢进共享线程池并发生成，立刻返回 futures（按题号顺序）。
+    on_complete(drills) 会在全部完成后在后台线程里调用，页面已经刷新走了也照样执行。
+    """
+    pool = _get_drill_pool()
+    # 每个任务带一份当前 context（telemetry 按它记是哪个学生的调用）
+    futures = [
+        pool.submit(contextvars.copy_context().run, generate_drill, question, result, i)
+        for i in range(1, n + 1)
+    ]
+    if on_complete is not None:
+        lock = threading.Lock()
+        remaining = [len(futures)]
+
+        def _done(_):
+            with lock:
+                remaining[0] -= 1
+                if remaining[0]:
+                    return
+            drills = [f.result() for f in futures if f.exception() is None]
+            on_complete(drills)
+
+        for f in futures:
+            f.add_done_callback(_done)
+    return futures
@@ -1,51 +1,693 @@
+import hashlib
+import re
 import sqlite3
-from datetime import datetime
+import threading
+from datetime import datetime, timedelta
 from pathlib import Path
 
+from services import db
+from services.mistake_taxonomy import ALIAS_THRESHOLD, SEED, Canonicalizer, normalize
+
 DB_PATH = Path("wrongbook.db")
 
+# 长文本列：正文按内容去重、压缩后存在 text_blobs 里，wrongbook 只存引用（<列>_id）
+TEXT_COLUMNS = ("question", "correct_answer", "explanation")
+
+# add_entry / insert_entries 按这个顺序给值，长文本列给原文
+INSERT_COLUMNS = (
+    "created_at", "unit", "topic", "question", "user_answer", "correct_answer", "explanation", "mistake_type",
+    "next_drill", "user_id", "due_at", "mistake_type_id", "content_hash",
+)
+
+
+def _insert_sql(columns, ignore=False) -> str:
+    cols = [f"{col}_id" if col in TEXT_COLUMNS else col for col in columns]
+    return (f"INSERT {'OR IGNORE ' if ignore else ''}INTO wrongbook ({', '.join(cols)}) "
+            f"VALUES ({', '.join('?' * len(cols))})")
+
+
+# 参数里的长文本列是 text_blobs 的 id（见 text_id）；直接给原文请用 insert_entries
+INSERT_SQL = _insert_sql(INSERT_COLUMNS)
+BLOB_INSERT_SQL = "INSERT OR IGNORE INTO text_blobs (id, data) VALUES (?, ?)"
+
+# wrongbook_full 视图的列（和表里原来的列顺序一致，长文本列是还原后的原文）
+FULL_COLUMNS = (
+    "id", "created_at", "unit", "topic", "question", "user_answer", "correct_answer", "explanation", "mistake_type",
+    "next_drill", "user_id", "ease", "interval_days", "reps", "lapses", "due_at", "last_reviewed_at",
+    "mistake_type_id", "content_hash",
+)
+
+# 内容哈希只算这几列：谁、什么时候、哪道题、答了什么（解析/错因/练习之后还会补写，不算在内）
+HASH_COLUMNS = ("user_id", "created_at", "unit", "topic", "question", "user_answer", "correct_answer")
+
+# 列表页只要这些轻量列，不拉题目/答案全文
+SUMMARY_COLUMNS = "id, created_at, unit, topic, mistake_type"
+
+
 def _conn():
-    return sqlite3.connect(DB_PATH)
+    return db.connect(DB_PATH)
 
-def init_db():
-    with _conn() as c:
-        c.execute("""
-        CREATE TABLE IF NOT EXISTS wrongbook (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            created_at TEXT,
-            unit TEXT,
-            topic TEXT,
-            question TEXT,
-            user_answer TEXT,
-            correct_answer TEXT,
-            explanation TEXT,
-            mistake_type TEXT,
-            next_drill TEXT
-        )
+
+def _create_base_table(c):
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS wrongbook (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        created_at TEXT,
+        unit TEXT,
+        topic TEXT,
+        question TEXT,
+        user_answer TEXT,
+        correct_answer TEXT,
+        explanation TEXT,
+        mistake_type TEXT,
+        next_drill TEXT
+    )
+    """)
+
+
+def _add_user_scope(c):
+    # 旧数据没有用户信息，user_id 留空字符串
+    c.execute("ALTER TABLE wrongbook ADD COLUMN user_id TEXT NOT NULL DEFAULT ''")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_wrongbook_user_created ON wrongbook(user_id, created_at)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_wrongbook_unit ON wrongbook(unit)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_wrongbook_mistake_type ON wrongbook(mistake_type)")
+
+
+FTS_COLUMNS = "question, explanation, mistake_type, topic, owner"
+# 搜索词只在这几列里找（owner 列只用来限定学生）
+FTS_TEXT_COLUMNS = "question explanation mistake_type topic"
+_OWNER_TOKEN = re.compile(r"u(?:[0-9a-f]{2})+", re.I)
+
+# 索引里存的是 fts_segment 切过字的副本；owner 是 'u' + hex(user_id)，一个词就能把搜索限定在某个学生
+FTS_VALUES = """
+fts_segment({p}.question), fts_segment({p}.explanation), fts_segment({p}.mistake_type),
+fts_segment({p}.topic), 'u' || hex({p}.user_id)
+"""
+
+
+def _add_search_index(c):
+    c.execute(f"CREATE VIRTUAL TABLE wrongbook_fts USING fts5({FTS_COLUMNS}, tokenize='unicode61')")
+    # owner 列不参与相关度打分
+    c.execute("INSERT INTO wrongbook_fts(wrongbook_fts, rank) VALUES ('rank', 'bm25(1.0, 1.0, 1.0, 1.0, 0.0)')")
+    c.execute(f"""
+    CREATE TRIGGER wrongbook_fts_ai AFTER INSERT ON wrongbook BEGIN
+        INSERT INTO wrongbook_fts(rowid, {FTS_COLUMNS}) VALUES (new.id, {FTS_VALUES.format(p="new")});
+    END
+    """)
+    c.execute("""
+    CREATE TRIGGER wrongbook_fts_ad AFTER DELETE ON wrongbook BEGIN
+        DELETE FROM wrongbook_fts WHERE rowid = old.id;
+    END
+    """)
+    c.execute(f"""
+    CREATE TRIGGER wrongbook_fts_au AFTER UPDATE OF question, explanation, mistake_type, topic, user_id
+    ON wrongbook BEGIN
+        DELETE FROM wrongbook_fts WHERE rowid = old.id;
+        INSERT INTO wrongbook_fts(rowid, {FTS_COLUMNS}) VALUES (new.id, {FTS_VALUES.format(p="new")});
+    END
+    """)
+    # 已有数据一次性回填
+    _fill_search_index(c)
+
+
+def _fill_search_index(c):
+    c.execute("DELETE FROM wrongbook_fts")
+    c.execute(f"""
+    INSERT INTO wrongbook_fts(rowid, {FTS_COLUMNS})
+    SELECT w.id, {FTS_VALUES.format(p="w")} FROM wrongbook w
+    """)
+
+
+def _add_review_schedule(c):
+    # SM-2 复习状态：ease 难度系数、interval_days 当前间隔、reps 连续答对次数、due_at 下次复习时间（UTC ISO）
+    c.execute("ALTER TABLE wrongbook ADD COLUMN ease REAL NOT NULL DEFAULT 2.5")
+    c.execute("ALTER TABLE wrongbook ADD COLUMN interval_days INTEGER NOT NULL DEFAULT 0")
+    c.execute("ALTER TABLE wrongbook ADD COLUMN reps INTEGER NOT NULL DEFAULT 0")
+    c.execute("ALTER TABLE wrongbook ADD COLUMN lapses INTEGER NOT NULL DEFAULT 0")
+    c.execute("ALTER TABLE wrongbook ADD COLUMN due_at TEXT")
+    c.execute("ALTER TABLE wrongbook ADD COLUMN last_reviewed_at TEXT")
+    c.execute("UPDATE wrongbook SET due_at = created_at WHERE due_at IS NULL")  # 旧错题立刻可以复习
+    c.execute("CREATE INDEX IF NOT EXISTS idx_wrongbook_user_due ON wrongbook(user_id, due_at)")
+
+    # 每个学生每天到期多少题：由触发器随插入/复习/删除增量维护，“今天到期几题”不用扫表
+    c.execute("""
+    CREATE TABLE review_due (
+        user_id TEXT NOT NULL,
+        day TEXT NOT NULL,
+        n INTEGER NOT NULL,
+        PRIMARY KEY (user_id, day)
+    ) WITHOUT ROWID
+    """)
+    c.execute("""
+    INSERT INTO review_due (user_id, day, n)
+    SELECT user_id, substr(due_at, 1, 10), COUNT(*) FROM wrongbook GROUP BY user_id, substr(due_at, 1, 10)
+    """)
+    inc = """
+        INSERT INTO review_due (user_id, day, n) VALUES (new.user_id, substr(new.due_at, 1, 10), 1)
+        ON CONFLICT(user_id, day) DO UPDATE SET n = n + 1;
+    """
+    dec = """
+        UPDATE review_due SET n = n - 1 WHERE user_id = old.user_id AND day = substr(old.due_at, 1, 10);
+        DELETE FROM review_due WHERE user_id = old.user_id AND day = substr(old.due_at, 1, 10) AND n <= 0;
+    """
+    c.execute(f"CREATE TRIGGER review_due_ai AFTER INSERT ON wrongbook WHEN new.due_at IS NOT NULL BEGIN {inc} END")
+    c.execute(f"CREATE TRIGGER review_due_ad AFTER DELETE ON wrongbook WHEN old.due_at IS NOT NULL BEGIN {dec} END")
+    changed = "(old.due_at IS NOT new.due_at OR old.user_id IS NOT new.user_id)"
+    c.execute(f"""
+    CREATE TRIGGER review_due_au_old AFTER UPDATE OF due_at, user_id ON wrongbook
+    WHEN old.due_at IS NOT NULL AND {changed} BEGIN {dec} END
+    """)
+    c.execute(f"""
+    CREATE TRIGGER review_due_au_new AFTER UPDATE OF due_at, user_id ON wrongbook
+    WHEN new.due_at IS NOT NULL AND {changed} BEGIN {inc} END
+    """)
+
+
+# 错因统计的维度：(dim, 列)；scope 'u' 是单个学生，'c' 是全班（user_id 留空）
+# 错因按规范化后的 mistake_type_id 统计（key 存 id），第 5 步迁移时还是按原文统计
+STAT_DIMS = (("unit", "unit"), ("topic", "topic"), ("mistake_type", "mistake_type_id"))
+_STAT_DIMS_V5 = (("unit", "unit"), ("topic", "topic"), ("mistake_type", "mistake_type"))
+
+
+def _stat_upserts(p: str, delta: int, dims) -> str:
+    """触发器里用：把 {p} 这一行（new/old）按 delta 计进各维度计数和按天趋势"""
+    sql = []
+    for scope, uid in (("u", f"{p}.user_id"), ("c", "''")):
+        for dim, col in dims:
+            sql.append(f"""
+            INSERT INTO mistake_stats (scope, user_id, dim, key, n)
+            VALUES ('{scope}', {uid}, '{dim}', COALESCE({p}.{col}, ''), {delta})
+            ON CONFLICT(scope, user_id, dim, key) DO UPDATE SET n = n + excluded.n;""")
+        sql.append(f"""
+        INSERT INTO mistake_trend (scope, user_id, day, unit, n)
+        VALUES ('{scope}', {uid}, substr({p}.created_at, 1, 10), COALESCE({p}.unit, ''), {delta})
+        ON CONFLICT(scope, user_id, day, unit) DO UPDATE SET n = n + excluded.n;""")
+    return "".join(sql)
+
+
+def _add_mistake_stats(c):
+    # 错因分析的预聚合表：由触发器在 add_entry 同一个事务里增量更新，看板只读这几张小表
+    c.execute("""
+    CREATE TABLE mistake_stats (
+        scope TEXT NOT NULL,
+        user_id TEXT NOT NULL,
+        dim TEXT NOT NULL,
+        key TEXT NOT NULL,
+        n INTEGER NOT NULL,
+        PRIMARY KEY (scope, user_id, dim, key)
+    ) WITHOUT ROWID
+    """)
+    c.execute("""
+    CREATE TABLE mistake_trend (
+        scope TEXT NOT NULL,
+        user_id TEXT NOT NULL,
+        day TEXT NOT NULL,
+        unit TEXT NOT NULL,
+        n INTEGER NOT NULL,
+        PRIMARY KEY (scope, user_id, day, unit)
+    ) WITHOUT ROWID
+    """)
+    _create_stat_triggers(c, _STAT_DIMS_V5)
+    _fill_mistake_stats(c, _STAT_DIMS_V5)
+
+
+def _create_stat_triggers(c, dims):
+    c.execute("DROP TRIGGER IF EXISTS mistake_stats_ai")
+    c.execute("DROP TRIGGER IF EXISTS mistake_stats_ad")
+    c.execute("DROP TRIGGER IF EXISTS mistake_stats_au")
+    c.execute(f"CREATE TRIGGER mistake_stats_ai AFTER INSERT ON wrongbook BEGIN {_stat_upserts('new', 1, dims)} END")
+    c.execute(f"CREATE TRIGGER mistake_stats_ad AFTER DELETE ON wrongbook BEGIN {_stat_upserts('old', -1, dims)} END")
+    c.execute(f"""
+    CREATE TRIGGER mistake_stats_au AFTER UPDATE OF {', '.join(col for _, col in dims)}, user_id, created_at
+    ON wrongbook BEGIN {_stat_upserts('old', -1, dims)} {_stat_upserts('new', 1, dims)} END
+    """)
+
+
+def _fill_mistake_stats(c, dims=STAT_DIMS):
+    c.execute("DELETE FROM mistake_stats")
+    c.execute("DELETE FROM mistake_trend")
+    for scope, uid in (("u", "user_id"), ("c", "''")):
+        for dim, col in dims:
+            c.execute(f"""
+            INSERT INTO mistake_stats (scope, user_id, dim, key, n)
+            SELECT '{scope}', {uid}, '{dim}', COALESCE({col}, ''), COUNT(*) FROM wrongbook
+            GROUP BY {uid}, COALESCE({col}, '')
+            """)
+        c.execute(f"""
+        INSERT INTO mistake_trend (scope, user_id, day, unit, n)
+        SELECT '{scope}', {uid}, substr(created_at, 1, 10), COALESCE(unit, ''), COUNT(*) FROM wrongbook
+        GROUP BY {uid}, substr(created_at, 1, 10), COALESCE(unit, '')
         """)
-        c.commit()
 
-def add_entry(unit, topic, question, user_answer, correct_answer, explanation, mistake_type, next_drill):
+
+def _add_mistake_taxonomy(c):
+    # 规范错因表 + 别名表（别名存原文，加载时再规范化），错题本上加一个整数 mistake_type_id
+    c.execute("CREATE TABLE mistake_types (id INTEGER PRIMARY KEY, name TEXT NOT NULL UNIQUE)")
+    c.execute("""
+    CREATE TABLE mistake_aliases (
+        alias TEXT PRIMARY KEY,
+        type_id INTEGER NOT NULL REFERENCES mistake_types(id)
+    ) WITHOUT ROWID
+    """)
+    for name, aliases in SEED.items():
+        type_id = c.execute("INSERT INTO mistake_types (name) VALUES (?)", (name,)).lastrowid
+        c.executemany("INSERT OR IGNORE INTO mistake_aliases VALUES (?, ?)", [(a, type_id) for a in [name, *aliases]])
+    c.execute("ALTER TABLE wrongbook ADD COLUMN mistake_type_id INTEGER REFERENCES mistake_types(id)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_wrongbook_user_mistake_type_id ON wrongbook(user_id, mistake_type_id)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_wrongbook_mistake_type_id ON wrongbook(mistake_type_id)")
+    _backfill_mistake_type_ids(c, _load_canonicalizer(c))
+    # 统计改按 id 分组
+    _create_stat_triggers(c, STAT_DIMS)
+    _fill_mistake_stats(c)
+
+
+def content_hash(user_id, created_at, unit, topic, question, user_answer, correct_answer) -> str:
+    """一条错题的内容哈希（HASH_COLUMNS 的顺序），导入时按它去重"""
+    values = (user_id, created_at, unit, topic, question, user_answer, correct_answer)
+    payload = "\x1f".join("" if v is None else str(v) for v in values)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:32]
+
+
+def _add_content_hash(c):
+    # 唯一索引允许多个 NULL；回填时万一已有完全相同的两条，后一条留空（UPDATE OR IGNORE），不影响迁移
+    c.execute("ALTER TABLE wrongbook ADD COLUMN content_hash TEXT")
+    c.execute("CREATE UNIQUE INDEX idx_wrongbook_content_hash ON wrongbook(content_hash)")
+    cur = c.execute(f"SELECT id, {', '.join(HASH_COLUMNS)} FROM wrongbook")
+    while rows := cur.fetchmany(5000):
+        c.executemany("UPDATE OR IGNORE wrongbook SET content_hash=? WHERE id=?",
+                      [(content_hash(*r[1:]), r[0]) for r in rows])
+
+
+def _chunks(c, columns, table="wrongbook", size=5000):
+    """按 id 分块读整张表（每块重新查，边读边改同一张表也安全）"""
+    last = 0
+    while rows := c.execute(
+        f"SELECT {columns} FROM {table} WHERE id > ? ORDER BY id LIMIT ?", (last, size)
+    ).fetchall():
+        yield rows
+        last = rows[-1][0]
+
+
+def text_id(text: str) -> int:
+    """正文的内容地址：sha256 的前 8 字节（去掉符号位），同样的正文只存一份"""
+    return int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "big") >> 1
+
+
+def _intern_texts(c, texts) -> dict:
+    """把一批正文存进 text_blobs（库里已有的不再压缩），返回 {正文: id}"""
+    ids = {t: text_id(t) for t in set(texts)}
+    wanted = list(ids.values())
+    known = set()
+    for i in range(0, len(wanted), 500):
+        part = wanted[i:i + 500]
+        known.update(r[0] for r in c.execute(f"SELECT id FROM text_blobs WHERE id IN ({', '.join('?' * len(part))})",
+                                             part))
+    c.executemany(BLOB_INSERT_SQL, [(i, db.pack_text(t)) for t, i in ids.items() if i not in known])
+    return ids
+
+
+def insert_entries(c, columns, rows, ignore=False) -> int:
+    """
+    在 c 当前的事务里批量插入错题：rows 按 columns 的顺序给值，长文本列给原文，这里换成 text_blobs 引用。
+    ignore=True 时撞上唯一索引（内容哈希）的行跳过。返回实际插入的行数。
+    """
+    at = [i for i, col in enumerate(columns) if col in TEXT_COLUMNS]
+    rows = [list(r) for r in rows]
+    ids = _intern_texts(c, [r[i] for r in rows for i in at if r[i] is not None])
+    for r in rows:
+        for i in at:
+            r[i] = ids.get(r[i])
+    return c.executemany(_insert_sql(columns, ignore), rows).rowcount
+
+
+def _text_sql(p: str, col: str) -> str:
+    """{p} 这一行某个长文本列的原文：老办法直接写进原列的行也照样能读"""
+    return f"COALESCE({p}.{col}, text_unpack((SELECT data FROM text_blobs WHERE id = {p}.{col}_id)))"
+
+
+def _fts_values(p: str) -> str:
+    return ", ".join([
+        f"fts_segment({_text_sql(p, 'question')})", f"fts_segment({_text_sql(p, 'explanation')})",
+        f"fts_segment({p}.mistake_type)", f"fts_segment({p}.topic)", f"'u' || hex({p}.user_id)",
+    ])
+
+
+def _add_text_blobs(c):
+    # 同一道题全班都错时，题目/答案/解析的正文只存一份（zlib 压缩），wrongbook 里只留 id
+    c.execute("CREATE TABLE text_blobs (id INTEGER PRIMARY KEY, data BLOB NOT NULL)")
+    for col in TEXT_COLUMNS:
+        c.execute(f"ALTER TABLE wrongbook ADD COLUMN {col}_id INTEGER REFERENCES text_blobs(id)")
+
+    # 全文索引改成外部内容表：正文从视图现读，不再自己另存一份。先删掉旧的，搬数据时不用逐行更新索引
+    for t in ("wrongbook_fts_ai", "wrongbook_fts_ad", "wrongbook_fts_au"):
+        c.execute(f"DROP TRIGGER {t}")
+    c.execute("DROP TABLE wrongbook_fts")
+
+    # 已有数据搬进 text_blobs，原列清空（init_db 跑完后 VACUUM 把空间还回去）
+    moved = ", ".join(f"{col}=NULL, {col}_id=?" for col in TEXT_COLUMNS)
+    for rows in _chunks(c, f"id, {', '.join(TEXT_COLUMNS)}"):
+        ids = _intern_texts(c, [t for r in rows for t in r[1:] if t is not None])
+        c.executemany(f"UPDATE wrongbook SET {moved} WHERE id=?", [(*(ids.get(t) for t in r[1:]), r[0]) for r in rows])
+
+    full = [f"{_text_sql('w', col)} AS {col}" if col in TEXT_COLUMNS else f"w.{col}" for col in FULL_COLUMNS]
+    c.execute(f"CREATE VIEW wrongbook_full AS SELECT {', '.join(full)} FROM wrongbook w")
+    # 外部内容表按 rowid 从这个视图里取原文（snippet、rebuild 用）
+    c.execute(f"CREATE VIEW wrongbook_fts_source ({'id, ' + FTS_COLUMNS}) AS SELECT w.id, {_fts_values('w')} "
+              "FROM wrongbook w")
+    c.execute(f"""
+    CREATE VIRTUAL TABLE wrongbook_fts USING fts5(
+        {FTS_COLUMNS}, tokenize='unicode61', content='wrongbook_fts_source', content_rowid='id'
+    )
+    """)
+    c.execute("INSERT INTO wrongbook_fts(wrongbook_fts, rank) VALUES ('rank', 'bm25(1.0, 1.0, 1.0, 1.0, 0.0)')")
+    # 外部内容表删除时要给出旧值
+    delete = (f"INSERT INTO wrongbook_fts(wrongbook_fts, rowid, {FTS_COLUMNS}) "
+              f"VALUES ('delete', old.id, {_fts_values('old')});")
+    insert = f"INSERT INTO wrongbook_fts(rowid, {FTS_COLUMNS}) VALUES (new.id, {_fts_values('new')});"
+    c.execute(f"CREATE TRIGGER wrongbook_fts_ai AFTER INSERT ON wrongbook BEGIN {insert} END")
+    c.execute(f"CREATE TRIGGER wrongbook_fts_ad AFTER DELETE ON wrongbook BEGIN {delete} END")
+    c.execute(f"""
+    CREATE TRIGGER wrongbook_fts_au AFTER UPDATE OF question, explanation, question_id, explanation_id,
+        mistake_type, topic, user_id
+    ON wrongbook BEGIN {delete} {insert} END
+    """)
+    c.execute("INSERT INTO wrongbook_fts(wrongbook_fts) VALUES ('rebuild')")
+
+
+def _recompute_content_hash(c):
+    # 第 7 步的回填是边游标读边改同一张表，个别行可能漏算；按 id 分块重算一遍，老库和新库的哈希一致，
+    # 跨部署导入才去得了重（正文从 wrongbook_full 读，第 8 步已经搬进 text_blobs）
+    for rows in _chunks(c, f"id, {', '.join(HASH_COLUMNS)}", table="wrongbook_full"):
+        c.executemany("UPDATE OR IGNORE wrongbook SET content_hash=? WHERE id=? AND content_hash IS NOT ?",
+                      [(h, r[0], h) for r in rows for h in (content_hash(*r[1:]),)])
+
+
+def _drop_stats_revision(c):
+    # 页面缓存改按进程内的 version() 失效以后，mistake_stats 里的 _rev 行没人读了：
+    # 触发器重建成不带它的，每次写入少两次 upsert（其中一行是全班共用的热点行）
+    _create_stat_triggers(c, STAT_DIMS)
+    c.execute("DELETE FROM mistake_stats WHERE dim='_rev'")
+
+
+# 按顺序执行；PRAGMA user_version 记录已经跑到第几个，只追加不修改
+MIGRATIONS = [
+    _create_base_table,
+    _add_user_scope,
+    _add_search_index,
+    _add_review_schedule,
+    _add_mistake_stats,
+    _add_mistake_taxonomy,
+    _add_content_hash,
+    _add_text_blobs,
+    _recompute_content_hash,
+    _drop_stats_revision,
+]
+
+# 新错题第一次复习在一天后
+FIRST_REVIEW_DELAY = timedelta(days=1)
+
+
+def init_db():
+    c = _conn()
+    while True:
+        # 每一步迁移单独一个写事务；版本号在锁内重新读，多个进程同时启动也只会跑一次
+        c.execute("BEGIN IMMEDIATE")
+        version = c.execute("PRAGMA user_version").fetchone()[0]
+        if version >= len(MIGRATIONS):
+            c.commit()
+            break
+        try:
+            MIGRATIONS[version](c)
+            c.execute(f"PRAGMA user_version = {version + 1}")
+            c.commit()
+        except Exception:
+            c.rollback()
+            raise
+        if MIGRATIONS[version] is _add_text_blobs:
+            # 原列里的正文搬走以后，把腾出来的页还给文件系统（别的连接正在读就下次启动再说）
+            try:
+                c.execute("VACUUM")
+            except sqlite3.OperationalError:
+                pass
+    # 每次启动顺手清掉没人引用的正文（几十万行的库一两秒）；库被别的进程占着就下次再说
+    try:
+        prune_text_blobs()
+    except sqlite3.OperationalError:
+        pass
+
+
+# -----------------------------
+# 错因归一：自由文本 mistake_type -> mistake_types.id
+# -----------------------------
+_canon_lock = threading.Lock()
+_canon = None
+
+
+def _load_canonicalizer(c) -> Canonicalizer:
+    return Canonicalizer(c.execute("SELECT alias, type_id FROM mistake_aliases").fetchall())
+
+
+def _resolve(c, canon: Canonicalizer, text, create=True):
+    """
+    返回 (text 对应的规范错因 id, 新记下的别名 (text, id) 或 None)；空文本返回 (None, None)。
+    create=True 时没命中就新建一个规范错因（原文就是它的别名）。近似命中只有相似度够高（ALIAS_THRESHOLD）
+    才记成别名，免得 A≈B、B≈C 一路串下去把不相干的说法归到一起。
+    别名只写进 c 当前的事务，内存里的 canon 由调用方在提交成功后再 add。
+    """
+    if not normalize(text):
+        return None, None
+    type_id, score = canon.match(text)
+    if type_id is None:
+        if not create:
+            return None, None
+        name = " ".join(str(text).split())[:60]
+        c.execute("INSERT OR IGNORE INTO mistake_types (name) VALUES (?)", (name,))
+        type_id = c.execute("SELECT id FROM mistake_types WHERE name=?", (name,)).fetchone()[0]
+    elif not ALIAS_THRESHOLD <= score < 1.0:
+        return type_id, None
+    c.execute("INSERT OR IGNORE INTO mistake_aliases VALUES (?, ?)", (str(text).strip(), type_id))
+    return type_id, (text, type_id)
+
+
+def mistake_type_id(text, create=True):
+    """把 LLM 给的错因原文映射到规范错因 id（本地 TF-IDF 相似度，不联网）"""
+    global _canon
+    if not normalize(text):
+        return None
+    with _canon_lock:
+        c = _conn()
+        if _canon is None:
+            _canon = _load_canonicalizer(c)
+        if not create:
+            return _canon.match(text)[0]
+        with c:
+            type_id, alias = _resolve(c, _canon, text, create)
+        if alias is not None:
+            _canon.add(*alias)  # 提交成功了才进内存
+        return type_id
+
+
+def _backfill_mistake_type_ids(c, canon, only_missing=False):
+    # 按不同的原文逐个映射，再用 mistake_type 上的索引批量回写
+    values = [r[0] for r in c.execute(
+        f"SELECT DISTINCT mistake_type FROM wrongbook {'WHERE mistake_type_id IS NULL' if only_missing else ''}"
+    )]
+    for text in values:
+        type_id, alias = _resolve(c, canon, text)
+        if alias is not None:
+            canon.add(*alias)  # canon 是这次回填自己加载的，事务失败就整个丢掉
+        c.execute("UPDATE wrongbook SET mistake_type_id=? WHERE mistake_type IS ?", (type_id, text))
+    return len(values)
+
+
+def backfill_mistake_type_ids(only_missing=False) -> int:
+    """给已有错题补算/重算 mistake_type_id（调整了 SEED 别名后可以重跑），返回处理了多少种原文"""
+    global _canon
+    with _canon_lock:
+        c = _conn()
+        with c:
+            canon = _load_canonicalizer(c)
+            n = _backfill_mistake_type_ids(c, canon, only_missing)
+        _canon = canon
+    mark_changed()
+    return n
+
+
+def mistake_type_names() -> dict:
+    """{id: 规范错因名}"""
     with _conn() as c:
-        c.execute("""
-        INSERT INTO wrongbook
-        (created_at, unit, topic, question, user_answer, correct_answer, explanation, mistake_type, next_drill)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """, (
-            datetime.utcnow().isoformat(),
-            unit, topic, question, user_answer, correct_answer, explanation, mistake_type, next_drill
-        ))
-        c.commit()
+        return dict(c.execute("SELECT id, name FROM mistake_types").fetchall())
+
+
+# -----------------------------
+# 版本号：页面缓存（st.cache_data）拿它当 key，写入提交后才 +1，没变化的 rerun 不查库
+# 只统计本进程内的写入（Streamlit 单进程部署）
+# -----------------------------
+_version_lock = threading.Lock()
+_versions = {}
+_epoch = 0  # 不知道是哪个学生的改动（重建、回填）时整体失效
+_total = 0
+
+
+def mark_changed(user_id=None):
+    global _epoch, _total
+    with _version_lock:
+        _total += 1
+        if user_id is None:
+            _epoch += 1
+        else:
+            _versions[user_id] = _versions.get(user_id, 0) + 1
+
+
+def version(user_id=None):
+    """user_id 的错题数据版本；None 表示全班（任何人有变化都会变）"""
+    if user_id is None:
+        return _total
+    return _epoch, _versions.get(user_id, 0)
+
+
+def add_entry(unit, topic, question, user_answer, correct_answer, explanation, mistake_type, next_drill,
+              user_id=""):
+    """经批量写线程写入：多个会话同时提交时合并成一次事务；返回新记录 id"""
+    now = datetime.utcnow()
+    created_at = now.isoformat()
+    texts = {t: text_id(t) for t in (question, correct_answer, explanation) if t is not None}
+    entry_id = db.writer(DB_PATH).submit(INSERT_SQL, (
+        created_at,
+        unit, topic, texts.get(question), user_answer, texts.get(correct_answer), texts.get(explanation),
+        mistake_type, next_drill, user_id,
+        (now + FIRST_REVIEW_DELAY).isoformat(), mistake_type_id(mistake_type),
+        content_hash(user_id, created_at, unit, topic, question, user_answer, correct_answer),
+    ), before=[(BLOB_INSERT_SQL, (i, db.pack_text(t))) for t, i in texts.items()])
+    mark_changed(user_id)
+    return entry_id
+
+
+def set_next_drill(entry_id: int, next_drill: str, user_id=None):
+    """判题后异步生成的练习题补写回来"""
+    db.writer(DB_PATH).submit("UPDATE wrongbook SET next_drill=? WHERE id=?", (next_drill, entry_id))
+    mark_changed(user_id)
+
+
+def set_explanation(entry_id: int, explanation: str, mistake_type: str, unit: str = "", topic: str = "",
+                    user_id=None):
+    """本地判错的选择题，学生点了“解释”之后把 LLM 给的解析/错因补写回来（unit/topic 为空则不改）"""
+    explanation_id = text_id(explanation)
+    db.writer(DB_PATH).submit("""
+    UPDATE wrongbook SET explanation=NULL, explanation_id=?, mistake_type=?, mistake_type_id=?,
+        unit=COALESCE(NULLIF(?, ''), unit), topic=COALESCE(NULLIF(?, ''), topic)
+    WHERE id=?
+    """, (explanation_id, mistake_type, mistake_type_id(mistake_type), unit, topic, entry_id),
+        before=[(BLOB_INSERT_SQL, (explanation_id, db.pack_text(explanation)))])
+    mark_changed(user_id)
+
 
 def list_entries(limit=200):
     with _conn() as c:
         rows = c.execute("""
         SELECT id, created_at, unit, topic, question, user_answer, correct_answer, mistake_type
-        FROM wrongbook ORDER BY id DESC LIMIT ?
+        FROM wrongbook_full ORDER BY id DESC LIMIT ?
         """, (limit,)).fetchall()
     return rows
 
-def get_entry(entry_id: int):
+
+def list_page(user_id, cursor=None, limit=20, unit=None, topic=None, mistake_type=None):
+    """
+    某个学生的错题列表（新的在前），keyset 分页：
+    cursor 是上一页最后一行的 (created_at, id)，返回 (rows, next_cursor)；没有下一页时 next_cursor 为 None。
+    rows 只含 SUMMARY_COLUMNS。unit/topic 为精确匹配筛选；mistake_type 按规范错因筛（同义说法也算）。
+    """
+    where = ["user_id=?"]
+    params = [user_id]
+    for col, val in (("unit", unit), ("topic", topic)):
+        if val:
+            where.append(f"{col}=?")
+            params.append(val)
+    if mistake_type:
+        type_id = mistake_type_id(mistake_type, create=False)
+        where.append("mistake_type_id=?" if type_id is not None else "mistake_type=?")
+        params.append(type_id if type_id is not None else mistake_type)
+    if cursor is not None:
+        where.append("(created_at, id) < (?, ?)")
+        params.extend(cursor)
+    with _conn() as c:
+        rows = c.execute(f"""
+        SELECT {SUMMARY_COLUMNS} FROM wrongbook
+        WHERE {' AND '.join(where)}
+        ORDER BY created_at DESC, id DESC LIMIT ?
+        """, (*params, limit + 1)).fetchall()
+    next_cursor = (rows[limit - 1][1], rows[limit - 1][0]) if len(rows) > limit else None
+    return rows[:limit], next_cursor
+
+
+def get_entry(entry_id: int, user_id=None):
+    """user_id 不为 None 时只返回该学生自己的记录"""
     with _conn() as c:
-        row = c.execute("SELECT * FROM wrongbook WHERE id=?", (entry_id,)).fetchone()
+        if user_id is None:
+            row = c.execute("SELECT * FROM wrongbook_full WHERE id=?", (entry_id,)).fetchone()
+        else:
+            row = c.execute("SELECT * FROM wrongbook_full WHERE id=? AND user_id=?", (entry_id, user_id)).fetchone()
     return row
+
+
+def rebuild_search_index():
+    """按 wrongbook 表重建全文索引（老库回填、索引损坏或绕过触发器改过数据后用）"""
+    with _conn() as c:
+        c.execute("INSERT INTO wrongbook_fts(wrongbook_fts) VALUES ('rebuild')")
+        c.execute("INSERT INTO wrongbook_fts(wrongbook_fts) VALUES ('optimize')")
+
+
+def prune_text_blobs() -> int:
+    """
+    删掉没有错题再引用的正文（补写解析换下来的旧版本、导入时重复行被跳过但正文已经存进来的），返回删了几条。
+    NOT IN 已经保证没人引用，外键检查先关掉：*_id 列上没有索引，逐行检查每删一条都要扫一遍错题本。
+    """
+    refs = " UNION ".join(f"SELECT {col}_id FROM wrongbook WHERE {col}_id IS NOT NULL" for col in TEXT_COLUMNS)
+    c = _conn()
+    c.execute("PRAGMA foreign_keys=OFF")
+    try:
+        with c:
+            return c.execute(f"DELETE FROM text_blobs WHERE id NOT IN ({refs})").rowcount
+    finally:
+        c.execute("PRAGMA foreign_keys=ON")
+
+
+def rebuild_mistake_stats():
+    """按 wrongbook 表重算错因统计（绕过触发器改过数据后用）"""
+    with _conn() as c:
+        _fill_mistake_stats(c)
+    mark_changed()
+
+
+def _fts_query(user_id, text: str):
+    """
+    每个词加引号当短语（汉字切成单字后按相邻顺序匹配），避免 - * " 等被当成 FTS 语法；词之间是 AND。
+    长得像 owner 标记（u + 十六进制）的词去掉；一个词都不剩时返回 None。
+    """
+    words = [t for t in text.split() if not _OWNER_TOKEN.fullmatch(t)]
+    if not words:
+        return None
+    terms = " ".join('"' + db.segment_cjk(t).replace('"', '""') + '"' for t in words)
+    owner = "u" + user_id.encode("utf-8").hex().upper()
+    return f"owner:{owner} AND {{{FTS_TEXT_COLUMNS}}} : ({terms})"
+
+
+def search(user_id, text: str, limit=20):
+    """
+    在某个学生的错题里全文搜索（题目/解析/错因/topic），按 bm25 相关度排序。
+    返回 SUMMARY_COLUMNS + snippet（命中词用 ** 包起来，可直接 markdown 显示）。
+    """
+    query = _fts_query(user_id, text)
+    if query is None:
+        return []
+    with _conn() as c:
+        rows = c.execute(f"""
+        SELECT w.id, w.created_at, w.unit, w.topic, w.mistake_type,
+               snippet(wrongbook_fts, -1, '**', '**', '…', 24), snippet(wrongbook_fts, 0, '**', '**', '…', 24)
+        FROM wrongbook_fts f JOIN wrongbook w ON w.id = f.rowid
+        WHERE wrongbook_fts MATCH ?
+        ORDER BY f.rank LIMIT ?
+        """, (query, limit)).fetchall()
+    # snippet 自己挑列时万一挑中 owner 列（只有一个 owner 标记），改用题目列的摘要，不把内部编码露给页面
+    return [(*r[:5], db.unsegment_cjk(r[6] if _OWNER_TOKEN.fullmatch(r[5].strip("*")) else r[5]).strip())
+            for r in rows]
@@ -0,0 +1,237 @@
+"""
+错题本批量导入/导出（CSV / JSONL / Parquet），用来在两套部署之间搬一个学期的数据、或者拿到表格里看：
+
+- 导出：游标 fetchmany 一块一块地读，边读边写文件，内存不随行数增长
+- 导入：按块读文件，每块一个 wrongbook.insert_entries + 一个事务（写锁只占一小会儿，在线学生的写入可以插进来）
+- 去重：每行按 wrongbook.content_hash 算哈希，撞上唯一索引的跳过（INSERT OR IGNORE），
+  同一个文件导两遍、导到一半中断后重导都不会重复
+- Parquet 要装 pyarrow（可选依赖，只在用到时导入）
+
+命令行：
+    python -m services.wrongbook_io export wrongbook.csv [--user 学生]
+    python -m services.wrongbook_io import wrongbook.jsonl [--db other.db]
+
+页面缓存的版本号只记本进程的写入：命令行导入到正在运行的部署，已打开的页面要等该学生下次写入（或重启）才看到新数据。
+"""
+import argparse
+import csv
+import importlib.util
+import io
+import json
+import time
+from datetime import datetime
+from itertools import islice
+from pathlib import Path
+
+import services.wrongbook as wrongbook
+from services import db
+from services.config import setting
+
+# 导出哪些列（不含 id 和 mistake_type_id：两套部署里各自编号，导入时重新生成）
+COLUMNS = [
+    "created_at", "unit", "topic", "question", "user_answer", "correct_answer", "explanation", "mistake_type",
+    "next_drill", "user_id", "ease", "interval_days", "reps", "lapses", "due_at", "last_reviewed_at",
+    "content_hash",
+]
+_MISTAKE_TYPE = COLUMNS.index("mistake_type")
+# 复习状态列：文件里没有（或是空串）就用建表时的默认值
+NUMERIC_DEFAULTS = {"ease": 2.5, "interval_days": 0, "reps": 0, "lapses": 0}
+
+FORMATS = {".csv": "csv", ".jsonl": "jsonl", ".ndjson": "jsonl", ".parquet": "parquet"}
+MIME = {"csv": "text/csv", "jsonl": "application/x-ndjson", "parquet": "application/vnd.apache.parquet"}
+
+# 导入时插入的列（长文本由 wrongbook.insert_entries 换成 text_blobs 引用）
+IMPORT_COLUMNS = [*COLUMNS, "mistake_type_id"]
+
+
+def _conn():
+    return db.connect(wrongbook.DB_PATH)
+
+
+def _chunk_size() -> int:
+    return max(1, setting("WRONGBOOK_IO_CHUNK", 5000))
+
+
+def format_of(path) -> str:
+    fmt = FORMATS.get(Path(path).suffix.lower())
+    if fmt is None:
+        raise ValueError(f"不认识的文件格式：{path}（支持 {', '.join(FORMATS)}）")
+    return fmt
+
+
+def formats() -> list:
+    """当前环境能用的格式（没装 pyarrow 就没有 parquet）"""
+    return [fmt for fmt in _WRITERS if fmt != "parquet" or importlib.util.find_spec("pyarrow") is not None]
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise RuntimeError("导入/导出 Parquet 需要 pyarrow：pip install pyarrow") from None
+    return pyarrow
+
+
+def _stats(rows, started, **extra):
+    seconds = time.perf_counter() - started
+    return {"rows": rows, **extra, "seconds": round(seconds, 3),
+            "rows_per_s": round(rows / seconds) if seconds else rows}
+
+
+# -----------------------------
+# 导出
+# -----------------------------
+def _batches(user_id=None):
+    """按 id 顺序一块一块地读；user_id 为 None 时导出全班"""
+    where, params = ("WHERE user_id=?", (user_id,)) if user_id is not None else ("", ())
+    cur = _conn().execute(f"SELECT {', '.join(COLUMNS)} FROM wrongbook_full {where} ORDER BY id", params)
+    size = _chunk_size()
+    while rows := cur.fetchmany(size):
+        yield rows
+
+
+def _write_csv(f, batches):
+    # utf-8-sig：Excel 打开中文不乱码
+    text = io.TextIOWrapper(f, encoding="utf-8-sig", newline="")
+    w = csv.writer(text)
+    w.writerow(COLUMNS)
+    n = 0
+    for rows in batches:
+        w.writerows(rows)
+        n += len(rows)
+    text.flush()
+    text.detach()
+    return n
+
+
+def _write_jsonl(f, batches):
+    n = 0
+    for rows in batches:
+        f.write("".join(json.dumps(dict(zip(COLUMNS, r)), ensure_ascii=False) + "\n" for r in rows).encode("utf-8"))
+        n += len(rows)
+    return n
+
+
+def _write_parquet(f, batches):
+    pa = _pyarrow()
+    types = {"ease": pa.float64(), "interval_days": pa.int64(), "reps": pa.int64(), "lapses": pa.int64()}
+    schema = pa.schema([(col, types.get(col, pa.string())) for col in COLUMNS])
+    n = 0
+    # 每块写成一个 row group
+    with pa.parquet.ParquetWriter(f, schema) as w:
+        for rows in batches:
+            w.write_table(pa.Table.from_pylist([dict(zip(COLUMNS, r)) for r in rows], schema=schema))
+            n += len(rows)
+    return n
+
+
+_WRITERS = {"csv": _write_csv, "jsonl": _write_jsonl, "parquet": _write_parquet}
+
+
+def write(f, fmt, user_id=None) -> int:
+    """把错题本写进二进制文件对象 f，返回行数"""
+    return _WRITERS[fmt](f, _batches(user_id))
+
+
+def export_bytes(fmt, user_id=None) -> bytes:
+    """给下载按钮用（单个学生的数据量不大，直接放内存）"""
+    buf = io.BytesIO()
+    write(buf, fmt, user_id)
+    return buf.getvalue()
+
+
+def export_file(path, fmt=None, user_id=None) -> dict:
+    """导出到文件，返回 {"rows", "seconds", "rows_per_s"}"""
+    started = time.perf_counter()
+    with open(path, "wb") as f:
+        n = write(f, fmt or format_of(path), user_id)
+    return _stats(n, started)
+
+
+# -----------------------------
+# 导入
+# -----------------------------
+def _read_csv(path):
+    with open(path, encoding="utf-8-sig", newline="") as f:
+        yield from csv.DictReader(f)
+
+
+def _read_jsonl(path):
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def _read_parquet(path):
+    pa = _pyarrow()
+    for batch in pa.parquet.ParquetFile(path).iter_batches(batch_size=_chunk_size()):
+        yield from batch.to_pylist()
+
+
+_READERS = {"csv": _read_csv, "jsonl": _read_jsonl, "parquet": _read_parquet}
+
+
+def _row(record, user_id=None):
+    """文件里的一行 -> COLUMNS 顺序的值（mistake_type_id 另外补）；内容哈希总是重新算，不信文件里的"""
+    get = record.get
+    values = {col: get(col) for col in COLUMNS}
+    for col in ("unit", "topic", "question", "user_answer", "correct_answer", "explanation", "mistake_type",
+                "next_drill"):
+        values[col] = "" if values[col] is None else str(values[col])
+    if user_id is not None:
+        values["user_id"] = user_id
+    values["user_id"] = str(values["user_id"] or "")
+    values["created_at"] = str(values["created_at"] or datetime.utcnow().isoformat())
+    for col, default in NUMERIC_DEFAULTS.items():
+        value = values[col]
+        values[col] = type(default)(float(value)) if value not in (None, "") else default
+    values["due_at"] = values["due_at"] or values["created_at"]  # 没有复习时间的当成立刻可以复习
+    values["last_reviewed_at"] = values["last_reviewed_at"] or None
+    values["content_hash"] = wrongbook.content_hash(*(values[col] for col in wrongbook.HASH_COLUMNS))
+    return [values[col] for col in COLUMNS]
+
+
+def import_file(path, fmt=None, user_id=None) -> dict:
+    """
+    从文件导入错题（user_id 不为 None 时全部记到这个学生名下），
+    返回 {"rows", "inserted", "duplicates", "seconds", "rows_per_s"}；已经有的（内容哈希相同）跳过。
+    """
+    started = time.perf_counter()
+    records = _READERS[fmt or format_of(path)](path)
+    type_ids = {}  # 错因原文 -> 规范错因 id，同一个说法只归一一次
+    rows = inserted = 0
+    c = _conn()
+    while chunk := [_row(r, user_id) for r in islice(records, _chunk_size())]:
+        # 归一在事务外面做（mistake_type_id 自己会提交）
+        for text in {r[_MISTAKE_TYPE] for r in chunk} - type_ids.keys():
+            type_ids[text] = wrongbook.mistake_type_id(text)
+        with c:
+            inserted += wrongbook.insert_entries(c, IMPORT_COLUMNS, [(*r, type_ids[r[_MISTAKE_TYPE]]) for r in chunk],
+                                                 ignore=True)
+        rows += len(chunk)
+    wrongbook.mark_changed()
+    return _stats(rows, started, inserted=inserted, duplicates=rows - inserted)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="错题本导入/导出（CSV / JSONL / Parquet）")
+    ap.add_argument("command", choices=("export", "import"))
+    ap.add_argument("path")
+    ap.add_argument("--format", choices=sorted(_WRITERS), help="默认按扩展名判断")
+    ap.add_argument("--user", help="导出：只导出这个学生；导入：全部记到这个学生名下")
+    ap.add_argument("--db", default=str(wrongbook.DB_PATH))
+    args = ap.parse_args()
+
+    wrongbook.DB_PATH = Path(args.db)
+    wrongbook.init_db()
+    if args.command == "export":
+        stats = export_file(args.path, args.format, args.user)
+    else:
+        stats = import_file(args.path, args.format, args.user)
+    print(json.dumps(stats, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()